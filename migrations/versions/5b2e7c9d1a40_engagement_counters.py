@@ -0,0 +1,48 @@
+"""Engagement counters on posts and comments
+
+Revision ID: 5b2e7c9d1a40
+Revises: 28ba9a35c1a6
+Create Date: 2026-10-18 10:02:11.310542
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b2e7c9d1a40'
+down_revision = '28ba9a35c1a6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('like_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('favorite_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('comment_count', sa.Integer(), server_default='0', nullable=False))
+
+    with op.batch_alter_table('comments', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('like_count', sa.Integer(), server_default='0', nullable=False))
+
+    # Backfill de los contadores con los datos existentes
+    op.execute(
+        "UPDATE posts SET "
+        "like_count = (SELECT COUNT(likes.id) FROM likes WHERE likes.post_id = posts.id), "
+        "favorite_count = (SELECT COUNT(favorites.id) FROM favorites WHERE favorites.post_id = posts.id), "
+        "comment_count = (SELECT COUNT(comments.id) FROM comments WHERE comments.post_id = posts.id)"
+    )
+    op.execute(
+        "UPDATE comments SET "
+        "like_count = (SELECT COUNT(likes.id) FROM likes WHERE likes.comments_id = comments.id)"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('comments', schema=None) as batch_op:
+        batch_op.drop_column('like_count')
+
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_column('comment_count')
+        batch_op.drop_column('favorite_count')
+        batch_op.drop_column('like_count')
@@ -0,0 +1,26 @@
+"""Index on user.member_since for keyset pagination
+
+Revision ID: 8d41f0a6c3e2
+Revises: 5b2e7c9d1a40
+Create Date: 2026-10-18 10:47:35.208114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d41f0a6c3e2'
+down_revision = '5b2e7c9d1a40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_user_member_since'), ['member_since'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_user_member_since'))
@@ -0,0 +1,26 @@
+"""Composite index on posts (stack, level, id) for faceted filtering
+
+Revision ID: a9d4e6b2c8f1
+Revises: f2c8a1d5e7b3
+Create Date: 2026-10-18 18:02:41.517093
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9d4e6b2c8f1'
+down_revision = 'f2c8a1d5e7b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.create_index('ix_posts_stack_level_id', ['stack', 'level', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_index('ix_posts_stack_level_id')
@@ -0,0 +1,49 @@
+"""Search query log table for popular-query precomputation
+
+Revision ID: b3e7f9a1d4c6
+Revises: a9d4e6b2c8f1
+Create Date: 2026-10-18 19:10:27.904516
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e7f9a1d4c6'
+down_revision = 'a9d4e6b2c8f1'
+branch_labels = None
+depends_on = None
+
+
+# The stack/level enum types already exist on Postgres (created with posts)
+STACK = sa.Enum('HTML', 'CSS', 'JAVASCRIPT', 'PYTHON', 'SQL', name='stack').with_variant(
+    postgresql.ENUM('HTML', 'CSS', 'JAVASCRIPT', 'PYTHON', 'SQL', name='stack', create_type=False), 'postgresql')
+LEVEL = sa.Enum('STUDENT', 'JUNIOR_DEV', 'MID_DEV', 'SENIOR_DEV', name='level').with_variant(
+    postgresql.ENUM('STUDENT', 'JUNIOR_DEV', 'MID_DEV', 'SENIOR_DEV', name='level', create_type=False), 'postgresql')
+
+
+def upgrade():
+    op.create_table('search_queries',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('normalized', sa.String(length=255), nullable=False),
+    sa.Column('user_request', sa.String(length=500), nullable=False),
+    sa.Column('user_tags', sa.Text(), nullable=True),
+    sa.Column('stack', STACK, nullable=True),
+    sa.Column('level', LEVEL, nullable=True),
+    sa.Column('mode', sa.String(length=10), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('search_queries', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_search_queries_created_at'), ['created_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_search_queries_normalized'), ['normalized'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('search_queries', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_search_queries_normalized'))
+        batch_op.drop_index(batch_op.f('ix_search_queries_created_at'))
+
+    op.drop_table('search_queries')
@@ -0,0 +1,30 @@
+"""Post updated_at for incremental search index sync
+
+Revision ID: c7a3e5f1b902
+Revises: 8d41f0a6c3e2
+Create Date: 2026-10-18 12:15:03.880417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7a3e5f1b902'
+down_revision = '8d41f0a6c3e2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_posts_updated_at'), ['updated_at'], unique=False)
+
+    op.execute("UPDATE posts SET updated_at = COALESCE(date_added, CURRENT_TIMESTAMP)")
+
+
+def downgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_posts_updated_at'))
+        batch_op.drop_column('updated_at')
@@ -0,0 +1,38 @@
+"""Per-stage metrics on the search query log
+
+Revision ID: d6a2c4e8f0b5
+Revises: b3e7f9a1d4c6
+Create Date: 2026-10-18 20:34:12.681045
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd6a2c4e8f0b5'
+down_revision = 'b3e7f9a1d4c6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('search_queries', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('cache_hit', sa.Boolean(), nullable=True))
+        batch_op.add_column(sa.Column('candidates', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('results', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('prefilter_ms', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('llm_ms', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('total_ms', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('tokens', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('search_queries', schema=None) as batch_op:
+        batch_op.drop_column('tokens')
+        batch_op.drop_column('total_ms')
+        batch_op.drop_column('llm_ms')
+        batch_op.drop_column('prefilter_ms')
+        batch_op.drop_column('results')
+        batch_op.drop_column('candidates')
+        batch_op.drop_column('cache_hit')
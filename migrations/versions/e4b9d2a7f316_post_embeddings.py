@@ -0,0 +1,36 @@
+"""Post embeddings table for local vector search
+
+Revision ID: e4b9d2a7f316
+Revises: c7a3e5f1b902
+Create Date: 2026-10-18 15:02:41.563190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b9d2a7f316'
+down_revision = 'c7a3e5f1b902'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('post_embeddings',
+    sa.Column('post_id', sa.Integer(), nullable=False),
+    sa.Column('dim', sa.Integer(), nullable=False),
+    sa.Column('vector', sa.LargeBinary(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['post_id'], ['posts.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('post_id')
+    )
+    with op.batch_alter_table('post_embeddings', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_post_embeddings_updated_at'), ['updated_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('post_embeddings', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_post_embeddings_updated_at'))
+
+    op.drop_table('post_embeddings')
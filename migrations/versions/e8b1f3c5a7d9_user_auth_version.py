@@ -0,0 +1,26 @@
+"""User auth_version for JWT role claims revocation
+
+Revision ID: e8b1f3c5a7d9
+Revises: d6a2c4e8f0b5
+Create Date: 2026-10-18 21:47:55.218364
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8b1f3c5a7d9'
+down_revision = 'd6a2c4e8f0b5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('auth_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('auth_version')
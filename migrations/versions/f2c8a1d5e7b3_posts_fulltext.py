@@ -0,0 +1,55 @@
+"""Full-text search structures for posts (Postgres tsvector + GIN, SQLite FTS5)
+
+Revision ID: f2c8a1d5e7b3
+Revises: e4b9d2a7f316
+Create Date: 2026-10-18 16:20:57.104382
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2c8a1d5e7b3'
+down_revision = 'e4b9d2a7f316'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute(
+            "ALTER TABLE posts ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+            "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(description, '')), 'B')) STORED")
+        op.execute("CREATE INDEX ix_posts_search_vector ON posts USING GIN (search_vector)")
+    elif dialect == 'sqlite':
+        op.execute(
+            "CREATE VIRTUAL TABLE posts_fts USING fts5("
+            "title, description, content='posts', content_rowid='id')")
+        op.execute(
+            "CREATE TRIGGER posts_fts_ai AFTER INSERT ON posts BEGIN "
+            "INSERT INTO posts_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END")
+        op.execute(
+            "CREATE TRIGGER posts_fts_ad AFTER DELETE ON posts BEGIN "
+            "INSERT INTO posts_fts(posts_fts, rowid, title, description) "
+            "VALUES ('delete', old.id, old.title, old.description); END")
+        op.execute(
+            "CREATE TRIGGER posts_fts_au AFTER UPDATE OF title, description ON posts BEGIN "
+            "INSERT INTO posts_fts(posts_fts, rowid, title, description) "
+            "VALUES ('delete', old.id, old.title, old.description); "
+            "INSERT INTO posts_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END")
+        op.execute("INSERT INTO posts_fts(posts_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_posts_search_vector")
+        op.execute("ALTER TABLE posts DROP COLUMN IF EXISTS search_vector")
+    elif dialect == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS posts_fts_au")
+        op.execute("DROP TRIGGER IF EXISTS posts_fts_ad")
+        op.execute("DROP TRIGGER IF EXISTS posts_fts_ai")
+        op.execute("DROP TABLE IF EXISTS posts_fts")
@@ -0,0 +1,32 @@
+"""Denormalized comment like count on posts
+
+Revision ID: f7c3a9e1b5d2
+Revises: e8b1f3c5a7d9
+Create Date: 2026-10-18 23:05:41.602317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f7c3a9e1b5d2'
+down_revision = 'e8b1f3c5a7d9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('comment_like_count', sa.Integer(), server_default='0', nullable=False))
+
+    # Backfill con los contadores de likes de los comentarios
+    op.execute(
+        "UPDATE posts SET comment_like_count = "
+        "(SELECT COALESCE(SUM(comments.like_count), 0) FROM comments WHERE comments.post_id = posts.id)"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_column('comment_like_count')
@@ -0,0 +1,143 @@
+"""
+Autorización sin consultas a la base de datos: el token de acceso lleva el
+rol del usuario y su auth_version (claims "role" y "auth_version"). Cambiar
+is_admin, is_active o la contraseña sube auth_version y deja inválidos los
+tokens anteriores en todas las rutas con @jwt_required: la comprobación se
+registra como token_in_blocklist_loader (register_token_checks), una
+consulta a la caché por petición. Cada worker guarda la versión vigente de cada usuario en
+una caché con TTL, así que una degradación hecha en otro worker se aplica
+como mucho AUTH_VERSION_TTL segundos después
+"""
+import os
+import time
+import threading
+
+from flask import jsonify
+from flask_jwt_extended import create_access_token, get_jwt
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+
+from api.models import db, User
+
+# Atributos cuyo cambio revoca los tokens emitidos
+REVOKING_ATTRIBUTES = ("is_admin", "is_active", "password")
+
+
+class AuthVersions:
+    """
+    Caché user_id -> auth_version vigente (None si el usuario no existe)
+    con TTL. Un fallo de caché cuesta una consulta por clave primaria; los
+    cambios hechos en este worker se olvidan al momento
+    """
+
+    def __init__(self, ttl=30, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = {}  # user_id -> (versión, expires_at)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is not None and entry[1] > now:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        version = db.session.query(User.auth_version).filter(User.id == user_id).scalar()
+        with self.lock:
+            if len(self.entries) >= self.max_entries:
+                self.entries = {key: value for key, value in self.entries.items() if value[1] > now}
+                if len(self.entries) >= self.max_entries:
+                    self.entries.clear()
+            self.entries[user_id] = (version, now + self.ttl)
+        return version
+
+    def forget(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses, "ttl": self.ttl}
+
+
+auth_versions = AuthVersions(ttl=float(os.getenv("AUTH_VERSION_TTL", 30)))
+
+
+def forget_on_commit(user):
+    """
+    Olvida la versión cacheada ahora y otra vez tras el commit (por si otra
+    petición la volvió a leer antes de que el cambio fuera visible)
+    """
+    auth_versions.forget(user.id)
+    object_session(user).info.setdefault("auth_forget", set()).add(user.id)
+
+
+@event.listens_for(User, "before_update")
+def bump_auth_version(mapper, connection, user):
+    state = inspect(user)
+    if any(state.attrs[name].history.has_changes() for name in REVOKING_ATTRIBUTES):
+        user.auth_version = (user.auth_version or 0) + 1
+        forget_on_commit(user)
+
+
+@event.listens_for(User, "after_delete")
+def forget_deleted_user(mapper, connection, user):
+    forget_on_commit(user)
+
+
+@event.listens_for(Session, "after_commit")
+def forget_committed_users(session):
+    for user_id in session.info.pop("auth_forget", ()):
+        auth_versions.forget(user_id)
+
+
+def create_user_token(user):
+    """
+    Token de acceso con el rol y la auth_version del usuario
+    """
+    return create_access_token(identity=str(user.id), additional_claims={
+        "role": "admin" if user.is_admin else "user",
+        "auth_version": user.auth_version or 0
+    })
+
+
+def token_status(claims):
+    """
+    Estado de un token decodificado: "ok", "missing" si el usuario no existe
+    o "revoked" si su auth_version cambió desde que se emitió
+    """
+    version = auth_versions.get(int(claims["sub"]))
+    if version is None:
+        return "missing"
+    # tokens emitidos antes de existir los claims: se tratan como revocados
+    if claims.get("auth_version") != version:
+        return "revoked"
+    return "ok"
+
+
+def token_is_admin():
+    """
+    True si el token de la petición es de un administrador (su vigencia ya
+    la comprobó el blocklist loader al verificarlo)
+    """
+    return get_jwt().get("role") == "admin"
+
+
+def register_token_checks(jwt):
+    """
+    Registra en el JWTManager la comprobación de vigencia: un token de un
+    usuario borrado o con otra auth_version se rechaza con 401 en cualquier
+    ruta protegida, no solo en las de administrador
+    """
+    @jwt.token_in_blocklist_loader
+    def token_revoked(jwt_header, jwt_payload):
+        return token_status(jwt_payload) != "ok"
+
+    @jwt.revoked_token_loader
+    def revoked_token_response(jwt_header, jwt_payload):
+        return jsonify({"error": "Token revocado, inicia sesión de nuevo"}), 401
@@ -0,0 +1,378 @@
+"""
+Caché de resultados de smart search en dos niveles: una LRU en memoria acotada
+(entradas y bytes) con TTL por entrada en cada worker, y un almacén SQLite
+compartido por todos los workers de la máquina que sobrevive a reinicios
+"""
+import os
+import json
+import time
+import logging
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+
+from api.deepseek import deepseek_client
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """
+    Caché LRU con límite de entradas y de bytes (tamaño del JSON serializado)
+    y TTL por entrada. Segura entre hilos del mismo worker.
+    Lleva contadores de hits/misses/evictions/expirations para monitorización
+    """
+
+    def __init__(self, max_entries=512, max_bytes=16 * 1024 * 1024, ttl=900):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (value, size, expires_at)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, size, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._delete(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return False
+        expires_at = time.monotonic() + (ttl if ttl is not None else self.ttl)
+        with self.lock:
+            if key in self.entries:
+                self._delete(key)
+            self.entries[key] = (value, size, expires_at)
+            self.total_bytes += size
+            while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                oldest = next(iter(self.entries))
+                self._delete(oldest)
+                self.evictions += 1
+        return True
+
+    def _delete(self, key):
+        _, size, _ = self.entries.pop(key)
+        self.total_bytes -= size
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class SQLiteCacheStore:
+    """
+    Almacén clave -> JSON con expiración en un fichero SQLite (modo WAL) que
+    comparten todos los workers/procesos. Los fallos de disco se registran y
+    se tratan como miss: la búsqueda nunca falla por la caché
+    """
+
+    PURGE_EVERY = 100
+
+    def __init__(self, path, ttl=86400):
+        self.path = path
+        self.ttl = ttl
+        self.local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.writes = 0
+
+    def _connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS search_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS search_locks ("
+                "key TEXT PRIMARY KEY, expires_at REAL NOT NULL)")
+            self.local.connection = connection
+        return connection
+
+    def get(self, key):
+        try:
+            row = self._connection().execute(
+                "SELECT value FROM search_cache WHERE key = ? AND expires_at > ?",
+                (key, time.time())).fetchone()
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning(f"Shared search cache read failed: {e}")
+            return None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + (ttl if ttl is not None else self.ttl)
+        try:
+            connection = self._connection()
+            connection.execute(
+                "INSERT OR REPLACE INTO search_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, default=str), expires_at))
+            self.writes += 1
+            if self.writes % self.PURGE_EVERY == 0:
+                connection.execute(
+                    "DELETE FROM search_cache WHERE expires_at <= ?", (time.time(),))
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning(f"Shared search cache write failed: {e}")
+            return False
+        return True
+
+    def acquire(self, key, ttl):
+        """
+        Lock entre procesos con caducidad (por si el dueño muere).
+        Devuelve True si se obtuvo; ante errores de disco no bloquea a nadie
+        """
+        now = time.time()
+        try:
+            connection = self._connection()
+            connection.execute(
+                "DELETE FROM search_locks WHERE key = ? AND expires_at <= ?", (key, now))
+            cursor = connection.execute(
+                "INSERT OR IGNORE INTO search_locks (key, expires_at) VALUES (?, ?)",
+                (key, now + ttl))
+            return cursor.rowcount == 1
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning(f"Shared search lock failed: {e}")
+            return True
+
+    def release(self, key):
+        try:
+            self._connection().execute("DELETE FROM search_locks WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning(f"Shared search unlock failed: {e}")
+
+    def locked(self, key):
+        try:
+            row = self._connection().execute(
+                "SELECT 1 FROM search_locks WHERE key = ? AND expires_at > ?",
+                (key, time.time())).fetchone()
+        except sqlite3.Error:
+            return False
+        return row is not None
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "errors": self.errors
+        }
+
+
+class TieredCache:
+    """
+    LRU local delante de un almacén compartido opcional: los hits compartidos
+    se copian a la LRU local
+    """
+
+    def __init__(self, local, shared=None):
+        self.local = local
+        self.shared = shared
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.local.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value)
+
+    def stats(self):
+        stats = self.local.stats()
+        stats["shared"] = self.shared.stats() if self.shared is not None else None
+        return stats
+
+
+class SingleFlight:
+    """
+    Deduplica cálculos idénticos en curso: para cada clave solo el primer
+    llamante ejecuta fn y los concurrentes esperan su resultado.
+    Entre hilos usa un Event; entre workers un lock en el almacén compartido
+    mientras los demás esperan a que el resultado aparezca en la caché
+    """
+
+    POLL_INTERVAL = 0.2
+
+    def __init__(self, cache, lock_ttl=45, wait_timeout=40):
+        self.cache = cache
+        self.lock_ttl = lock_ttl
+        self.wait_timeout = wait_timeout
+        self.lock = threading.Lock()
+        self.calls = {}  # key -> {"done": Event, "result": ..., "failed": bool}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        result, lead = self.begin(key)
+        if result is not None:
+            return result
+        if not lead:
+            # El líder falló o tardó demasiado: se calcula por cuenta propia
+            return fn()
+
+        result = None
+        try:
+            result = fn()
+            return result
+        finally:
+            self.end(key, result)
+
+    def begin(self, key):
+        """
+        Primera mitad de do() para líderes que no pueden pasar fn (p. ej. una
+        respuesta en streaming). Devuelve (result, False) con el resultado de
+        otro cálculo de key en curso, (None, True) si el llamante pasa a ser
+        el líder y debe llamar a end(key, result) al terminar, o (None, False)
+        si el líder falló o tardó demasiado y hay que calcular sin coordinarse
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = {
+                    "done": threading.Event(), "result": None, "failed": True, "locked": False
+                }
+                self.leaders += 1
+
+        if not leader:
+            if call["done"].wait(self.wait_timeout) and not call["failed"]:
+                with self.lock:
+                    self.coalesced += 1
+                return call["result"], False
+            return None, False
+
+        shared = self.cache.shared
+        lock_key = f"flight:{key}"
+        if shared is None or shared.acquire(lock_key, self.lock_ttl):
+            call["locked"] = shared is not None
+            return None, True
+
+        # Otro worker ya está calculando: esperar a que publique en la caché
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.POLL_INTERVAL)
+            result = self.cache.get(key)
+            if result is not None:
+                with self.lock:
+                    self.coalesced += 1
+                self.end(key, result)
+                return result, False
+            if not shared.locked(lock_key):
+                # terminó sin cachear (p. ej. error de DeepSeek)
+                break
+        return None, True
+
+    def end(self, key, result=None):
+        """
+        Cierra el cálculo de key iniciado con begin(): libera el lock entre
+        workers y entrega result a los hilos que esperan (None = falló y cada
+        uno calcula por su cuenta)
+        """
+        with self.lock:
+            call = self.calls.get(key)
+        if call is None:
+            return
+        if call["locked"]:
+            self.cache.shared.release(f"flight:{key}")
+        call["result"] = result
+        call["failed"] = result is None
+        call["done"].set()
+        with self.lock:
+            self.calls.pop(key, None)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "in_flight": len(self.calls),
+                "leaders": self.leaders,
+                "coalesced": self.coalesced
+            }
+
+
+def _shared_store():
+    """
+    SEARCH_CACHE_DB: ruta del fichero SQLite compartido ("" lo desactiva)
+    """
+    path = os.getenv("SEARCH_CACHE_DB", os.path.join(
+        tempfile.gettempdir(), "gitwise_search_cache.sqlite3"))
+    if not path:
+        return None
+    return SQLiteCacheStore(path, ttl=int(os.getenv("SEARCH_CACHE_SHARED_TTL", 86400)))
+
+
+search_cache = TieredCache(
+    LRUCache(
+        max_entries=int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", 512)),
+        max_bytes=int(os.getenv("SEARCH_CACHE_MAX_BYTES", 16 * 1024 * 1024)),
+        ttl=int(os.getenv("SEARCH_CACHE_TTL", 900))
+    ),
+    _shared_store()
+)
+
+def _flight_timeouts():
+    """
+    SEARCH_FLIGHT_WAIT_TIMEOUT y SEARCH_FLIGHT_LOCK_TTL (segundos). Por
+    defecto se derivan del peor caso del cliente de DeepSeek (su plazo total
+    para todos los intentos) con margen para el prefiltro, así que ni el lock
+    caduca ni los que esperan se rinden mientras el líder sigue reintentando
+    """
+    worst_case = deepseek_client.worst_case_latency()
+    wait_timeout = float(os.getenv("SEARCH_FLIGHT_WAIT_TIMEOUT", worst_case + 10))
+    lock_ttl = float(os.getenv("SEARCH_FLIGHT_LOCK_TTL", wait_timeout + 5))
+    return lock_ttl, wait_timeout
+
+
+search_flights = SingleFlight(search_cache, *_flight_timeouts())
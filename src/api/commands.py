@@ -1,6 +1,9 @@
 
 import click
-from api.models import db, User
+from api.models import db, User, rebuild_counters
+from api.vectors import compute_embeddings
+from api.cache import search_cache
+from api.precompute import precompute_searches
 
 """
 In this file, you can add as many commands as you want using the @app.cli.command decorator
@@ -31,4 +34,49 @@ def setup_commands(app):
 
     @app.cli.command("insert-test-data")
     def insert_test_data():
-        pass
\ No newline at end of file
+        pass
+
+    """
+    Recalcula desde cero los contadores desnormalizados (likes, favoritos y
+    comentarios de posts, likes de comentarios) para corregir desviaciones.
+    $ flask rebuild-counters
+    """
+    @app.cli.command("rebuild-counters")
+    def rebuild_counters_command():
+        print("Rebuilding engagement counters")
+        posts_updated, comments_updated = rebuild_counters()
+        db.session.commit()
+        print("Posts updated: ", posts_updated, " Comments updated: ", comments_updated)
+
+    """
+    Calcula los vectores de búsqueda semántica local de todos los posts
+    (api.vectors) y borra los de posts eliminados. Las escrituras de posts
+    los mantienen al día; conviene lanzarlo tras cambiar SEARCH_VECTOR_DIM.
+    $ flask compute-embeddings --batch-size 500
+    """
+    @app.cli.command("compute-embeddings")
+    @click.option("--batch-size", default=500, show_default=True)
+    def compute_embeddings_command(batch_size):
+        print("Computing post embeddings")
+        computed, deleted = compute_embeddings(batch_size)
+        print("Embeddings computed: ", computed, " Orphans deleted: ", deleted)
+
+    """
+    Precalcula las búsquedas más frecuentes del registro de smart search y
+    llena la caché compartida (SEARCH_CACHE_DB) antes de que lleguen los
+    usuarios. Pensado para cron, p. ej. cada hora y tras cada despliegue:
+    $ flask precompute-search --top 50 --days 7 --concurrency 4
+    """
+    @app.cli.command("precompute-search")
+    @click.option("--top", default=50, show_default=True, help="Número de consultas populares")
+    @click.option("--days", default=7, show_default=True, help="Ventana del registro en días")
+    @click.option("--concurrency", default=4, show_default=True, help="Llamadas a DeepSeek en paralelo")
+    @click.option("--force", is_flag=True, help="Recalcular también las que ya están en caché")
+    def precompute_search_command(top, days, concurrency, force):
+        if search_cache.shared is None:
+            print("SEARCH_CACHE_DB is disabled: there is no shared cache to warm")
+            return
+        print("Precomputing popular searches")
+        summary = precompute_searches(app, top, days, concurrency, force)
+        print("Warmed: ", summary["warmed"], " Already cached: ", summary["cached"],
+              " Failed: ", summary["failed"])
@@ -0,0 +1,388 @@
+"""
+Cliente HTTP de DeepSeek: una sesión con pool de conexiones keep-alive por
+worker, timeouts de conexión y lectura separados, reintentos con backoff
+exponencial y jitter ante 429/5xx o errores de conexión (nunca tras un
+timeout de lectura: la petición ya llegó y repetirla podría cobrar dos veces
+la misma respuesta), un plazo total para todos los intentos y un circuit
+breaker que corta las llamadas mientras la API falla o va lenta.
+También lleva la contabilidad de tokens (usage real de cada respuesta) y un
+tokenizador aproximado local calibrado con esos datos
+"""
+import os
+import re
+import json
+import math
+import time
+import random
+import logging
+import threading
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# Tope de la espera que se acepta de una cabecera Retry-After
+MAX_RETRY_AFTER = 10.0
+
+# Precios de DeepSeek por token (verificar precios actuales)
+INPUT_COST_PER_TOKEN = float(os.getenv("DEEPSEEK_INPUT_COST_PER_TOKEN", 0.0000005))
+OUTPUT_COST_PER_TOKEN = float(os.getenv("DEEPSEEK_OUTPUT_COST_PER_TOKEN", 0.0000015))
+
+
+class TokenEstimator:
+    """
+    Aproximación local del tokenizador BPE: palabras y números se parten en
+    trozos de ~4 y ~3 caracteres y cada signo cuenta como un token.
+    El factor de calibración es una media móvil exponencial de
+    prompt_tokens reales / estimados, alimentada con el usage de las respuestas
+    """
+    PIECE_PATTERN = re.compile(r"[^\W\d_]+|\d+|\S")
+    MESSAGE_OVERHEAD = 4  # tokens de formato por mensaje del chat
+
+    def __init__(self, chars_per_token=4, alpha=0.1, factor=1.0):
+        self.chars_per_token = chars_per_token
+        self.alpha = alpha
+        self.factor = factor
+        self.samples = 0
+        self.lock = threading.Lock()
+
+    def raw(self, text):
+        tokens = 0
+        for piece in self.PIECE_PATTERN.findall(text or ""):
+            if piece.isdigit():
+                tokens += math.ceil(len(piece) / 3)
+            elif len(piece) > 1:
+                tokens += math.ceil(len(piece) / self.chars_per_token)
+            else:
+                tokens += 1
+        return tokens
+
+    def count(self, text):
+        return math.ceil(self.raw(text) * self.factor)
+
+    def count_messages(self, messages):
+        return math.ceil(sum(self.raw(m.get("content")) + self.MESSAGE_OVERHEAD
+                             for m in messages) * self.factor)
+
+    def truncate(self, text, max_tokens):
+        """
+        Recorta text por palabras para que no pase de max_tokens (incluida la
+        elipsis final)
+        """
+        if self.count(text) <= max_tokens:
+            return text
+        budget = (max_tokens - 1) / self.factor
+        words = []
+        used = 0
+        for word in text.split():
+            used += self.raw(word)
+            if used > budget:
+                break
+            words.append(word)
+        return " ".join(words) + "…" if words else ""
+
+    def calibrate(self, messages, prompt_tokens):
+        raw = sum(self.raw(m.get("content")) + self.MESSAGE_OVERHEAD for m in messages)
+        if not raw or not prompt_tokens:
+            return
+        ratio = min(max(prompt_tokens / raw, 0.5), 2.0)
+        with self.lock:
+            self.factor += self.alpha * (ratio - self.factor)
+            self.samples += 1
+
+
+class UsageMeter:
+    """
+    Acumula el usage real de DeepSeek (tokens, coste) y la latencia de cada
+    llamada. Las latencias recientes se guardan en una ventana para percentiles
+    """
+
+    def __init__(self, input_cost=INPUT_COST_PER_TOKEN, output_cost=OUTPUT_COST_PER_TOKEN, window=500):
+        self.input_cost = input_cost
+        self.output_cost = output_cost
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=window)
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.total_cost = 0.0
+
+    def cost(self, prompt_tokens, completion_tokens):
+        return prompt_tokens * self.input_cost + completion_tokens * self.output_cost
+
+    def record(self, usage, latency):
+        prompt_tokens = (usage or {}).get("prompt_tokens") or 0
+        completion_tokens = (usage or {}).get("completion_tokens") or 0
+        with self.lock:
+            self.requests += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.total_cost += self.cost(prompt_tokens, completion_tokens)
+            self.latencies.append(latency)
+
+    def stats(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            requests = self.requests or 1
+            return {
+                "requests": self.requests,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "avg_prompt_tokens": round(self.prompt_tokens / requests, 1),
+                "avg_completion_tokens": round(self.completion_tokens / requests, 1),
+                "total_cost": f"${self.total_cost:.6f}",
+                "latency_ms_avg": round(1000 * sum(latencies) / len(latencies), 1) if latencies else None,
+                "latency_ms_p95": round(1000 * latencies[int(0.95 * (len(latencies) - 1))], 1)
+                if latencies else None
+            }
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker por tasa de fallos sobre las últimas `window` llamadas.
+    Una llamada más lenta que slow_call cuenta como fallo. Abierto, rechaza
+    todo durante `cooldown` segundos; después pasa a half-open y deja pasar
+    una sola llamada de prueba que lo cierra o lo vuelve a abrir
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, window=20, min_calls=5, failure_rate=0.5, slow_call=10.0, cooldown=30.0):
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call = slow_call
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.outcomes = deque(maxlen=window)  # True = fallo (error o lenta)
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.probing = False
+        self.rejected = 0
+
+    def allow(self):
+        with self.lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = self.HALF_OPEN
+                self.probing = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self.probing:
+                self.probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, success, latency):
+        failed = not success or latency >= self.slow_call
+        with self.lock:
+            if self.state == self.HALF_OPEN:
+                self.probing = False
+                if failed:
+                    self._open()
+                else:
+                    self.state = self.CLOSED
+                    self.outcomes.clear()
+                return
+
+            self.outcomes.append(failed)
+            if len(self.outcomes) >= self.min_calls and \
+                    sum(self.outcomes) / len(self.outcomes) >= self.failure_rate:
+                self._open()
+
+    def _open(self):
+        if self.state != self.OPEN:
+            logger.warning("DeepSeek circuit breaker opened")
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.outcomes.clear()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "state": self.state,
+                "recent_calls": len(self.outcomes),
+                "recent_failures": sum(self.outcomes),
+                "rejected": self.rejected
+            }
+
+
+class DeepSeekClient:
+    """
+    Cliente reutilizable para la API de chat completions.
+    base_url es configurable para poder apuntar a un servidor local en benchmarks
+    """
+
+    def __init__(self, api_key=None, base_url="https://api.deepseek.com", pool_size=10,
+                 connect_timeout=3.05, read_timeout=20, max_retries=2, backoff=0.5,
+                 deadline=30, breaker=None):
+        self.api_key = api_key
+        self.breaker = breaker or CircuitBreaker()
+        self.tokenizer = TokenEstimator()
+        self.usage = UsageMeter()
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.deadline = deadline  # segundos para todos los intentos juntos
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        })
+
+    @property
+    def chat_url(self):
+        return f"{self.base_url}/v1/chat/completions"
+
+    def worst_case_latency(self):
+        """
+        Cota del tiempo que puede tardar una llamada en fallar: el plazo total
+        más el timeout de conexión del último intento (sus timeouts se
+        recortan a lo que queda del plazo, pero conexión y lectura cuentan
+        por separado)
+        """
+        return self.deadline + self.timeout[0]
+
+    def chat(self, payload):
+        """
+        POST a chat/completions con reintentos. Devuelve el JSON de respuesta;
+        lanza requests.RequestException si se agotan los intentos y
+        CircuitOpenError (sin llamar) si el circuito está abierto
+        """
+        self._check_circuit()
+        started = time.monotonic()
+        try:
+            data = self._post(payload).json()
+        except Exception:
+            self.breaker.record(False, time.monotonic() - started)
+            raise
+        latency = time.monotonic() - started
+        self.breaker.record(True, latency)
+        self._account(payload, data.get("usage"), latency)
+        return data
+
+    def stream_chat(self, payload, usage_out=None):
+        """
+        POST en modo streaming (SSE). Genera los fragmentos de texto
+        (choices[0].delta.content) a medida que llegan. Los reintentos solo
+        aplican antes de recibir el primer byte. Para el circuit breaker la
+        latencia es el tiempo hasta el primer fragmento; el usage llega en el
+        último evento (stream_options.include_usage) y se copia en el dict
+        usage_out si se pasa.
+        El resultado se registra en el breaker aunque el consumidor cierre el
+        generador a mitad (cliente SSE desconectado): si ya llegó algún
+        fragmento cuenta como éxito
+        """
+        self._check_circuit()
+        started = time.monotonic()
+        first_chunk_latency = None
+        usage = None
+        success = False
+        try:
+            response = self._post(dict(payload, stream=True, stream_options={"include_usage": True}),
+                                  stream=True)
+            with response:
+                response.encoding = response.encoding or "utf-8"
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    event = json.loads(data)
+                    if event.get("usage"):
+                        usage = event["usage"]
+                        if usage_out is not None:
+                            usage_out.update(usage)
+                    choices = event.get("choices") or [{}]
+                    content = (choices[0].get("delta") or {}).get("content")
+                    if content:
+                        if first_chunk_latency is None:
+                            first_chunk_latency = time.monotonic() - started
+                        yield content
+            success = True
+        except GeneratorExit:
+            success = first_chunk_latency is not None
+            raise
+        finally:
+            self.breaker.record(success, first_chunk_latency or time.monotonic() - started)
+        self._account(payload, usage, time.monotonic() - started)
+
+    def _account(self, payload, usage, latency):
+        self.usage.record(usage, latency)
+        if usage:
+            self.tokenizer.calibrate(payload.get("messages", []), usage.get("prompt_tokens"))
+
+    def _check_circuit(self):
+        if not self.breaker.allow():
+            raise CircuitOpenError("DeepSeek circuit breaker is open")
+
+    def _post(self, payload, **kwargs):
+        """
+        POST con reintentos dentro de self.deadline. Solo se reintentan los
+        429/5xx y los errores de conexión (ConnectTimeout incluido); un
+        ReadTimeout se propaga sin repetir la petición
+        """
+        expires_at = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            remaining = expires_at - time.monotonic()
+            timeout = tuple(min(limit, remaining) for limit in self.timeout)
+            last_attempt = attempt >= self.max_retries
+            try:
+                response = self.session.post(self.chat_url, json=payload, timeout=timeout, **kwargs)
+                delay = self._retry_after(response) if response.status_code in RETRY_STATUS else None
+                delay = delay if delay is not None else self._backoff(attempt + 1)
+                if response.status_code not in RETRY_STATUS or last_attempt or \
+                        time.monotonic() + delay >= expires_at:
+                    response.raise_for_status()
+                    return response
+                response.close()
+            except requests.ConnectionError as e:
+                delay = self._backoff(attempt + 1)
+                if last_attempt or time.monotonic() + delay >= expires_at:
+                    raise
+                logger.warning(f"DeepSeek request failed ({e}), retrying")
+
+            attempt += 1
+            time.sleep(delay)
+
+    def _backoff(self, attempt):
+        # backoff exponencial con jitter completo
+        return random.uniform(0, self.backoff * (2 ** (attempt - 1)))
+
+    @staticmethod
+    def _retry_after(response):
+        try:
+            return min(float(response.headers.get("Retry-After")), MAX_RETRY_AFTER)
+        except (TypeError, ValueError):
+            return None
+
+
+deepseek_client = DeepSeekClient(
+    api_key=os.getenv("DEEPSEEK_API_KEY"),
+    base_url=os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com"),
+    pool_size=int(os.getenv("DEEPSEEK_POOL_SIZE", 10)),
+    connect_timeout=float(os.getenv("DEEPSEEK_CONNECT_TIMEOUT", 3.05)),
+    read_timeout=float(os.getenv("DEEPSEEK_READ_TIMEOUT", 20)),
+    max_retries=int(os.getenv("DEEPSEEK_MAX_RETRIES", 2)),
+    backoff=float(os.getenv("DEEPSEEK_BACKOFF", 0.5)),
+    deadline=float(os.getenv("DEEPSEEK_DEADLINE", 30)),
+    breaker=CircuitBreaker(
+        failure_rate=float(os.getenv("DEEPSEEK_BREAKER_FAILURE_RATE", 0.5)),
+        slow_call=float(os.getenv("DEEPSEEK_BREAKER_SLOW_CALL", 10)),
+        cooldown=float(os.getenv("DEEPSEEK_BREAKER_COOLDOWN", 30))
+    )
+)
@@ -0,0 +1,191 @@
+"""
+Backends de texto completo en la base de datos para el prefiltro de smart
+search (SEARCH_BACKEND=database). La selección y el top-k se hacen en SQL y
+solo vuelven `limit` filas, así que la memoria y la CPU del worker no crecen
+con el número de posts:
+  - Postgres: columna generada posts.search_vector (tsvector) con índice GIN
+    y ts_rank
+  - SQLite: tabla FTS5 posts_fts (contenido externo) sincronizada con
+    triggers y bm25()
+El esquema lo crea la migración f2c8a1d5e7b3_posts_fulltext.
+Frente al índice en memoria no hay corrección de erratas ni did_you_mean
+(no hay vocabulario con trigramas) y los rankers configurables
+(SEARCH_RANKER, modo local) no se usan: dev_debug.prefilter_backend y
+dev_debug.typo_correction lo indican en cada búsqueda
+"""
+import threading
+from abc import ABC, abstractmethod
+
+from sqlalchemy import text
+
+from api.models import db, Stack, Level
+from api.search import FACETS, uses_memory_index, facet_grid, facet_counts
+
+# Peso del título frente a la descripción (como field_weights de BM25Ranker)
+TITLE_WEIGHT = 2.0
+DESCRIPTION_WEIGHT = 1.0
+
+
+def post_row(row, score=None):
+    post = {"id": row.id, "title": row.title or "[Untitled]", "description": row.description or ""}
+    if score is not None:
+        post["keyword_score"] = round(score, 4)
+    return post
+
+
+def filter_clause(filters, alias="posts"):
+    """
+    Condiciones SQL (" AND ...") y parámetros para los filtros de facetas.
+    Las columnas enum guardan el nombre del miembro (PYTHON, JUNIOR_DEV...)
+    """
+    clause = ""
+    params = {}
+    for facet in FACETS:
+        value = (filters or {}).get(facet)
+        if value is not None:
+            clause += f" AND {alias}.{facet} = :{facet}"
+            params[facet] = value.name
+    return clause, params
+
+
+def grid_key(row):
+    return (Stack[row.stack] if row.stack else None, Level[row.level] if row.level else None)
+
+
+class FullTextBackend(ABC):
+
+    @abstractmethod
+    def search(self, keywords, limit, filters=None):
+        """
+        Top `limit` posts para las palabras clave (cada una también como
+        prefijo, igual que SearchIndex.expand) que cumplen los filtros, con su
+        puntuación
+        """
+
+    @abstractmethod
+    def matching_grid(self, keywords):
+        """
+        Rejilla {(stack, level): n} de los posts que casan con las palabras
+        clave, en un solo GROUP BY
+        """
+
+    def facets(self, keywords, filters=None):
+        grid = self.matching_grid(keywords) if keywords else facet_grid()
+        return facet_counts(grid, filters)
+
+    def first(self, limit, filters=None):
+        """
+        Los primeros posts por id (cuando la consulta no tiene palabras clave)
+        """
+        clause, params = filter_clause(filters)
+        rows = db.session.execute(text(
+            f"SELECT id, title, description FROM posts WHERE 1 = 1{clause} ORDER BY id LIMIT :limit"),
+            dict(params, limit=limit))
+        return [post_row(row) for row in rows]
+
+
+class PostgresFullText(FullTextBackend):
+    name = "postgresql"
+
+    @staticmethod
+    def tsquery(keywords):
+        return " | ".join(f"{keyword}:*" for keyword in sorted(keywords))
+
+    def search(self, keywords, limit, filters=None):
+        clause, params = filter_clause(filters)
+        rows = db.session.execute(text(
+            "SELECT id, title, description, ts_rank(search_vector, query) AS score "
+            "FROM posts, to_tsquery('simple', :query) AS query "
+            f"WHERE search_vector @@ query{clause} "
+            "ORDER BY score DESC, id LIMIT :limit"
+        ), dict(params, query=self.tsquery(keywords), limit=limit))
+        return [post_row(row, row.score) for row in rows]
+
+    def matching_grid(self, keywords):
+        rows = db.session.execute(text(
+            "SELECT stack, level, count(*) AS posts "
+            "FROM posts, to_tsquery('simple', :query) AS query "
+            "WHERE search_vector @@ query GROUP BY stack, level"
+        ), {"query": self.tsquery(keywords)})
+        return {grid_key(row): row.posts for row in rows}
+
+
+class SQLiteFullText(FullTextBackend):
+    name = "sqlite"
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.schema_ready = False
+
+    def ensure_schema(self):
+        """
+        Bases SQLite creadas con create_all (sin migraciones): crea la tabla
+        FTS5 y sus triggers la primera vez y la llena desde posts
+        """
+        with self.lock:
+            if self.schema_ready:
+                return
+            exists = db.session.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'posts_fts'")).first()
+            if not exists:
+                for statement in SQLITE_FTS_SCHEMA:
+                    db.session.execute(text(statement))
+                db.session.execute(text("INSERT INTO posts_fts(posts_fts) VALUES ('rebuild')"))
+                db.session.commit()
+            self.schema_ready = True
+
+    @staticmethod
+    def match_query(keywords):
+        return " OR ".join(f"{keyword}*" for keyword in sorted(keywords))
+
+    def search(self, keywords, limit, filters=None):
+        self.ensure_schema()
+        clause, params = filter_clause(filters, "p")
+        # bm25() es negativo: cuanto menor, más relevante
+        rows = db.session.execute(text(
+            "SELECT p.id, p.title, p.description, "
+            f"bm25(posts_fts, {TITLE_WEIGHT}, {DESCRIPTION_WEIGHT}) AS score "
+            "FROM posts_fts JOIN posts p ON p.id = posts_fts.rowid "
+            f"WHERE posts_fts MATCH :query{clause} "
+            "ORDER BY score, p.id LIMIT :limit"
+        ), dict(params, query=self.match_query(keywords), limit=limit))
+        return [post_row(row, -row.score) for row in rows]
+
+    def matching_grid(self, keywords):
+        self.ensure_schema()
+        rows = db.session.execute(text(
+            "SELECT p.stack, p.level, count(*) AS posts "
+            "FROM posts_fts JOIN posts p ON p.id = posts_fts.rowid "
+            "WHERE posts_fts MATCH :query GROUP BY p.stack, p.level"
+        ), {"query": self.match_query(keywords)})
+        return {grid_key(row): row.posts for row in rows}
+
+
+SQLITE_FTS_SCHEMA = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5("
+    "title, description, content='posts', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS posts_fts_ai AFTER INSERT ON posts BEGIN "
+    "INSERT INTO posts_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS posts_fts_ad AFTER DELETE ON posts BEGIN "
+    "INSERT INTO posts_fts(posts_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS posts_fts_au AFTER UPDATE OF title, description ON posts BEGIN "
+    "INSERT INTO posts_fts(posts_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); "
+    "INSERT INTO posts_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END"
+]
+
+BACKENDS = {
+    PostgresFullText.name: PostgresFullText(),
+    SQLiteFullText.name: SQLiteFullText()
+}
+
+
+def get_fulltext_backend():
+    """
+    Backend de la base de datos en uso si SEARCH_BACKEND=database, o None
+    para el índice invertido en memoria (api.search)
+    """
+    if uses_memory_index():
+        return None
+    return BACKENDS[db.engine.dialect.name]
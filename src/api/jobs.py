@@ -0,0 +1,134 @@
+"""
+Trabajos asíncronos de smart search: la llamada a DeepSeek se ejecuta en un
+pool de hilos y el worker HTTP queda libre para otras peticiones
+"""
+import os
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, has_app_context
+
+from api.cache import search_cache
+
+logger = logging.getLogger(__name__)
+
+
+class SearchJobs:
+    """
+    Registro de trabajos (job_id -> estado/resultado). El estado también se
+    copia al almacén compartido (si existe) para que cualquier worker pueda
+    responder a la consulta del trabajo
+    """
+
+    POLL_INTERVAL = 0.25
+
+    def __init__(self, max_workers=4, shared=None, ttl=600):
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="smart-search")
+        self.shared = shared
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.jobs = {}  # job_id -> {"record": dict, "done": threading.Event}
+
+    def submit(self, fn, *args, owner=None):
+        """
+        Encola fn(*args) y devuelve el job_id sin esperar al resultado.
+        Si se llama desde una petición, fn se ejecuta dentro de un contexto
+        de la misma aplicación (db.session, db.engine...)
+        """
+        job_id = self._create(owner)
+        app = current_app._get_current_object() if has_app_context() else None
+        self.executor.submit(self._run, job_id, app, fn, *args)
+        return job_id
+
+    def completed(self, result, owner=None):
+        """
+        Registra un trabajo ya terminado (p. ej. resultado servido desde caché)
+        """
+        job_id = self._create(owner)
+        self._finish(job_id, "done", result=result)
+        return job_id
+
+    def get(self, job_id, wait=0):
+        """
+        Estado del trabajo. Con wait > 0 espera (long-poll) hasta que termine
+        o venza el plazo. Devuelve None si el trabajo no existe
+        """
+        deadline = time.monotonic() + wait
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is not None:
+            job["done"].wait(timeout=max(wait, 0))
+            return dict(job["record"])
+
+        # Trabajo lanzado por otro worker: se consulta el almacén compartido
+        if self.shared is None:
+            return None
+        record = self.shared.get(self._shared_key(job_id))
+        while record is not None and record["status"] == "pending" and time.monotonic() < deadline:
+            time.sleep(self.POLL_INTERVAL)
+            record = self.shared.get(self._shared_key(job_id))
+        return record
+
+    def _create(self, owner):
+        self._purge()
+        job_id = uuid.uuid4().hex
+        record = {
+            "job_id": job_id,
+            "status": "pending",
+            "owner": owner,
+            "created_at": time.time(),
+            "result": None,
+            "error": None
+        }
+        with self.lock:
+            self.jobs[job_id] = {"record": record, "done": threading.Event()}
+        self._publish(record)
+        return job_id
+
+    def _run(self, job_id, app, fn, *args):
+        try:
+            if app is None:
+                result = fn(*args)
+            else:
+                with app.app_context():
+                    result = fn(*args)
+            self._finish(job_id, "done", result=result)
+        except Exception as e:
+            logger.error(f"Smart search job {job_id} failed: {e}")
+            self._finish(job_id, "error", error=str(e))
+
+    def _finish(self, job_id, status, result=None, error=None):
+        with self.lock:
+            job = self.jobs[job_id]
+            job["record"].update(
+                status=status, result=result, error=error, finished_at=time.time())
+            record = dict(job["record"])
+        self._publish(record)
+        job["done"].set()
+
+    def _publish(self, record):
+        if self.shared is not None:
+            self.shared.set(self._shared_key(record["job_id"]), record, ttl=self.ttl)
+
+    def _purge(self):
+        limit = time.time() - self.ttl
+        with self.lock:
+            expired = [job_id for job_id, job in self.jobs.items()
+                       if job["done"].is_set() and job["record"]["created_at"] < limit]
+            for job_id in expired:
+                del self.jobs[job_id]
+
+    @staticmethod
+    def _shared_key(job_id):
+        return f"job:{job_id}"
+
+
+search_jobs = SearchJobs(
+    max_workers=int(os.getenv("SEARCH_JOB_WORKERS", 4)),
+    shared=search_cache.shared,
+    ttl=int(os.getenv("SEARCH_JOB_TTL", 600))
+)
@@ -1,7 +1,7 @@
 from flask_sqlalchemy import SQLAlchemy
 # Corrected imports for SQLAlchemy types and Python types
-from sqlalchemy import String, Boolean, Date, Integer, ForeignKey, Enum, func, DateTime
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy import String, Boolean, Date, Integer, ForeignKey, Enum, func, DateTime, select, update, inspect, LargeBinary, Index, Text, Float
+from sqlalchemy.orm import Mapped, mapped_column, relationship, contains_eager
 from typing import List
 import enum
 # Corrected date and datetime imports
@@ -41,7 +41,10 @@ class User(db.Model):
         Boolean(), nullable=False, default=True)  # no incluir en formulario
     is_admin: Mapped[bool] = mapped_column(
         Boolean(), nullable=False, default=False)  # no incluir en formulario
-    member_since: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.now(timezone.utc))
+    # sube al cambiar is_admin, is_active o la contraseña y revoca los
+    # tokens emitidos antes (ver api.auth)
+    auth_version: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    member_since: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.now(timezone.utc), index=True)
     stack: Mapped[enum.Enum] = mapped_column(Enum(Stack), nullable=True)
     level: Mapped[enum.Enum] = mapped_column(Enum(Level), nullable=True)
 
@@ -70,6 +73,9 @@ class User(db.Model):
 
 class Post(db.Model):
     __tablename__ = "posts"
+    # filtros de facetas del feed y de smart search (stack=, level=) con el
+    # orden por id, y GROUP BY stack, level de los conteos
+    __table_args__ = (Index("ix_posts_stack_level_id", "stack", "level", "id"),)
     id: Mapped[int] = mapped_column(primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("user.id"))
     title: Mapped[str] = mapped_column(String(40), nullable=True)
@@ -77,8 +83,19 @@ class Post(db.Model):
     description: Mapped[str] = mapped_column(String(200), nullable=False)
     repo_URL: Mapped[str] = mapped_column(String(2083), nullable=False)
     date_added: Mapped[datetime] = mapped_column(DateTime, default=datetime.now(timezone.utc), nullable=True)
+    # se actualiza al crear o editar el contenido (no con likes/favoritos);
+    # lo usa el índice de búsqueda para sincronizarse entre workers
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime, default=lambda: datetime.now(timezone.utc), nullable=True, index=True)
     stack: Mapped[Stack] = mapped_column(Enum(Stack), nullable=True)
     level: Mapped[Level] = mapped_column(Enum(Level), nullable=True)
+    # contadores desnormalizados, se actualizan en la misma transacción que
+    # likes/favoritos/comentarios (ver adjust_counter y rebuild_counters)
+    like_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    favorite_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    comment_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    # suma de los likes de sus comentarios (Comments.like_count)
+    comment_like_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
     # relación one to many
     star: Mapped[List["Favorites"]] = relationship(back_populates="say")
     reply: Mapped[List["Comments"]] = relationship(back_populates="say")
@@ -87,17 +104,20 @@ class Post(db.Model):
     # relación many to one
     author: Mapped["User"] = relationship(back_populates="say")
 
-    def serialize(self):
-        #NUEVOS CAMBIOS CONTEO DE FAVORITOS, LIKES Y COMENTARIOS
-        # Calcula el conteo de favoritos
-        favorite_count = db.session.query(func.count(Favorites.id)).filter_by(post_id=self.id).scalar()
-        
-        # Calcula el conteo de likes
-        like_count = db.session.query(func.count(Likes.id)).filter_by(post_id=self.id).scalar()
-
-        # Calcula el conteo de comentarios
-        comment_count = db.session.query(func.count(Comments.id)).filter_by(post_id=self.id).scalar()
-        
+    @classmethod
+    def query_with_stats(cls):
+        """
+        Consulta única para el feed: posts + autor (JOIN) + suma de likes de
+        sus comentarios. Cada fila es (post, comment_likes). La suma es el
+        contador desnormalizado comment_like_count, así que una página cuesta
+        lo mismo por grande que sea la tabla comments
+        """
+        return db.session.query(cls, cls.comment_like_count) \
+            .outerjoin(cls.author).options(contains_eager(cls.author))
+
+    def serialize(self, author=None):
+        # author: autor ya cargado (ver serialize_many) para evitar el lazy load
+        author = author or self.author
         return {
             "id": self.id,
             "title": self.title,
@@ -108,13 +128,22 @@ class Post(db.Model):
             "date_added": self.date_added.isoformat() if self.date_added else None,
             "stack": self.stack.value if self.stack else None, 
             "level": self.level.value if self.level else None,
-            "author_username": self.author.username, 
+            "author_username": author.username, 
             # NUEVOS CAMBIOS A PARTIR DE AQUI
-            "favorite_count": favorite_count, # Conteo de favoritos
-            "like_count": like_count, # Conteo de likes
-            "comment_count": comment_count # Conteo de comentarios
+            "favorite_count": self.favorite_count, # Conteo de favoritos
+            "like_count": self.like_count, # Conteo de likes
+            "comment_count": self.comment_count # Conteo de comentarios
         }
 
+    @classmethod
+    def serialize_many(cls, posts):
+        """
+        Serializa una lista de posts cargando los autores que falten en una
+        sola consulta IN (...) en lugar de un lazy load por post
+        """
+        authors = load_authors(posts)
+        return [post.serialize(author=authors.get(post.user_id)) for post in posts]
+
 class Favorites(db.Model):
     __tablename__ = "favorites"
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -141,13 +170,16 @@ class Comments(db.Model):
     title: Mapped[str] = mapped_column(String(40), nullable=True)
     text: Mapped[str] = mapped_column(String(120), nullable=False)
     date_added: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.now(timezone.utc))
+    like_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
 
     # Many to one
     author: Mapped["User"] = relationship(back_populates="reply")
     say: Mapped["Post"] = relationship(back_populates="reply")
     love: Mapped[List["Likes"]] = relationship(back_populates="reply")
 
-    def serialize(self):
+    def serialize(self, author=None):
+        # author: autor ya cargado (ver serialize_many) para evitar el lazy load
+        author = author or self.author
         return {
             "id": self.id,
             "user_id": self.user_id,
@@ -155,13 +187,23 @@ class Comments(db.Model):
             "title": self.title,
             "text": self.text,
             "date_added": self.date_added.isoformat(),
+            "like_count": self.like_count,
             "author": {  # se añadio esta parte para los comments 27/7
-                "id": self.author.id,
-                "name": self.author.name,
-                "username": self.author.username
+                "id": author.id,
+                "name": author.name,
+                "username": author.username
             }
         }
 
+    @classmethod
+    def serialize_many(cls, comments):
+        """
+        Serializa una lista de comentarios cargando los autores que falten en
+        una sola consulta IN (...)
+        """
+        authors = load_authors(comments)
+        return [comment.serialize(author=authors.get(comment.user_id)) for comment in comments]
+
 
 class Likes(db.Model):
     __tablename__ = "likes"
@@ -182,3 +224,118 @@ class Likes(db.Model):
             "post_id": self.post_id,
             "comments_id": self.comments_id
         }
+
+
+class PostEmbedding(db.Model):
+    """
+    Vector precalculado de un post para la búsqueda semántica local
+    (ver api.vectors). vector guarda el vector disperso empaquetado
+    (índices int32 seguidos de pesos float32); dim es el tamaño del espacio
+    con el que se calculó
+    """
+    __tablename__ = "post_embeddings"
+    post_id: Mapped[int] = mapped_column(ForeignKey("posts.id", ondelete="CASCADE"), primary_key=True)
+    dim: Mapped[int] = mapped_column(Integer, nullable=False)
+    vector: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime, default=lambda: datetime.now(timezone.utc), nullable=False, index=True)
+
+
+class SearchQuery(db.Model):
+    """
+    Registro de búsquedas de smart search (ver api.querylog): la consulta
+    normalizada agrupa las variantes de una misma búsqueda y user_request
+    guarda una forma original para poder repetirla. Las métricas son nulas
+    cuando la etapa no se ejecutó (p. ej. DeepSeek en un acierto de caché)
+    """
+    __tablename__ = "search_queries"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    normalized: Mapped[str] = mapped_column(String(255), nullable=False, index=True)
+    user_request: Mapped[str] = mapped_column(String(500), nullable=False)
+    # etiquetas canónicas en JSON (api.query.canonical_tags)
+    user_tags: Mapped[str] = mapped_column(Text, nullable=True)
+    stack: Mapped[Stack] = mapped_column(Enum(Stack), nullable=True)
+    level: Mapped[Level] = mapped_column(Enum(Level), nullable=True)
+    mode: Mapped[str] = mapped_column(String(10), nullable=False, default="ai")
+    cache_hit: Mapped[bool] = mapped_column(Boolean, nullable=True)
+    candidates: Mapped[int] = mapped_column(Integer, nullable=True)
+    results: Mapped[int] = mapped_column(Integer, nullable=True)
+    prefilter_ms: Mapped[float] = mapped_column(Float, nullable=True)
+    llm_ms: Mapped[float] = mapped_column(Float, nullable=True)
+    total_ms: Mapped[float] = mapped_column(Float, nullable=True)
+    tokens: Mapped[int] = mapped_column(Integer, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, default=lambda: datetime.now(timezone.utc), nullable=False, index=True)
+
+
+# -------------------------Carga por lotes------------------------
+
+
+def load_authors(rows):
+    """
+    Devuelve {user_id: User} para los autores de rows (posts o comentarios).
+    Reutiliza los autores ya cargados (joinedload/contains_eager) y trae el
+    resto en una sola consulta IN (...)
+    """
+    authors = {}
+    missing = set()
+    for row in rows:
+        if "author" not in inspect(row).unloaded:
+            if row.author is not None:
+                authors[row.user_id] = row.author
+        else:
+            missing.add(row.user_id)
+    missing -= authors.keys()
+    if missing:
+        for user in User.query.filter(User.id.in_(missing)).all():
+            authors[user.id] = user
+    return authors
+
+
+# -------------------------Contadores desnormalizados------------------------
+
+
+def adjust_counter(column, row_id, delta):
+    """
+    Suma delta a un contador (p. ej. Post.like_count) con un UPDATE atómico.
+    No hace commit: debe ir en la misma transacción que el like/favorito/comentario
+    """
+    model = column.class_
+    db.session.query(model).filter(model.id == row_id).update(
+        {column: column + delta})
+
+
+def rebuild_counters(post_ids=None, comment_ids=None):
+    """
+    Recalcula los contadores desde cero para corregir desviaciones.
+    Sin ids recalcula todos los posts y comentarios. No hace commit
+    """
+    comment_likes = select(func.count(Likes.id)) \
+        .where(Likes.comments_id == Comments.id).scalar_subquery()
+    post_likes = select(func.count(Likes.id)) \
+        .where(Likes.post_id == Post.id).scalar_subquery()
+    post_favorites = select(func.count(Favorites.id)) \
+        .where(Favorites.post_id == Post.id).scalar_subquery()
+    post_comments = select(func.count(Comments.id)) \
+        .where(Comments.post_id == Post.id).scalar_subquery()
+    # se ejecuta después de recalcular Comments.like_count
+    post_comment_likes = select(func.coalesce(func.sum(Comments.like_count), 0)) \
+        .where(Comments.post_id == Post.id).scalar_subquery()
+
+    comments_stmt = update(Comments).values(like_count=comment_likes)
+    posts_stmt = update(Post).values(
+        like_count=post_likes,
+        favorite_count=post_favorites,
+        comment_count=post_comments,
+        comment_like_count=post_comment_likes
+    )
+    if comment_ids is not None:
+        comments_stmt = comments_stmt.where(Comments.id.in_(comment_ids))
+    if post_ids is not None:
+        posts_stmt = posts_stmt.where(Post.id.in_(post_ids))
+
+    comments_updated = db.session.execute(
+        comments_stmt, execution_options={"synchronize_session": False}).rowcount
+    posts_updated = db.session.execute(
+        posts_stmt, execution_options={"synchronize_session": False}).rowcount
+    return posts_updated, comments_updated
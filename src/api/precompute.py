@@ -0,0 +1,58 @@
+"""
+Precálculo de las búsquedas populares (`flask precompute-search`): repite
+las consultas más frecuentes del registro (api.querylog) con hybrid_search y
+deja los resultados en la caché compartida antes de que lleguen usuarios,
+p. ej. tras un reinicio o cada hora desde cron
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from api.cache import search_cache
+from api.querylog import popular_queries
+from api.routes import get_search_cache_key, run_smart_search
+from api.search import ensure_search_index, get_ranker
+from api.vectors import ensure_vector_index
+
+logger = logging.getLogger(__name__)
+
+
+def precompute_searches(app, limit=50, days=7, concurrency=4, force=False):
+    """
+    Calcula y cachea las `limit` búsquedas más frecuentes de los últimos
+    `days` días con como mucho `concurrency` llamadas a DeepSeek a la vez.
+    Las que ya están en caché se saltan salvo con force. Devuelve
+    {"warmed", "cached", "failed"}
+    """
+    summary = {"warmed": 0, "cached": 0, "failed": 0}
+    queries = popular_queries(limit, days)
+    if not queries:
+        return summary
+
+    index = ensure_search_index()
+    if get_ranker().name == "vector" or any(query["mode"] == "local" for query in queries):
+        ensure_vector_index()
+
+    pending = []
+    for query in queries:
+        cache_key = get_search_cache_key(query["user_request"], query["user_tags"], index.signature,
+                                         mode=query["mode"], filters=query["filters"])
+        if not force and search_cache.get(cache_key) is not None:
+            summary["cached"] += 1
+            continue
+        pending.append((query, cache_key))
+
+    def warm(query, cache_key):
+        # cada hilo necesita su propio contexto (y sesión de base de datos)
+        with app.app_context():
+            try:
+                result = run_smart_search(query["user_request"], query["user_tags"], index, cache_key,
+                                          mode=query["mode"], filters=query["filters"])
+                return "error" not in result.get("dev_debug", {})
+            except Exception as e:
+                logger.error(f"Error precalculando '{query['user_request']}': {e}")
+                return False
+
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        for ok in executor.map(lambda item: warm(*item), pending):
+            summary["warmed" if ok else "failed"] += 1
+    return summary
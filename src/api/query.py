@@ -0,0 +1,148 @@
+"""
+Normalización de consultas de smart search: la misma búsqueda escrita de
+distintas formas ("Python CLI tools", "cli tools python ") produce la misma
+clave de caché. El stemming solo se usa para la clave: el prefiltro recibe
+las palabras sin recortar (ver QueryNormalizer.keywords), porque una raíz
+corta ("str" de string) casaría por prefijo con palabras ajenas.
+La clave conserva además las palabras cortas y las que llevan dígitos o
+símbolos ("go", "c++", "3d"): sin ellas "go api" y "api" compartirían los
+resultados cacheados
+"""
+import json
+import re
+import threading
+
+from api.search import STOP_WORDS, tokenize
+
+MIN_TERM_LENGTH = 3
+
+# Términos de la clave: letras y dígitos con los sufijos "+"/"#" de
+# lenguajes (c++, c#) y puntos internos (node.js)
+KEY_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[+#]+|\.[a-z0-9]+)*")
+
+# Sufijos que se recortan (en este orden, uno como máximo): "library" y
+# "libraries" dan la misma raíz "librar"
+SUFFIXES = ("ies", "ing", "ed", "es", "s", "y")
+
+
+def stem(term):
+    """
+    Stemming ligero por sufijos, sin bajar de MIN_TERM_LENGTH letras
+    """
+    for suffix in SUFFIXES:
+        if not term.endswith(suffix) or len(term) - len(suffix) < MIN_TERM_LENGTH:
+            continue
+        if suffix == "s" and term.endswith("ss"):
+            return term
+        if suffix == "es" and not term.endswith(("ses", "xes", "ches", "shes")):
+            continue
+        if suffix == "y" and len(term) <= 4:
+            return term
+        return term[:-len(suffix)]
+    return term
+
+
+def canonical_tags(tags):
+    """
+    Forma canónica de las etiquetas de perfil: minúsculas sin espacios
+    sobrantes, listas de textos ordenadas y sin repetidos, y cadenas "a, b"
+    tratadas como lista. Las claves de los dict se ordenan al serializar
+    """
+    if tags in (None, "", [], {}):
+        return None
+    if isinstance(tags, str):
+        items = sorted({" ".join(tag.lower().split()) for tag in tags.split(",")} - {""})
+        return items[0] if len(items) == 1 else items
+    if isinstance(tags, dict):
+        return {" ".join(str(key).lower().split()): canonical_tags(value) for key, value in tags.items()}
+    if isinstance(tags, (list, tuple, set)):
+        items = [canonical_tags(tag) for tag in tags]
+        if all(isinstance(item, str) for item in items):
+            return sorted(set(items))
+        return items
+    return tags
+
+
+class NormalizedQuery:
+
+    def __init__(self, raw, terms, tags):
+        self.raw = raw
+        self.terms = terms
+        self.tags = tags
+
+    @property
+    def text(self):
+        """
+        Consulta normalizada: términos ordenados o, si la consulta solo tenía
+        stop words, el texto original en minúsculas y con espacios colapsados
+        """
+        return " ".join(self.terms) or " ".join(self.raw.lower().split())
+
+    @property
+    def key(self):
+        return f"{self.text}:{json.dumps(self.tags, sort_keys=True, default=str)}"
+
+
+class QueryNormalizer:
+    """
+    Normaliza consultas y cuenta cuántas consultas distintas (texto crudo)
+    colapsan en la misma forma normalizada. Los conjuntos vistos se vacían al
+    pasar de max_tracked para acotar la memoria
+    """
+
+    def __init__(self, max_tracked=10000):
+        self.max_tracked = max_tracked
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.raw_seen = set()
+        self.normalized_seen = set()
+
+    def keywords(self, user_request):
+        """
+        Palabras clave para el prefiltro: minúsculas, sin stop words ni
+        palabras de menos de MIN_TERM_LENGTH letras, sin repetidos y
+        ordenadas. Sin stemming
+        """
+        return tuple(sorted({
+            word for word in tokenize(user_request)
+            if word not in STOP_WORDS and len(word) >= MIN_TERM_LENGTH
+        }))
+
+    def terms(self, user_request):
+        """
+        Términos de la clave de caché: todas las palabras que no son stop
+        words (también las cortas y las alfanuméricas), con stemming ligero
+        solo en las alfabéticas (node.js no pierde la "s"), sin repetidos y
+        ordenados
+        """
+        return tuple(sorted({
+            stem(word) if word.isalpha() else word for word in KEY_TOKEN_PATTERN.findall((user_request or "").lower())
+            if word not in STOP_WORDS
+        }))
+
+    def normalize(self, user_request, user_tags=None, record=False):
+        query = NormalizedQuery(user_request, self.terms(user_request), canonical_tags(user_tags))
+        if record:
+            with self.lock:
+                if len(self.raw_seen) >= self.max_tracked:
+                    self.raw_seen.clear()
+                    self.normalized_seen.clear()
+                self.requests += 1
+                self.raw_seen.add((user_request, json.dumps(user_tags, default=str)))
+                self.normalized_seen.add(query.key)
+        return query
+
+    def stats(self):
+        with self.lock:
+            distinct_raw = len(self.raw_seen)
+            distinct_normalized = len(self.normalized_seen)
+            return {
+                "requests": self.requests,
+                "distinct_raw": distinct_raw,
+                "distinct_normalized": distinct_normalized,
+                # fracción de variantes crudas que comparten clave con otra
+                "collapse_rate": round(1 - distinct_normalized / distinct_raw, 4) if distinct_raw else 0.0
+            }
+
+
+query_normalizer = QueryNormalizer()
@@ -0,0 +1,237 @@
+"""
+Registro de búsquedas de smart search (tabla search_queries) con métricas
+por etapa: candidatos del prefiltro, acierto de caché, ms del prefiltro y de
+DeepSeek, tokens y resultados. Las filas se acumulan en memoria y se
+insertan por lotes, así que registrar una búsqueda no añade una escritura
+por petición. Alimenta /api/admin/search-log y el precálculo de las
+consultas más frecuentes (`flask precompute-search`, ver api.precompute)
+"""
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime, timedelta, UTC
+
+from flask import has_app_context
+from sqlalchemy import func
+
+from api.models import db, SearchQuery
+from api.query import query_normalizer
+
+logger = logging.getLogger(__name__)
+
+
+class SearchLog:
+    """
+    Buffer de filas de search_queries. Se vacía con un solo INSERT de varias
+    filas al llegar a batch_size filas o pasados flush_interval segundos
+    desde el último vaciado. Si la base de datos falla las filas vuelven al
+    buffer, que nunca pasa de max_buffer (las más antiguas se descartan)
+    """
+
+    def __init__(self, batch_size=50, flush_interval=10, max_buffer=5000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.lock = threading.Lock()
+        self.buffer = []
+        self.flushed_at = time.monotonic()
+        self.flushed = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def append(self, row):
+        with self.lock:
+            self.buffer.append(row)
+            if len(self.buffer) > self.max_buffer:
+                del self.buffer[0]
+                self.dropped += 1
+
+    def due(self):
+        with self.lock:
+            return len(self.buffer) >= self.batch_size or \
+                (self.buffer and time.monotonic() - self.flushed_at >= self.flush_interval)
+
+    def flush(self):
+        """
+        Inserta las filas pendientes (necesita contexto de aplicación).
+        Devuelve cuántas se escribieron
+        """
+        with self.lock:
+            rows, self.buffer = self.buffer, []
+            self.flushed_at = time.monotonic()
+        if not rows:
+            return 0
+        try:
+            # conexión propia: no toca la sesión (ni la transacción) de la petición
+            with db.engine.begin() as connection:
+                connection.execute(SearchQuery.__table__.insert(), rows)
+        except Exception as e:
+            logger.warning(f"No se pudo escribir el registro de búsquedas: {e}")
+            with self.lock:
+                self.errors += 1
+                self.buffer[:0] = rows
+                overflow = len(self.buffer) - self.max_buffer
+                if overflow > 0:
+                    del self.buffer[:overflow]
+                    self.dropped += overflow
+            return 0
+        with self.lock:
+            self.flushed += len(rows)
+        return len(rows)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "buffered": len(self.buffer),
+                "flushed": self.flushed,
+                "dropped": self.dropped,
+                "flush_errors": self.errors
+            }
+
+
+search_log = SearchLog(
+    batch_size=int(os.getenv("SEARCH_LOG_BATCH_SIZE", 50)),
+    flush_interval=float(os.getenv("SEARCH_LOG_FLUSH_INTERVAL", 10))
+)
+
+
+def log_search(user_request, user_tags=None, filters=None, mode="ai", result=None,
+               cache_hit=False, total_ms=None):
+    """
+    Añade una búsqueda al registro con las métricas del dev_debug del
+    resultado. Desde una petición (con contexto de aplicación) además vacía
+    el buffer si toca; los hilos de trabajos asíncronos solo acumulan
+    """
+    normalized = query_normalizer.normalize(user_request, user_tags)
+    filters = filters or {}
+    result = result or {}
+    dev_debug = result.get("dev_debug") or {}
+    # de un resultado cacheado solo cuentan candidatos y resultados: el
+    # prefiltro y DeepSeek no se ejecutaron en esta búsqueda
+    work = {} if cache_hit else dev_debug
+    tokens = work.get("total_tokens")
+
+    search_log.append({
+        "normalized": normalized.text[:255],
+        "user_request": user_request[:500],
+        "user_tags": json.dumps(normalized.tags, sort_keys=True) if normalized.tags is not None else None,
+        "stack": filters.get("stack"),
+        "level": filters.get("level"),
+        "mode": mode,
+        "cache_hit": cache_hit,
+        "candidates": dev_debug.get("initial_filtered_count", dev_debug.get("filtered_count")),
+        "results": len(result.get("results") or []) if result else None,
+        "prefilter_ms": work.get("prefilter_ms"),
+        "llm_ms": work.get("latency_ms"),
+        "total_ms": round(total_ms, 1) if total_ms is not None else None,
+        "tokens": tokens,
+        "created_at": datetime.now(UTC)
+    })
+    if has_app_context() and search_log.due():
+        search_log.flush()
+
+
+def popular_queries(limit=50, days=7):
+    """
+    Las `limit` búsquedas más repetidas de los últimos `days` días,
+    agrupadas por consulta normalizada, etiquetas, filtros y modo. Devuelve
+    dicts con user_request (una de sus formas originales), user_tags,
+    filters, mode y searches
+    """
+    search_log.flush()
+    searches = func.count(SearchQuery.id).label("searches")
+    group = (SearchQuery.normalized, SearchQuery.user_tags,
+             SearchQuery.stack, SearchQuery.level, SearchQuery.mode)
+    rows = db.session.query(*group, func.max(SearchQuery.user_request), searches) \
+        .filter(SearchQuery.created_at >= since(days)) \
+        .group_by(*group).order_by(searches.desc()).limit(limit)
+
+    return [{
+        "normalized": normalized,
+        "user_request": user_request,
+        "user_tags": json.loads(user_tags) if user_tags else None,
+        "filters": {"stack": stack, "level": level},
+        "mode": mode,
+        "searches": count
+    } for normalized, user_tags, stack, level, mode, user_request, count in rows]
+
+
+def since(days):
+    return datetime.now(UTC) - timedelta(days=days)
+
+
+def percentiles(column, days, fractions=(0.5, 0.95)):
+    """
+    {"p50": ms, "p95": ms} de una columna de latencia. Cada percentil es un
+    ORDER BY ... LIMIT 1 OFFSET k sobre la ventana (igual en Postgres y
+    SQLite, sin traer las filas al worker)
+    """
+    window = db.session.query(column).filter(
+        SearchQuery.created_at >= since(days), column.isnot(None))
+    total = window.count()
+    result = {}
+    for fraction in fractions:
+        name = f"p{int(fraction * 100)}"
+        if not total:
+            result[name] = None
+            continue
+        offset = min(int(fraction * total), total - 1)
+        result[name] = window.order_by(column).offset(offset).limit(1).scalar()
+    return result
+
+
+def search_log_report(days=7, top=20):
+    """
+    Resumen del registro para /api/admin/search-log: volumen, tasas de
+    acierto de caché y de búsquedas sin candidatos o sin resultados,
+    percentiles de latencia por etapa, tokens y consultas más frecuentes
+    """
+    search_log.flush()
+    window = SearchQuery.created_at >= since(days)
+    searches, hits, no_candidates, no_results, tokens = db.session.query(
+        func.count(SearchQuery.id),
+        func.sum(db.case((SearchQuery.cache_hit.is_(True), 1), else_=0)),
+        func.sum(db.case((SearchQuery.candidates == 0, 1), else_=0)),
+        func.sum(db.case((SearchQuery.results == 0, 1), else_=0)),
+        func.sum(SearchQuery.tokens)
+    ).filter(window).one()
+
+    def rate(count):
+        return round((count or 0) / searches, 4) if searches else 0.0
+
+    searches_column = func.count(SearchQuery.id).label("searches")
+    top_rows = db.session.query(
+        SearchQuery.normalized, searches_column,
+        func.avg(SearchQuery.total_ms), func.avg(SearchQuery.candidates), func.avg(SearchQuery.results)
+    ).filter(window).group_by(SearchQuery.normalized).order_by(searches_column.desc()).limit(top)
+    empty_rows = db.session.query(SearchQuery.normalized, searches_column) \
+        .filter(window, SearchQuery.results == 0) \
+        .group_by(SearchQuery.normalized).order_by(searches_column.desc()).limit(top)
+
+    def rounded(value):
+        return round(float(value), 1) if value is not None else None
+
+    return {
+        "days": days,
+        "searches": searches,
+        "cache_hit_rate": rate(hits),
+        "no_candidates_rate": rate(no_candidates),
+        "no_results_rate": rate(no_results),
+        "tokens": tokens or 0,
+        "latency_ms": {
+            "total": percentiles(SearchQuery.total_ms, days),
+            "prefilter": percentiles(SearchQuery.prefilter_ms, days),
+            "llm": percentiles(SearchQuery.llm_ms, days)
+        },
+        "top_queries": [{
+            "query": normalized,
+            "searches": count,
+            "avg_total_ms": rounded(total_ms),
+            "avg_candidates": rounded(candidates),
+            "avg_results": rounded(results)
+        } for normalized, count, total_ms, candidates, results in top_rows],
+        "no_result_queries": [{"query": normalized, "searches": count} for normalized, count in empty_rows],
+        "buffer": search_log.stats()
+    }
@@ -1,28 +1,43 @@
 """
 This module takes care of starting the API Server, Loading the DB and Adding the endpoints
 """
-from flask import Flask, request, jsonify, url_for, Blueprint
-from api.models import db, User, Post, Comments, Level, Stack, Likes, Favorites
+from flask import Flask, request, jsonify, url_for, Blueprint, Response, stream_with_context
+from api.models import db, User, Post, Comments, Level, Stack, Likes, Favorites, adjust_counter, rebuild_counters
 from sqlalchemy.orm import joinedload
 from sqlalchemy import func
-from api.utils import generate_sitemap, APIException
+from api.utils import generate_sitemap, APIException, get_cursor_args, encode_cursor, decode_cursor, keyset_page, \
+    get_facet_filters
 from flask_cors import CORS
 from flask_bcrypt import Bcrypt
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity, verify_jwt_in_request
+from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt, get_jwt_identity, \
+    verify_jwt_in_request
+from flask_jwt_extended.exceptions import RevokedTokenError
 import smtplib
 import ssl
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import os
 from api.utils import send_email
-from functools import wraps,  lru_cache
+from api.search import ensure_search_index, get_ranker, index_post, unindex_post, FACETS, facet_grid, \
+    facet_counts, count_filtered
+from api.query import query_normalizer
+from api.cache import search_cache, search_flights
+from api.jobs import search_jobs
+from api.deepseek import deepseek_client, CircuitOpenError
+from api.vectors import embed_post, unembed_post, ensure_vector_index
+from api.fulltext import get_fulltext_backend
+from api.auth import create_user_token, token_is_admin
+from api.querylog import log_search, search_log, search_log_report
+from api.suggest import ensure_suggest_index, suggest_index, add_post_suggestions, remove_post_suggestions
+from functools import wraps
 from datetime import datetime, UTC
 import stripe
-import requests
 import json
 import logging
 import re
 import hashlib
+import math
+import time
 
 # configuracion del logger
 logger = logging.getLogger(__name__)
@@ -31,16 +46,32 @@ bcrypt = Bcrypt()
 # Allow CORS requests to this API
 CORS(api)
 
-# Configuración de DeepSeek
-DEEPSEEK_API_URL = "https://api.deepseek.com/v1/chat/completions"
-DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
+# Configuración de DeepSeek: ver api.deepseek (DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL...)
 
-# Función de caché
+# Máximo de posts candidatos que se envían a DeepSeek
+SEARCH_CANDIDATE_LIMIT = int(os.getenv("SEARCH_CANDIDATE_LIMIT", 20))
 
+# Presupuesto de tokens del prompt de smart search (system + user)
+SEARCH_PROMPT_TOKEN_BUDGET = int(os.getenv("SEARCH_PROMPT_TOKEN_BUDGET", 1500))
 
-@lru_cache(maxsize=100)
-def get_search_cache_key(user_request, user_tags, post_count):
-    key_str = f"{user_request}:{user_tags}:{post_count}"
+# Longitud máxima de user_request: una consulta más larga dejaría sin sitio a
+# los candidatos en el prompt
+SEARCH_MAX_REQUEST_LENGTH = int(os.getenv("SEARCH_MAX_REQUEST_LENGTH", 500))
+
+# Protocolo de salida de la IA: "compact" (una línea id,score,label por post)
+# o "verbose" (bloques RANK_POSITION/POST_ID/JUSTIFICATION/RELEVANCE/FIT_SCORE)
+SEARCH_OUTPUT_FORMAT = os.getenv("SEARCH_OUTPUT_FORMAT", "compact").lower()
+
+# Función de caché (la versión del corpus invalida las claves al cambiar los posts)
+
+
+def get_search_cache_key(user_request, user_tags, corpus_version, justify=False, mode="ai", filters=None):
+    # Consulta normalizada (términos sin stop words, con stemming ligero y
+    # ordenados) y etiquetas canónicas (ver api.query): las variantes de una
+    # misma búsqueda comparten clave en todos los workers
+    normalized = query_normalizer.normalize(user_request, user_tags, record=True)
+    facets = ",".join(value.name if value else "" for value in map((filters or {}).get, FACETS))
+    key_str = f"{normalized.key}:{corpus_version}:{SEARCH_OUTPUT_FORMAT}:{int(justify)}:{mode}:{facets}"
     return hashlib.md5(key_str.encode()).hexdigest()
 
 # -------------------------Decorator Administrator------------------------
@@ -48,23 +79,25 @@ def get_search_cache_key(user_request, user_tags, post_count):
 
 def admin_required(fn):
     """
-    Versión simplificada que no inyecta el admin
+    Versión simplificada que no inyecta el admin.
+    El rol sale de los claims del token; su vigencia la comprueba
+    verify_jwt_in_request contra la caché de auth_version (api.auth), sin
+    consultar la base de datos
     """
     @wraps(fn)
     def wrapper(*args, **kwargs):
         try:
             verify_jwt_in_request()
-            current_user_id = get_jwt_identity()
-            user = User.query.get(current_user_id)
-
-            if not user:
-                return jsonify({"error": "Usuario no encontrado"}), 404
 
-            if not user.is_admin:
+            if not token_is_admin():
                 return jsonify({"error": "Se requieren privilegios de administrador"}), 403
 
             return fn(*args, **kwargs)  # <-- Sin inyectar parámetros
 
+        except (APIException, RevokedTokenError):
+            # Errores de validación de la ruta (p. ej. cursor inválido) y
+            # tokens revocados, que responde el revoked_token_loader
+            raise
         except Exception as e:
             return jsonify({"error": "Error de autorización", "details": str(e)}), 401
 
@@ -88,204 +121,416 @@ def validate_response_format(response_text):
     return all(re.search(pattern, response_text) for pattern in required_patterns)
 
 
+# Expresión regular para capturar cada post en la respuesta
+AI_RESULT_PATTERN = re.compile(
+    r"RANK_POSITION:\s*(\d+)\s*"
+    r"POST_ID:\s*(\d+)\s*"
+    r'JUSTIFICATION:\s*"([^"]+)"\s*'
+    r'RELEVANCE:\s*"([^"]+)"\s*'
+    r'FIT_SCORE:\s*(\d+)',
+    re.MULTILINE | re.DOTALL
+)
+
+
+def build_ai_result(match):
+    rank, post_id, justification, relevance, score = match.groups()
+    return {
+        "rank_position": int(rank),
+        "post_id": int(post_id),
+        "justification": justification.strip(),
+        "relevance": relevance.strip(),
+        "fit_score": int(score)
+    }
+
+
 def parse_ai_response(response_text):
     """
     Parsea la respuesta de la API y extrae la información estructurada
     """
-    # Expresión regular para capturar todos los posts en la respuesta
-    pattern = re.compile(
-        r"RANK_POSITION:\s*(\d+)\s*"
-        r"POST_ID:\s*(\d+)\s*"
-        r'JUSTIFICATION:\s*"([^"]+)"\s*'
-        r'RELEVANCE:\s*"([^"]+)"\s*'
-        r'FIT_SCORE:\s*(\d+)',
-        re.MULTILINE | re.DOTALL
-    )
-
-    results = []
-    matches = pattern.findall(response_text)
-
-    for match in matches:
-        rank, post_id, justification, relevance, score = match
-        results.append({
-            "rank_position": int(rank),
-            "post_id": int(post_id),
-            "justification": justification.strip(),
-            "relevance": relevance.strip(),
-            "fit_score": int(score)
-        })
+    results = [build_ai_result(match)
+               for match in AI_RESULT_PATTERN.finditer(response_text)]
 
     # Ordenar por posición en el ranking
     results.sort(key=lambda x: x["rank_position"])
     return results
 
 
-def extract_keywords(user_request):
+class IncrementalRankParser:
     """
-    Extrae palabras clave importantes de la solicitud del usuario
+    Parser incremental para respuestas en streaming: feed() devuelve cada bloque
+    RANK_POSITION...FIT_SCORE en cuanto está completo
     """
-    # Palabras comunes a ignorar (stop words)
-    stop_words = {
-        "the", "a", "an", "and", "or", "but", "in", "on", "at", "to",
-        "for", "of", "with", "by", "is", "are", "was", "were", "be", "been",
-        "this", "that", "these", "those", "i", "you", "he", "she", "it", "we",
-        "they", "my", "your", "his", "her", "its", "our", "their", "what",
-        "which", "who", "whom", "where", "when", "why", "how", "can", "could",
-        "would", "should", "may", "might", "must", "will", "shall", "about"
-    }
 
-    # Convertir a minúsculas y dividir en palabras
-    words = user_request.lower().split()
+    def __init__(self):
+        self.buffer = ""
+
+    def feed(self, text):
+        self.buffer += text
+        results = []
+        consumed = 0
+        for match in AI_RESULT_PATTERN.finditer(self.buffer):
+            # Si el bloque acaba justo al final del buffer, el FIT_SCORE
+            # puede tener más dígitos por llegar
+            if match.end() == len(self.buffer):
+                break
+            results.append(build_ai_result(match))
+            consumed = match.end()
+        self.buffer = self.buffer[consumed:]
+        return results
+
+    def finish(self):
+        results = [build_ai_result(match)
+                   for match in AI_RESULT_PATTERN.finditer(self.buffer)]
+        self.buffer = ""
+        return results
+
+
+# Una línea del protocolo compacto: POST_ID,FIT_SCORE,RELEVANCE[,JUSTIFICATION].
+# Tolera viñetas o numeración al inicio y separadores ; o |
+COMPACT_LINE_PATTERN = re.compile(
+    r"^\s*(?:[-*]\s*|\d+[.)]\s+)?(?:ID:?\s*)?(\d+)\s*[,;|]\s*(\d{1,3})"
+    r"(?:\s*[,;|]\s*([^,;|]*?))?(?:\s*[,;|]\s*(.*?))?\s*$",
+    re.IGNORECASE
+)
+
+
+class CompactRankParser:
+    """
+    Parser de una sola pasada para el protocolo compacto, incremental como
+    IncrementalRankParser: cada línea completa se convierte en un resultado.
+    Ignora líneas que no encajan, ids repetidos o que no son candidatos, y al
+    terminar acepta una última línea sin salto solo si trae la etiqueta (la
+    puntuación no quedó cortada por max_tokens)
+    """
 
-    # Filtrar palabras relevantes (eliminar stop words y palabras muy cortas)
-    keywords = [
-        word for word in words
-        if word not in stop_words and len(word) > 2 and word.isalpha()
-    ]
+    def __init__(self, candidate_ids=None):
+        self.buffer = ""
+        self.candidate_ids = set(candidate_ids) if candidate_ids is not None else None
+        self.seen = set()
+
+    def feed(self, text):
+        self.buffer += text
+        *lines, self.buffer = self.buffer.split("\n")
+        return [result for result in map(self._parse_line, lines) if result]
+
+    def finish(self):
+        line, self.buffer = self.buffer, ""
+        match = COMPACT_LINE_PATTERN.match(line)
+        if not match or match.group(3) is None:
+            return []
+        result = self._parse_line(line)
+        return [result] if result else []
+
+    def _parse_line(self, line):
+        match = COMPACT_LINE_PATTERN.match(line)
+        if not match:
+            return None
+        post_id, score, relevance, justification = match.groups()
+        post_id = int(post_id)
+        if post_id in self.seen or (self.candidate_ids is not None and post_id not in self.candidate_ids):
+            return None
+        self.seen.add(post_id)
+        return {
+            "rank_position": len(self.seen),
+            "post_id": post_id,
+            "justification": (justification or "").strip().strip('"'),
+            "relevance": (relevance or "").strip().strip('"'),
+            "fit_score": min(int(score), 100)
+        }
 
-    return set(keywords)
+
+def make_rank_parser(candidate_ids=None):
+    """
+    Parser incremental para el protocolo de salida configurado
+    """
+    if SEARCH_OUTPUT_FORMAT == "verbose":
+        return IncrementalRankParser()
+    return CompactRankParser(candidate_ids)
 
 
-def parse_post_list(post_results_list):
+def extract_keywords(user_request):
     """
-    Convierte la cadena de texto de posts en una lista de diccionarios
+    Extrae palabras clave importantes de la solicitud del usuario (sin stop
+    words ni palabras muy cortas). Sin stemming: la forma con raíces solo se
+    usa en la clave de caché (ver api.query)
     """
-    posts = []
-    lines = post_results_list.strip().split('\n')
-
-    for line in lines:
-        # El formato esperado es: "ID: X | Title: Y | Description: Z"
-        parts = line.split('|')
-        if len(parts) < 3:
-            continue
-
-        # Extraer ID
-        id_part = parts[0].strip()
-        id_match = re.search(r'ID:\s*(\d+)', id_part)
-        if not id_match:
-            continue
-
-        # Extraer título
-        title_part = parts[1].strip()
-        title_match = re.search(r'Title:\s*(.+)', title_part)
-
-        # Extraer descripción
-        desc_part = parts[2].strip() if len(parts) > 2 else ""
-        desc_match = re.search(r'Description:\s*(.+)', desc_part)
-
-        posts.append({
-            'id': id_match.group(1),
-            'title': title_match.group(1) if title_match else "[Untitled]",
-            'description': desc_match.group(1) if desc_match else ""
-        })
+    return set(query_normalizer.keywords(user_request))
 
-    return posts
 
+def query_corrections(user_request, index):
+    """
+    {errata: corrección} de las palabras clave de la consulta ("pyhton" ->
+    "python") según el índice de trigramas. Es la parte cara del prefiltro:
+    se calcula una vez por búsqueda y se pasa al filtrado, a las facetas y a
+    did_you_mean.
+    Con SEARCH_BACKEND=database no hay índice de trigramas (el índice en
+    memoria no se carga) y no se corrige nada: dev_debug.typo_correction lo
+    indica (ver prefilter_debug)
+    """
+    if get_fulltext_backend() is not None:
+        return {}
+    return index.corrections(extract_keywords(user_request))
 
-def calculate_relevance_score(post, keywords):
+
+def prefilter_debug(started):
     """
-    Calcula un puntaje de relevancia entre un post y las palabras clave
+    Datos del prefiltro para dev_debug: su duración (candidatos, erratas y
+    facetas), el backend y si se pudieron corregir erratas
     """
-    # Combinar título y descripción para el análisis
-    content = f"{post.get('title', '')} {post.get('description', '')}".lower()
-
-    score = 0
-
-    # Ponderar coincidencias en el título más que en la descripción
-    title = post.get('title', '').lower()
-    for keyword in keywords:
-        # Coincidencia exacta en el título
-        if f" {keyword} " in f" {title} ":
-            score += 3
-        # Coincidencia parcial en el título
-        elif keyword in title:
-            score += 2
-        # Coincidencia exacta en el contenido
-        elif f" {keyword} " in f" {content} ":
-            score += 2
-        # Coincidencia parcial en el contenido
-        elif keyword in content:
-            score += 1
-
-    return score
-
-
-def filter_posts_by_keywords(user_request, post_results_list):
+    memory = get_fulltext_backend() is None
+    return {
+        "prefilter_ms": round((time.monotonic() - started) * 1000, 1),
+        "prefilter_backend": "memory" if memory else "database",
+        "typo_correction": memory
+    }
+
+
+def corrected_keywords(user_request, corrections):
+    """
+    Palabras clave de la consulta con las erratas sustituidas
     """
-    Filtrado inicial por palabras clave para reducir el conjunto de posts
+    return {corrections.get(keyword, keyword) for keyword in extract_keywords(user_request)}
+
+
+def filter_posts_by_keywords(user_request, index, ranker=None, limit=SEARCH_CANDIDATE_LIMIT, filters=None,
+                             corrections=None):
+    """
+    Filtrado inicial por palabras clave para reducir el conjunto de posts.
+    El ranker (BM25 por defecto, ver api.search.get_ranker) solo recorre las
+    posting lists del índice invertido para las palabras clave.
+    Con SEARCH_BACKEND=database la selección la hace la base de datos
+    (api.fulltext) y el ranker no se usa.
+    Los filtros de facetas ({"stack": Stack, "level": Level}) se aplican
+    antes de elegir los `limit` candidatos. corrections es el resultado de
+    query_corrections (se calcula aquí si no se pasa)
     """
     keywords = extract_keywords(user_request)
-    posts = parse_post_list(post_results_list)
+    backend = get_fulltext_backend()
 
-    # Si no hay palabras clave relevantes, devolver todos los posts
+    # Si no hay palabras clave relevantes, devolver los primeros posts
     if not keywords:
-        return posts[:20]  # Limitar a 20 posts como máximo
+        return backend.first(limit, filters) if backend else index.first(limit, filters)
+
+    if backend is not None:
+        return backend.search(keywords, limit, filters)
+
+    if corrections is None:
+        corrections = query_corrections(user_request, index)
+    keywords = corrected_keywords(user_request, corrections)
+    ranked = (ranker or get_ranker()).rank(index, keywords, limit, filters)
+
+    # El puntaje del ranker se conserva para el ranking local de respaldo
+    return [dict(index.get(post_id), keyword_score=round(score, 4)) for score, post_id in ranked]
+
+
+def search_facets(user_request, index, filters=None, corrections=None):
+    """
+    Conteos por stack y level de los posts que casan con la consulta: del
+    índice en memoria o, con SEARCH_BACKEND=database, de un solo GROUP BY
+    """
+    backend = get_fulltext_backend()
+    if backend is not None:
+        return backend.facets(extract_keywords(user_request), filters)
+    if corrections is None:
+        corrections = query_corrections(user_request, index)
+    return index.facets(corrected_keywords(user_request, corrections), filters)
+
+
+def did_you_mean(user_request, corrections):
+    """
+    La consulta con las erratas (ver query_corrections) corregidas, o None
+    si no hay nada que corregir
+    """
+    if not corrections:
+        return None
+    return " ".join(corrections.get(word.lower(), word) for word in user_request.split())
 
-    filtered_posts = []
-    for post in posts:
-        score = calculate_relevance_score(post, keywords)
-        # Umbral mínimo de relevancia
-        if score >= 2:  # Ajusta este valor según necesites
-            filtered_posts.append((score, post))
 
-    # Ordenar por puntaje (mayor a menor)
-    filtered_posts.sort(key=lambda x: x[0], reverse=True)
+def local_ranking(filtered_posts, dev_debug, status="⚡ Ranking local: DeepSeek no disponible"):
+    """
+    Ranking sin IA (modo local, o respaldo con DeepSeek caído o circuito
+    abierto): el orden del prefiltro con un FIT_SCORE sintetizado a partir
+    del puntaje del ranker, normalizado a 0-100 respecto al mejor candidato
+    """
+    top_score = max((post.get("keyword_score") or 0 for post in filtered_posts), default=0)
+    results = [{
+        "rank_position": position,
+        "post_id": post["id"],
+        "justification": "Ranking local del prefiltro (sin IA)",
+        "relevance": "Local",
+        "fit_score": int(round(100 * post["keyword_score"] / top_score))
+        if top_score and post.get("keyword_score") else 0
+    } for position, post in enumerate(filtered_posts, start=1)]
 
-    # Devolver solo los posts, sin los puntajes
-    return [post for score, post in filtered_posts[:20]]  # Máximo 20 posts
+    dev_debug = dict(dev_debug, status=status)
+    if "error" in dev_debug:
+        dev_debug.update(fallback="local", circuit=deepseek_client.breaker.stats()["state"])
+    return {"results": results, "dev_debug": dev_debug}
 
 
-def hybrid_search(user_request, post_results_list, user_tags=None):
+PROMPT_FULL_STATUS = "⚡ Ranking local: la consulta no deja sitio a candidatos en el prompt"
+
+
+def hybrid_search(user_request, index, user_tags=None, justify=False, mode="ai", filters=None):
     """
     Sistema híbrido que primero filtra con algoritmo simple y luego usa IA
-    para rankear solo los posts más relevantes
+    para rankear solo los posts más relevantes.
+    mode="local" no llama a la IA: rankea con los vectores locales
+    (api.vectors) y devuelve ese orden directamente.
+    did_you_mean lleva la consulta corregida si tenía erratas y facets los
+    conteos por stack y level (ver search_facets).
+    dev_debug lleva los datos del prefiltro (ver prefilter_debug)
     """
-    # Primero filtramos con un algoritmo simple basado en palabras clave
-    filtered_posts = filter_posts_by_keywords(user_request, post_results_list)
+    # Primero filtramos con el índice invertido de palabras clave
+    started = time.monotonic()
+    ranker = get_ranker("vector") if mode == "local" else None
+    corrections = query_corrections(user_request, index)
+    filtered_posts = filter_posts_by_keywords(user_request, index, ranker, filters=filters,
+                                              corrections=corrections)
+    suggestion = did_you_mean(user_request, corrections)
+    facets = search_facets(user_request, index, filters, corrections)
+    prefilter = prefilter_debug(started)
 
     # Si no encontramos posts relevantes con el filtrado simple
     if not filtered_posts:
         # Podemos optar por devolver resultados vacíos o usar IA con todos los posts
         return {
             "results": [],
+            "did_you_mean": suggestion,
+            "facets": facets,
             "dev_debug": {
                 "status": "No relevant posts found in initial filtering",
-                "filtered_count": 0
+                "filtered_count": 0,
+                **prefilter
             }
         }
 
-    # Preparamos la lista reducida para la IA
-    reduced_list = "\n".join([
-        f"ID: {post['id']} | Title: {post['title']} | Description: {post['description']}"
-        for post in filtered_posts
-    ])
+    if mode == "local":
+        return dict(local_ranking(filtered_posts, dict(prefilter, initial_filtered_count=len(filtered_posts)),
+                                  status="Ranking semántico local (sin IA)"),
+                    did_you_mean=suggestion, facets=facets)
+
+    # Preparamos la lista reducida para la IA, recortada al presupuesto de tokens
+    reduced_list, prompt_stats = fit_candidates(user_request, filtered_posts, user_tags, justify=justify)
+    if not prompt_stats["candidates_in_prompt"]:
+        # El prompt fijo ya agota el presupuesto: llamar a DeepSeek sin
+        # candidatos solo gastaría tokens
+        return dict(local_ranking(filtered_posts, dict(prompt_stats, initial_filtered_count=len(filtered_posts),
+                                                       **prefilter),
+                                  status=PROMPT_FULL_STATUS),
+                    did_you_mean=suggestion, facets=facets)
+    candidate_ids = [post["id"] for post in filtered_posts[:prompt_stats["candidates_in_prompt"]]]
 
     # Llamamos a la IA solo con los posts pre-filtrados
-    ai_response = AI_search(user_request, reduced_list, user_tags)
+    ai_response = AI_search(user_request, reduced_list, user_tags,
+                            candidate_ids=candidate_ids, justify=justify)
+
+    # Si DeepSeek falla (o el circuit breaker está abierto y ni se llamó),
+    # se responde con el ranking local del prefiltro
+    if "error" in ai_response.get("dev_debug", {}):
+        ai_response = local_ranking(filtered_posts, ai_response["dev_debug"])
 
     # Añadimos información de debug sobre el filtrado
     if "dev_debug" in ai_response:
         ai_response["dev_debug"]["initial_filtered_count"] = len(
             filtered_posts)
         ai_response["dev_debug"]["initial_filtering"] = "Applied"
+        ai_response["dev_debug"].update(prefilter)
+        ai_response["dev_debug"].update(prompt_stats)
 
+    ai_response["did_you_mean"] = suggestion
+    ai_response["facets"] = facets
     return ai_response
 
-# -----------------------------Defs for DeepSeek API-------------------------
 
+def fit_candidates(user_request, posts, user_tags=None, budget=SEARCH_PROMPT_TOKEN_BUDGET, justify=False):
+    """
+    Lista de posts candidatos en el formato que recibe la IA, ajustada para
+    que el prompt completo quepa en `budget` tokens (tokenizador local
+    calibrado, ver api.deepseek.TokenEstimator).
+    El presupuesto libre se reparte entre las descripciones: las cortas se
+    quedan enteras y ceden lo que no usan, las largas se recortan. Si ni las
+    cabeceras (id y título) caben, se descartan los candidatos peor rankeados.
+    Devuelve (lista formateada, estadísticas para dev_debug)
+    """
+    count = deepseek_client.tokenizer.count
+    prompt_tokens = deepseek_client.tokenizer.count_messages(
+        build_search_payload(build_search_prompt(user_request, "", user_tags, justify))["messages"])
+    available = budget - prompt_tokens
+
+    heads = [f"ID: {post['id']} | Title: {post['title']} | Description: " for post in posts]
+    head_tokens = [count(head) + 1 for head in heads]  # +1 por el salto de línea
+    included = len(posts)
+    while included and sum(head_tokens[:included]) > available:
+        included -= 1
+    remaining = available - sum(head_tokens[:included])
+
+    description_tokens = [count(post["description"]) for post in posts[:included]]
+    allowance = [0] * included
+    for position, i in enumerate(sorted(range(included), key=description_tokens.__getitem__)):
+        allowance[i] = min(description_tokens[i], max(remaining, 0) // (included - position))
+        remaining -= allowance[i]
+
+    lines = []
+    truncated = 0
+    for i in range(included):
+        description = posts[i]["description"]
+        if allowance[i] < description_tokens[i]:
+            description = deepseek_client.tokenizer.truncate(description, allowance[i])
+            truncated += 1
+        lines.append(heads[i] + description)
+
+    return "\n".join(lines), {
+        "prompt_token_budget": budget,
+        "candidates_in_prompt": included,
+        "descriptions_truncated": truncated
+    }
 
-def AI_search(user_request, post_results_list, user_tags=None):
-    prompt = f"""
-Eres un asistente especializado en analizar y clasificar proyectos de código abierto. Tu tarea es rankear posts de proyectos basándote en qué tan bien coinciden con la solicitud del usuario.
+# -----------------------------Defs for DeepSeek API-------------------------
 
-### Instrucciones:
-1. Evalúa cada post según su relevancia para la solicitud del usuario
+
+VERBOSE_INSTRUCTIONS = """1. Evalúa cada post según su relevancia para la solicitud del usuario
 2. Asigna a cada post:
    - Una posición en el ranking (comenzando en 1)
    - Su ID de post
    - Una justificación específica
    - Una etiqueta de relevancia
-   - Un puntaje de ajuste (FIT_SCORE) de 0 a 100
+   - Un puntaje de ajuste (FIT_SCORE) de 0 a 100"""
+
+VERBOSE_RESPONSE_FORMAT = """### Formato de respuesta (para cada post):
+RANK_POSITION: [número]
+POST_ID: [id]
+JUSTIFICATION: "[justificación específica]"
+RELEVANCE: "[etiqueta de relevancia]"
+FIT_SCORE: [puntaje]
+
+Solo responde con el formato especificado, sin comentarios adicionales."""
+
+COMPACT_INSTRUCTIONS = """1. Evalúa cada post según su relevancia para la solicitud del usuario
+2. Ordena los posts de más a menos relevante y omite los que no encajan"""
+
+
+def compact_response_format(justify=False):
+    fields = "POST_ID,FIT_SCORE,RELEVANCE" + (",JUSTIFICACION" if justify else "")
+    example = "12,92,alta" + (",Kanban en Python como pide el usuario" if justify else "")
+    return f"""### Formato de respuesta:
+Una línea por post: {fields}
+FIT_SCORE de 0 a 100; RELEVANCE: alta, media o baja{"; JUSTIFICACION breve" if justify else ""}
+Ejemplo: {example}
+
+Solo responde con las líneas, sin encabezados ni comentarios."""
+
+
+def build_search_prompt(user_request, post_results_list, user_tags=None, justify=False):
+    if SEARCH_OUTPUT_FORMAT == "verbose":
+        instructions, response_format = VERBOSE_INSTRUCTIONS, VERBOSE_RESPONSE_FORMAT
+    else:
+        instructions, response_format = COMPACT_INSTRUCTIONS, compact_response_format(justify)
+    return f"""
+Eres un asistente especializado en analizar y clasificar proyectos de código abierto. Tu tarea es rankear posts de proyectos basándote en qué tan bien coinciden con la solicitud del usuario.
+
+### Instrucciones:
+{instructions}
 
 ### Solicitud del usuario:
 {user_request}
@@ -296,75 +541,96 @@ Eres un asistente especializado en analizar y clasificar proyectos de código ab
 ### Posts candidatos:
 {post_results_list}
 
-### Formato de respuesta (para cada post):
-RANK_POSITION: [número]
-POST_ID: [id]
-JUSTIFICATION: "[justificación específica]"
-RELEVANCE: "[etiqueta de relevancia]"
-FIT_SCORE: [puntaje]
-
-Solo responde con el formato especificado, sin comentarios adicionales.
+{response_format}
 """
 
-    try:
-        headers = {
-            "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-            "Content-Type": "application/json"
-        }
 
-        payload = {
-            "model": "deepseek-coder",
-            "messages": [
-                {
-                    "role": "system",
-                    "content": "Analiza y rankea proyectos de código abierto para developers."  # Más corto
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            "temperature": 0.2,      # Reducido para más consistencia
-            "max_tokens": 350,       # Reducido basado en análisis real
-            "top_p": 0.9,            # Añadido para mejor control
-            "frequency_penalty": 0.1  # Reduce repeticiones
-        }
+SEARCH_SYSTEM_PROMPT = "Analiza y rankea proyectos de código abierto para developers."
 
-        response = requests.post(
-            DEEPSEEK_API_URL, headers=headers, json=payload, timeout=30)
-        response.raise_for_status()
 
-        result_text = response.json()["choices"][0]["message"]["content"]
+def build_search_payload(prompt, justify=False):
+    return {
+        "model": "deepseek-coder",
+        "messages": [
+            {
+                "role": "system",
+                "content": SEARCH_SYSTEM_PROMPT  # Más corto
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ],
+        "temperature": 0.2,      # Reducido para más consistencia
+        # Reducido basado en análisis real; las justificaciones del protocolo
+        # compacto se piden solo bajo demanda y necesitan más margen
+        "max_tokens": 700 if justify and SEARCH_OUTPUT_FORMAT != "verbose" else 350,
+        "top_p": 0.9,            # Añadido para mejor control
+        "frequency_penalty": 0.1  # Reduce repeticiones
+    }
+
+
+def build_ai_debug(prompt, result_text, debug_note, usage=None, latency=None):
+    # Tokens reales del usage de la respuesta; si la API no lo envía, se
+    # estiman con el tokenizador local calibrado
+    if usage:
+        input_tokens = usage.get("prompt_tokens") or 0
+        output_tokens = usage.get("completion_tokens") or 0
+    else:
+        input_tokens = deepseek_client.tokenizer.count_messages(
+            build_search_payload(prompt)["messages"])
+        output_tokens = deepseek_client.tokenizer.count(result_text)
+
+    cost = deepseek_client.usage.cost(input_tokens, output_tokens)
+
+    return {
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "total_tokens": input_tokens + output_tokens,
+        "token_source": "usage" if usage else "estimate",
+        "estimated_cost": f"${cost:.6f}",
+        "latency_ms": round(latency * 1000, 1) if latency is not None else None,
+        "model": "deepseek-coder",
+        "raw_output": result_text,
+        "status": debug_note
+    }
 
-        # El resto del procesamiento permanece igual
-        if validate_response_format(result_text):
-            results = parse_ai_response(result_text)
-            debug_note = "✅ Analizado correctamente con DeepSeek"
-        else:
-            results = []
-            debug_note = "⚠️ Formato de respuesta inesperado"
 
-        # Calculamos tokens y costos estimados (DeepSeek es más económico)
-        input_tokens = len(prompt) / 4  # Estimación aproximada
-        output_tokens = len(result_text) / 4
+def AI_search(user_request, post_results_list, user_tags=None, candidate_ids=None, justify=False):
+    prompt = build_search_prompt(user_request, post_results_list, user_tags, justify)
+
+    try:
+        # Cliente con pool keep-alive, timeouts separados y reintentos
+        started = time.monotonic()
+        response_data = deepseek_client.chat(build_search_payload(prompt, justify))
+        latency = time.monotonic() - started
 
-        # Precios de DeepSeek (ejemplo, verificar precios actuales)
-        input_cost_per_token = 0.0000005  # $0.50 por millón de tokens
-        output_cost_per_token = 0.0000015  # $1.50 por millón de tokens
+        result_text = response_data["choices"][0]["message"]["content"]
 
-        estimated_cost = (input_tokens * input_cost_per_token) + \
-            (output_tokens * output_cost_per_token)
+        if SEARCH_OUTPUT_FORMAT == "verbose":
+            results = parse_ai_response(result_text) if validate_response_format(result_text) else []
+        else:
+            # Una sola pasada; acepta salida cortada por max_tokens
+            parser = CompactRankParser(candidate_ids)
+            results = parser.feed(result_text) + parser.finish()
+
+        if results:
+            debug_note = "✅ Analizado correctamente con DeepSeek"
+        else:
+            debug_note = "⚠️ Formato de respuesta inesperado"
 
         return {
             "results": results,
+            "dev_debug": build_ai_debug(prompt, result_text, debug_note,
+                                        usage=response_data.get("usage"), latency=latency)
+        }
+
+    except CircuitOpenError as e:
+        return {
+            "results": [],
             "dev_debug": {
-                "input_tokens": int(input_tokens),
-                "output_tokens": int(output_tokens),
-                "total_tokens": int(input_tokens + output_tokens),
-                "estimated_cost": f"${estimated_cost:.6f}",
-                "model": "deepseek-coder",
-                "raw_output": result_text,
-                "status": debug_note
+                "error": str(e),
+                "status": "Circuit breaker de DeepSeek abierto"
             }
         }
 
@@ -496,8 +762,8 @@ def login_user():
     if not user or not bcrypt.check_password_hash(user.password, password):
         return jsonify({"error": "Invalid email or password"}), 401
 
-    # Crea token JWT para sesión segura
-    access_token = create_access_token(identity=str(user.id))
+    # Crea token JWT para sesión segura (con rol y auth_version en los claims)
+    access_token = create_user_token(user)
 
     # CAMBIO - Generar lista real de posts (my_posts)
     # Recorre la relación "user.say" (posts creados por el usuario)
@@ -543,6 +809,20 @@ def login_user():
     }), 200
 
 
+def run_post_hooks(target, *hooks):
+    """
+    Hooks en memoria tras el commit de un post (índice de búsqueda,
+    autocompletado). La escritura ya está hecha: un fallo se registra en vez
+    de devolver un 500 que haría al cliente repetirla. Los workers que no
+    llegaron a aplicarlo se ponen al día por la firma de la tabla
+    """
+    for hook in hooks:
+        try:
+            hook(target)
+        except Exception as e:
+            logger.error(f"Hook {hook.__name__} falló tras escribir el post: {e}")
+
+
 # ------------------------Routes for New Post------------------------
 @api.route('/user/post/<int:user_id>', methods=['POST'])
 @jwt_required()
@@ -575,7 +855,10 @@ def handle_new_post(user_id):
         )
 
         db.session.add(new_post)
+        db.session.flush()  # id para el vector, que va en la misma transacción
+        embed_post(new_post)
         db.session.commit()
+        run_post_hooks(new_post, index_post, add_post_suggestions)
 
         return jsonify({"message": "Post creado", "post": new_post.serialize()}), 201
 
@@ -586,49 +869,317 @@ def handle_new_post(user_id):
 # ------------------------Routes for Smart Search------------------------
 
 
+def run_smart_search(user_request, user_tags, index, cache_key, justify=False, mode="ai", filters=None):
+    """
+    Ejecuta hybrid_search y guarda el resultado en caché
+    (los errores de DeepSeek y el ranking local de respaldo no se cachean).
+    Las búsquedas idénticas concurrentes comparten una sola llamada a DeepSeek
+    """
+    def search():
+        ai_response = hybrid_search(user_request, index, user_tags, justify, mode, filters)
+        if "error" not in ai_response.get("dev_debug", {}):
+            search_cache.set(cache_key, ai_response)
+        return ai_response
+
+    return search_flights.do(cache_key, search)
+
+
+def run_logged_smart_search(user_request, user_tags, index, cache_key, justify, mode, filters, started):
+    """
+    run_smart_search de los trabajos asíncronos: la búsqueda se registra
+    (api.querylog) al terminar, con el tiempo desde que llegó la petición
+    """
+    ai_response = run_smart_search(user_request, user_tags, index, cache_key, justify, mode, filters)
+    log_search(user_request, user_tags, filters, mode, result=ai_response,
+               total_ms=(time.monotonic() - started) * 1000)
+    return ai_response
+
+
 @api.route('/smart-search', methods=['POST'])
 @jwt_required()
 def smart_search():
+    started = time.monotonic()
     try:
+        # ?async=1: devuelve un job_id al momento y DeepSeek se llama en segundo plano
+        run_async = request.args.get('async', '0').lower() in ('1', 'true')
         data = request.get_json()
         user_request = data.get("user_request")
         user_tags = data.get("user_tags")
+        # Justificaciones bajo demanda (el protocolo compacto no las pide por defecto)
+        justify = bool(data.get("justify"))
+        # mode="local": ranking semántico local sin llamar a DeepSeek
+        mode = "local" if data.get("mode") == "local" else "ai"
+        # Filtros de facetas: {"stack": "python", "level": "junior_dev"}
+        filters = get_facet_filters(data)
 
         if not user_request:
             return jsonify({"error": "User request is required"}), 400
+        if len(user_request) > SEARCH_MAX_REQUEST_LENGTH:
+            return jsonify({"error": f"User request must be at most {SEARCH_MAX_REQUEST_LENGTH} characters"}), 400
 
-        # Obtener todos los posts
-        posts = Post.query.all()
-        post_count = len(posts)
+        # Índice invertido de posts (sincronizado de forma incremental)
+        index = ensure_search_index()
+        if mode == "local" or get_ranker().name == "vector":
+            ensure_vector_index()
 
-        # Generar clave de caché
+        # Generar clave de caché con la versión del corpus. Se usa la firma de la
+        # tabla posts (igual en todos los workers) y no el contador local del
+        # índice, para que la caché compartida sirva a toda la flota
         cache_key = get_search_cache_key(
-            user_request, str(user_tags), post_count)
-
-        # Verificar si existe en caché
-        if hasattr(api, 'search_cache'):
-            cached_result = api.search_cache.get(cache_key)
+            user_request, user_tags, index.signature, justify, mode, filters)
+        suggest_index.record_query(query_normalizer.normalize(user_request).text, user_request)
+
+        # Verificar si existe en caché (LRU local + almacén compartido, ver api.cache)
+        cached_result = search_cache.get(cache_key)
+        if cached_result:
+            log_search(user_request, user_tags, filters, mode, result=cached_result, cache_hit=True,
+                       total_ms=(time.monotonic() - started) * 1000)
+        if cached_result and not run_async:
+            return jsonify(cached_result), 200
+
+        if run_async:
+            owner = get_jwt_identity()
             if cached_result:
-                return jsonify(cached_result), 200
+                job_id = search_jobs.completed(cached_result, owner=owner)
+            else:
+                job_id = search_jobs.submit(
+                    run_logged_smart_search, user_request, user_tags, index, cache_key, justify, mode,
+                    filters, started, owner=owner)
+            return jsonify({
+                "job_id": job_id,
+                "status": "done" if cached_result else "pending",
+                "status_url": url_for('api.get_smart_search_job', job_id=job_id)
+            }), 202
 
         # Si no está en caché, procesar normalmente
-        post_results_list = "\n".join([
-            f"ID: {post.id} | Title: {post.title or '[Untitled]'} | Description: {post.description}"
-            for post in posts
-        ])
-
-        ai_response = hybrid_search(user_request, post_results_list, user_tags)
-
-        # Almacenar en caché
-        if not hasattr(api, 'search_cache'):
-            api.search_cache = {}
-        api.search_cache[cache_key] = ai_response
+        ai_response = run_smart_search(user_request, user_tags, index, cache_key, justify, mode, filters)
+        log_search(user_request, user_tags, filters, mode, result=ai_response,
+                   total_ms=(time.monotonic() - started) * 1000)
 
         return jsonify(ai_response), 200
 
+    except APIException:
+        raise
     except Exception as error:
         logger.error(f"API call failed: {error}")
         return jsonify({"error": str(error)}), 500
+
+
+@api.route('/smart-search/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_smart_search_job(job_id):
+    """
+    Estado/resultado de un trabajo de smart search.
+    ?wait=<segundos> hace long-poll hasta que termine (máximo 25 s)
+    """
+    wait = min(max(request.args.get('wait', 0, type=float), 0), 25)
+    job = search_jobs.get(job_id, wait=wait)
+
+    # Solo el usuario que lanzó la búsqueda puede consultarla
+    if not job or job["owner"] != get_jwt_identity():
+        return jsonify({"error": "Job not found"}), 404
+
+    response = {"job_id": job_id, "status": job["status"]}
+    if job["status"] == "done":
+        response["result"] = job["result"]
+    elif job["status"] == "error":
+        response["error"] = job["error"]
+    return jsonify(response), 200
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@api.route('/smart-search/stream', methods=['POST'])
+@jwt_required()
+def smart_search_stream():
+    """
+    Smart search por Server-Sent Events: primero envía los candidatos del
+    prefiltro (event: candidates), después cada post rankeado en cuanto su
+    bloque llega completo en la respuesta en streaming de DeepSeek
+    (event: result) y al final event: done con dev_debug. Un acierto de
+    caché emite los mismos eventos, y los streams idénticos concurrentes
+    comparten una sola llamada a DeepSeek (search_flights).
+    La búsqueda se registra (api.querylog) al cerrarse el stream
+    """
+    request_started = time.monotonic()
+    data = request.get_json() or {}
+    user_request = data.get("user_request")
+    user_tags = data.get("user_tags")
+    justify = bool(data.get("justify"))
+    filters = get_facet_filters(data)
+
+    if not user_request:
+        return jsonify({"error": "User request is required"}), 400
+    if len(user_request) > SEARCH_MAX_REQUEST_LENGTH:
+        return jsonify({"error": f"User request must be at most {SEARCH_MAX_REQUEST_LENGTH} characters"}), 400
+
+    index = ensure_search_index()
+    if get_ranker().name == "vector":
+        ensure_vector_index()
+    cache_key = get_search_cache_key(user_request, user_tags, index.signature, justify, filters=filters)
+    suggest_index.record_query(query_normalizer.normalize(user_request).text, user_request)
+    corrections = query_corrections(user_request, index)
+    filtered_posts = filter_posts_by_keywords(user_request, index, filters=filters, corrections=corrections)
+    suggestion = did_you_mean(user_request, corrections)
+    facets = search_facets(user_request, index, filters, corrections)
+    prefilter = prefilter_debug(request_started)
+
+    def generate():
+        # result: resultado final para el registro de búsquedas;
+        # shared: el que se entrega a las búsquedas idénticas que esperan
+        outcome = {"result": None, "shared": None, "cache_hit": False}
+        lead = False
+        try:
+            # Antes de llamar a DeepSeek: caché y, si otra búsqueda idéntica
+            # está en curso (en este worker u otro), esperar su resultado
+            cached_result = search_cache.get(cache_key)
+            if cached_result is None:
+                cached_result, lead = search_flights.begin(cache_key)
+            outcome["cache_hit"] = cached_result is not None
+            yield from events(outcome, cached_result)
+        finally:
+            if lead:
+                search_flights.end(cache_key, outcome["shared"])
+            log_search(user_request, user_tags, filters, result=outcome["result"],
+                       cache_hit=outcome["cache_hit"], total_ms=(time.monotonic() - request_started) * 1000)
+
+    def share(outcome, result, cache=True):
+        outcome["result"] = outcome["shared"] = result
+        if cache:
+            search_cache.set(cache_key, result)
+
+    def events(outcome, cached_result):
+        # Mismos eventos con o sin caché: candidates, result... y done
+        yield sse_event("candidates", {
+            "candidates": filtered_posts,
+            "filtered_count": len(filtered_posts),
+            "did_you_mean": suggestion,
+            "facets": facets
+        })
+        if cached_result:
+            outcome["result"] = cached_result
+            for result in cached_result["results"]:
+                yield sse_event("result", result)
+            yield sse_event("done", {"dev_debug": cached_result.get("dev_debug"), "cached": True})
+            return
+
+        if not filtered_posts:
+            dev_debug = {
+                "status": "No relevant posts found in initial filtering",
+                "filtered_count": 0,
+                **prefilter
+            }
+            share(outcome, {"results": [], "dev_debug": dev_debug, "did_you_mean": suggestion, "facets": facets})
+            yield sse_event("done", {"dev_debug": dev_debug})
+            return
+
+        reduced_list, prompt_stats = fit_candidates(user_request, filtered_posts, user_tags, justify=justify)
+        if not prompt_stats["candidates_in_prompt"]:
+            local = local_ranking(filtered_posts, dict(prompt_stats, initial_filtered_count=len(filtered_posts),
+                                                       **prefilter),
+                                  status=PROMPT_FULL_STATUS)
+            share(outcome, dict(local, did_you_mean=suggestion, facets=facets))
+            for result in local["results"]:
+                yield sse_event("result", result)
+            yield sse_event("done", {"dev_debug": local["dev_debug"]})
+            return
+        prompt = build_search_prompt(user_request, reduced_list, user_tags, justify)
+        started = time.monotonic()
+        parser = make_rank_parser(
+            [post["id"] for post in filtered_posts[:prompt_stats["candidates_in_prompt"]]])
+        chunks = []
+        results = []
+        usage = {}  # lo rellena stream_chat con el usage del último evento
+        try:
+            for chunk in deepseek_client.stream_chat(build_search_payload(prompt, justify), usage):
+                chunks.append(chunk)
+                for result in parser.feed(chunk):
+                    results.append(result)
+                    yield sse_event("result", result)
+            for result in parser.finish():
+                results.append(result)
+                yield sse_event("result", result)
+        except Exception as e:
+            if not isinstance(e, CircuitOpenError):
+                logger.error(f"Error en streaming de DeepSeek: {str(e)}")
+            if results:
+                outcome["result"] = {"results": results, "dev_debug": {
+                    "initial_filtered_count": len(filtered_posts), **prefilter}}
+                yield sse_event("error", {"error": str(e), "status": "Error de API DeepSeek"})
+                return
+            # Nada enviado todavía: se sirve el ranking local del prefiltro
+            fallback = local_ranking(filtered_posts, {"error": str(e), **prefilter,
+                                                      "initial_filtered_count": len(filtered_posts)})
+            # como en run_smart_search: se comparte con los que esperan pero no se cachea
+            share(outcome, fallback, cache=False)
+            for result in fallback["results"]:
+                yield sse_event("result", result)
+            yield sse_event("done", {"dev_debug": fallback["dev_debug"]})
+            return
+
+        result_text = "".join(chunks)
+        debug_note = "✅ Analizado correctamente con DeepSeek" if results \
+            else "⚠️ Formato de respuesta inesperado"
+        dev_debug = build_ai_debug(prompt, result_text, debug_note, usage=usage or None,
+                                   latency=time.monotonic() - started)
+        dev_debug["initial_filtered_count"] = len(filtered_posts)
+        dev_debug["initial_filtering"] = "Applied"
+        dev_debug.update(prefilter)
+        dev_debug.update(prompt_stats)
+
+        results.sort(key=lambda x: x["rank_position"])
+        share(outcome, {"results": results, "dev_debug": dev_debug,
+                        "did_you_mean": suggestion, "facets": facets})
+        yield sse_event("done", {"dev_debug": dev_debug})
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@api.route('/search/suggest', methods=['GET'])
+@jwt_required()
+def search_suggest():
+    """
+    Autocompletado mientras el usuario escribe: ?q=<prefijo>&limit=<n> (máximo 20).
+    Se sirve de la memoria del worker (api.suggest), sin el índice de
+    búsqueda ni DeepSeek
+    """
+    prefix = request.args.get('q', '')
+    limit = min(max(request.args.get('limit', 8, type=int), 1), 20)
+    suggestions = ensure_suggest_index().suggest(prefix, limit)
+    return jsonify({"query": prefix, "suggestions": suggestions}), 200
+
+
+@api.route('/admin/search-cache', methods=['GET'])
+@admin_required
+def admin_search_cache_stats():
+    """
+    Contadores de la caché de smart search de este worker (monitorización)
+    """
+    stats = search_cache.stats()
+    stats["single_flight"] = search_flights.stats()
+    stats["query_normalizer"] = query_normalizer.stats()
+    stats["deepseek_circuit"] = deepseek_client.breaker.stats()
+    stats["deepseek_usage"] = deepseek_client.usage.stats()
+    stats["deepseek_usage"]["token_calibration"] = round(deepseek_client.tokenizer.factor, 4)
+    stats["search_log"] = search_log.stats()
+    return jsonify(stats), 200
+
+
+@api.route('/admin/search-log', methods=['GET'])
+@admin_required
+def admin_search_log():
+    """
+    Analítica del registro de búsquedas (api.querylog) de los últimos
+    ?days=<n> días (7 por defecto): percentiles p50/p95 de latencia total,
+    del prefiltro y de DeepSeek, tasas de caché y de búsquedas vacías,
+    tokens y las ?top=<n> consultas más frecuentes (máximo 100)
+    """
+    days = min(max(request.args.get('days', 7, type=int), 1), 365)
+    top = min(max(request.args.get('top', 20, type=int), 1), 100)
+    return jsonify(search_log_report(days, top)), 200
 # ------------------------Routes for comments a post------------------------
 
 
@@ -646,27 +1197,23 @@ def handle_post_comments(post_id):
             comments = Comments.query.filter_by(post_id=post_id).options(
                 joinedload(Comments.author)).all()
 
-            # Serializar los comentarios
+            # Comentarios a los que el usuario actual ha dado like (una sola consulta)
+            current_user_id = get_jwt_identity()
+            liked_ids = set()
+            if current_user_id and comments:
+                liked_ids = {
+                    like.comments_id for like in Likes.query.filter(
+                        Likes.user_id == current_user_id,
+                        Likes.comments_id.in_([c.id for c in comments])
+                    ).all()
+                }
+
+            # Serializar los comentarios (like_count ya viene en serialize)
             comments_data = []
             for comment in comments:
                 comment_data = comment.serialize()
-
-                # Agregar información de likes si no está incluida en serialize
-                if not hasattr(comment_data, 'like_count'):
-                    # Obtener el conteo de likes para este comentario
-                    like_count = Likes.query.filter_by(
-                        comments_id=comment.id).count()
-                    comment_data['like_count'] = like_count
-
-                    # Verificar si el usuario actual ha dado like a este comentario
-                    current_user_id = get_jwt_identity()
-                    if current_user_id:
-                        user_has_liked = Likes.query.filter_by(
-                            user_id=current_user_id,
-                            comments_id=comment.id
-                        ).first() is not None
-                        comment_data['has_liked'] = user_has_liked
-
+                if current_user_id:
+                    comment_data['has_liked'] = comment.id in liked_ids
                 comments_data.append(comment_data)
 
             return jsonify({
@@ -698,6 +1245,7 @@ def handle_post_comments(post_id):
                 text=text
             )
             db.session.add(comment)
+            adjust_counter(Post.comment_count, post_id, 1)
             db.session.commit()
 
             # Para devolver el comentario recién creado, cargamos el autor
@@ -744,16 +1292,21 @@ def handle_post_by_id(post_id):
             post.repo_URL = data.get('repo_URL', post.repo_URL)
             post.level = data.get('level', post.level)
             post.stack = data.get('stack', post.stack)
+            post.updated_at = datetime.now(UTC)
+            embed_post(post)
             db.session.commit()
+            run_post_hooks(post, index_post, add_post_suggestions)
             return jsonify({"msg": "Post updated successfully", "post": post.serialize()}), 200
-        except KeyError as e:
+        except Exception as e:
             db.session.rollback()
             return jsonify({"msg": f"Server error: {str(e)}"}), 500
     # DELETE method to remove the post
     elif request.method == 'DELETE':
         try:
+            unembed_post(post_id)
             db.session.delete(post)
             db.session.commit()
+            run_post_hooks(post_id, unindex_post, remove_post_suggestions)
             return jsonify({"msg": "Post deleted successfully"}), 200
         except Exception as e:
             db.session.rollback()
@@ -847,70 +1400,110 @@ def handle_user_profile(user_id):
 # ------------------------Routes for Get all Posts------------------------
 
 
+def serialize_feed_rows(rows):
+    """
+    Serializa las filas (post, comment_likes) de Post.query_with_stats para el feed
+    """
+    posts_data = []
+    for post, comment_likes in rows:
+        author = post.author
+
+        # Si el autor no existe (fue borrado), proporcionamos datos por defecto
+        # en lugar de dejar que la aplicación se estrelle.
+        author_info = {
+            "username": "Usuario Desconocido",
+            "avatar": None
+        }
+        if author:
+            author_info["username"] = author.username
+            author_info["avatar"] = author.image_URL if hasattr(
+                author, 'image_URL') else None
+
+        post_data = post.serialize()
+        post_data.update({
+            "author_info": author_info,
+            "stats": {
+                "comments": post.comment_count,
+                "likes": comment_likes  # Likes totales en todos los comentarios del post
+            }
+        })
+        posts_data.append(post_data)
+    return posts_data
+
+
 @api.route('/posts', methods=['GET'])
 def get_all_posts():
     # This endpoint retrieves all posts with pagination, author info, and comment stats
+    # ?stack=&level= filtran en el servidor (índice ix_posts_stack_level_id) y
+    # la respuesta incluye los conteos por faceta de un solo GROUP BY
     try:
+        filters = get_facet_filters(request.args)
+        posts_query = Post.query_with_stats()
+        for facet in FACETS:
+            if filters[facet] is not None:
+                posts_query = posts_query.filter(getattr(Post, facet) == filters[facet])
+
+        # Cursor mode (?after=<cursor>&limit=): keyset over id DESC, no OFFSET/COUNT
+        cursor_args = get_cursor_args(request.args)
+        if cursor_args is not None:
+            after = decode_cursor(cursor_args["after"], int) \
+                if cursor_args["after"] else None
+            rows, has_more = keyset_page(
+                posts_query, [Post.id], after, cursor_args["limit"])
+
+            pagination = {
+                "next_cursor": encode_cursor(rows[-1][0].id) if has_more else None,
+                "has_more": has_more,
+                "limit": cursor_args["limit"]
+            }
+            response = {
+                "success": True,
+                "posts": serialize_feed_rows(rows),
+                "pagination": pagination
+            }
+            # Conteos solo en la primera página (o con with_total): las
+            # siguientes páginas siguen sin agregados
+            if after is None or cursor_args["with_total"]:
+                grid = facet_grid()
+                response["facets"] = facet_counts(grid, filters)
+                if cursor_args["with_total"]:
+                    pagination["total_posts"] = count_filtered(grid, filters)
+
+            return jsonify(response), 200
+
         # Pagination parameters
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
 
-        posts_query = Post.query.order_by(Post.id.desc())
-        posts_paginated = posts_query.paginate(
-            page=page, per_page=per_page, error_out=False)
-
-        if not posts_paginated.items:
-            return jsonify({"msg": "No posts found"}), 404
-
-        posts_data = []
-        for post in posts_paginated.items:
-            author = User.query.get(post.user_id)
+        # Mismos valores por defecto que paginate(error_out=False)
+        page = page if page > 0 else 1
+        per_page = per_page if per_page > 0 else 20
 
-            # Si el autor no existe (fue borrado), proporcionamos datos por defecto
-            # en lugar de dejar que la aplicación se estrelle.
-            author_info = {
-                "username": "Usuario Desconocido",
-                "avatar": None
-            }
-            if author:
-                author_info["username"] = author.username
-                author_info["avatar"] = author.image_URL if hasattr(
-                    author, 'image_URL') else None
+        # Una sola consulta: posts + autor + likes de comentarios agregados
+        rows = posts_query.order_by(Post.id.desc()) \
+            .limit(per_page).offset((page - 1) * per_page).all()
 
-            # get the comments for the post and count them
-            comments = Comments.query.filter_by(post_id=post.id).all()
-            comment_count = len(comments)
+        if not rows:
+            return jsonify({"msg": "No posts found"}), 404
 
-            # get the total likes for each comment and sum them up
-            total_likes = 0
-            for comment in comments:
-                total_likes += Likes.query.filter_by(
-                    comments_id=comment.id).count()
-
-            post_data = post.serialize()
-            post_data.update({
-                "author_info": {
-                    "username": author.username,
-                    "avatar": author.image_URL if hasattr(author, 'image_URL') else None
-                },
-                "stats": {
-                    "comments": comment_count,
-                    "likes": total_likes  # Likes totales en todos los comentarios del post
-                }
-            })
-            posts_data.append(post_data)
+        # El total sale de la misma rejilla de facetas (sin COUNT aparte)
+        grid = facet_grid()
+        total_posts = count_filtered(grid, filters)
 
         return jsonify({
             "success": True,
-            "posts": posts_data,
+            "posts": serialize_feed_rows(rows),
+            "facets": facet_counts(grid, filters),
             "pagination": {
-                "total_posts": posts_paginated.total,
+                "total_posts": total_posts,
                 "current_page": page,
                 "posts_per_page": per_page,
-                "total_pages": posts_paginated.pages
+                "total_pages": math.ceil(total_posts / per_page)
             }
         }), 200
 
+    except APIException:
+        raise
     except Exception as e:
         print(f"Error en get_all_posts: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -927,50 +1520,21 @@ def get_user_post(user_id):
     if current_user_id != user_id:
         return jsonify({"error": "Unauthorized User"}), 403
 
-    # subquery for caount the comment in each post
-    comment_count_subquery = db.session.query(
-        Comments.post_id,
-        func.count(Comments.post_id).label('comment_count')
-    ).group_by(Comments.post_id).subquery()
-
-    # subquery for count the like in each post
-    post_like_subquery = db.session.query(
-        Likes.post_id,
-        func.count(Likes.id).label('post_likes')
-    ).filter(Likes.post_id.isnot(None)) \
-        .group_by(Likes.post_id).subquery()
-
-    # subquery for count the like in each comment
-    comment_likes_subquery = db.session.query(
-        Comments.post_id,
-        func.count(Likes.id).label('comment_likes')
-    ).join(Likes, Likes.comments_id == Comments.id) \
-        .group_by(Comments.post_id).subquery()
-
-    # we have here all the subquery with user's post table
-    posts_query = db.session.query(
-        Post,
-        comment_count_subquery.c.comment_count,
-        post_like_subquery.c.post_likes,
-        comment_likes_subquery.c.comment_likes
-    ).outerjoin(comment_count_subquery,  Post.id == comment_count_subquery.c.post_id)\
-        .outerjoin(post_like_subquery, Post.id == post_like_subquery.c.post_id) \
-        .outerjoin(comment_likes_subquery, Post.id == comment_likes_subquery.c.post_id)\
-        .filter(Post.user_id == user_id).order_by(Post.id.desc())
-
-    results = posts_query.all()
+    # posts + likes of their comments in one query (comment and post like
+    # counts are denormalized columns on Post)
+    results = Post.query_with_stats().filter(
+        Post.user_id == user_id).order_by(Post.id.desc()).all()
+
+    posts = [post for post, _ in results]
+    posts_data = Post.serialize_many(posts)
 
     # If the list is empty we return 200 OK
-    posts_data = []
-    for post, comment_count, post_likes, comment_likes in results:
+    for post_info, (post, comment_likes) in zip(posts_data, results):
         # sum the total likes of posts and comments for obtain the total
-        total_likes = (post_likes or 0) + (comment_likes or 0)
-        post_info = post.serialize()
         post_info['stats'] = {
-            'comments': comment_count or 0,
-            'likes': total_likes or 0
+            'comments': post.comment_count,
+            'likes': post.like_count + comment_likes
         }
-        posts_data.append(post_info)
 
     user = User.query.get(user_id)
 
@@ -1032,6 +1596,7 @@ def handle_favorites():
 
         new_favorite = Favorites(user_id=user_id, post_id=post_id)
         db.session.add(new_favorite)
+        adjust_counter(Post.favorite_count, post_id, 1)
         db.session.commit()
 
         # Obtener el post completo para incluirlo en la respuesta
@@ -1076,6 +1641,7 @@ def delete_favorite(favorite_id):
     post_id = favorite.post_id
 
     db.session.delete(favorite)
+    adjust_counter(Post.favorite_count, post_id, -1)
     db.session.commit()
 
     return jsonify({
@@ -1104,6 +1670,7 @@ def handle_post_like(post_id):
 
         new_like = Likes(user_id=current_user, post_id=post_id)
         db.session.add(new_like)
+        adjust_counter(Post.like_count, post_id, 1)
         db.session.commit()
         return jsonify({"message": "Post liked", "like": new_like.serialize()}), 200
 
@@ -1112,6 +1679,7 @@ def handle_post_like(post_id):
             return jsonify({"error": "Post is not liked"}), 404
 
         db.session.delete(existing_like)
+        adjust_counter(Post.like_count, post_id, -1)
         db.session.commit()
         return jsonify({"msg": "Post unliked succesfully"}), 200
 
@@ -1146,6 +1714,8 @@ def like_comment(comment_id):
                 comments_id=comment_id
             )
             db.session.add(new_like)
+            adjust_counter(Comments.like_count, comment_id, 1)
+            adjust_counter(Post.comment_like_count, comment.post_id, 1)
             message = "Comment liked successfully"
 
         elif request.method == 'DELETE':
@@ -1156,18 +1726,17 @@ def like_comment(comment_id):
                 }), 404
 
             db.session.delete(existing_like)
+            adjust_counter(Comments.like_count, comment_id, -1)
+            adjust_counter(Post.comment_like_count, comment.post_id, -1)
             message = "Comment unliked successfully"
 
         db.session.commit()
 
-        # Obtener información actualizada
-        like_count = Likes.query.filter_by(comments_id=comment_id).count()
+        # Obtener información actualizada (contador desnormalizado)
+        like_count = comment.like_count
 
-        # Verificar si el usuario actual ha dado like después de la operación
-        current_user_has_liked = Likes.query.filter_by(
-            user_id=current_user_id,
-            comments_id=comment_id
-        ).first() is not None
+        # Tras la operación el usuario tiene like solo si acaba de darlo
+        current_user_has_liked = request.method == 'POST'
 
         return jsonify({
             "success": True,
@@ -1244,22 +1813,59 @@ def get_all_users():
         if is_admin is not None:
             query = query.filter(User.is_admin == is_admin)
 
-        # Apply ordering asc or desc
-        if order == 'asc':
-            query = query.order_by(getattr(User, sort_field).asc())
+        # Cursor mode (?after=<cursor>&limit=): keyset over (sort_field, id),
+        # only for indexed sort fields
+        cursor_args = get_cursor_args(request.args)
+        if cursor_args is not None:
+            if sort_field not in ('id', 'member_since'):
+                raise APIException(
+                    "Cursor pagination only supports sort=id or sort=member_since", status_code=400)
+
+            order_columns = [User.id] if sort_field == 'id' else [User.member_since, User.id]
+            cursor_types = [int] if sort_field == 'id' else [datetime.fromisoformat, int]
+            after = decode_cursor(cursor_args["after"], *cursor_types) \
+                if cursor_args["after"] else None
+
+            users, has_more = keyset_page(
+                query, order_columns, after, cursor_args["limit"], descending=(order != 'asc'))
+
+            next_cursor = None
+            if has_more:
+                last = users[-1]
+                next_cursor = encode_cursor(last.id) if sort_field == 'id' \
+                    else encode_cursor(last.member_since, last.id)
+
+            pagination = {
+                "next_cursor": next_cursor,
+                "has_more": has_more,
+                "limit": cursor_args["limit"]
+            }
+            if cursor_args["with_total"]:
+                pagination["total_users"] = query.count()
         else:
-            query = query.order_by(getattr(User, sort_field).desc())
+            # Apply ordering asc or desc
+            if order == 'asc':
+                query = query.order_by(getattr(User, sort_field).asc())
+            else:
+                query = query.order_by(getattr(User, sort_field).desc())
 
-        # Paginate the query results for page and per_page
-        users_paginated = query.paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
-        )
+            # Paginate the query results for page and per_page
+            users_paginated = query.paginate(
+                page=page,
+                per_page=per_page,
+                error_out=False
+            )
+            users = users_paginated.items
+            pagination = {
+                "total_users": users_paginated.total,
+                "current_page": page,
+                "users_per_page": per_page,
+                "total_pages": users_paginated.pages
+            }
 
         # Response data
         users_data = []
-        for user in users_paginated.items:
+        for user in users:
             user_data = {
                 "id": user.id,
                 "email": user.email,
@@ -1277,12 +1883,7 @@ def get_all_users():
         return jsonify({
             "success": True,
             "users": users_data,
-            "pagination": {
-                "total_users": users_paginated.total,
-                "current_page": page,
-                "users_per_page": per_page,
-                "total_pages": users_paginated.pages
-            },
+            "pagination": pagination,
             "filters": {
                 "applied": {
                     "search": search,
@@ -1295,6 +1896,8 @@ def get_all_users():
             }
         }), 200
 
+    except APIException:
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({"msg": "Error to obtain the Users' List", "error": str(e)}), 500
@@ -1345,12 +1948,36 @@ def admin_manage_user(user_id):
 
         elif request.method == 'DELETE':
             try:
+                # Posts y comentarios ajenos cuyos contadores cambian al borrar
+                # la actividad del usuario
+                affected_post_ids = {
+                    row[0] for row in db.session.query(Likes.post_id).filter(
+                        Likes.user_id == user_id, Likes.post_id.isnot(None))
+                }
+                affected_post_ids |= {
+                    row[0] for row in db.session.query(Favorites.post_id).filter_by(user_id=user_id)
+                }
+                affected_post_ids |= {
+                    row[0] for row in db.session.query(Comments.post_id).filter_by(user_id=user_id)
+                }
+                affected_comment_ids = {
+                    row[0] for row in db.session.query(Likes.comments_id).filter(
+                        Likes.user_id == user_id, Likes.comments_id.isnot(None))
+                }
+                # la suma de likes de comentarios de sus posts también cambia
+                affected_post_ids |= {
+                    row[0] for row in db.session.query(Comments.post_id).filter(
+                        Comments.id.in_(affected_comment_ids))
+                }
+
                 # Eliminar en cascada todas las dependencias
 
                 # 1. Eliminar posts del usuario (con sus comentarios y favoritos)
+                deleted_post_ids = [post.id for post in user.say]
                 for post in user.say:
                     Comments.query.filter_by(post_id=post.id).delete()
                     Favorites.query.filter_by(post_id=post.id).delete()
+                    unembed_post(post.id)
                     db.session.delete(post)
 
                 # 2. Eliminar comentarios hechos por el usuario
@@ -1362,10 +1989,18 @@ def admin_manage_user(user_id):
                 # 4. Eliminar likes del usuario
                 Likes.query.filter_by(user_id=user_id).delete()
 
+                # 5. Recalcular contadores de lo afectado
+                db.session.flush()
+                rebuild_counters(post_ids=affected_post_ids,
+                                 comment_ids=affected_comment_ids)
+
                 # Finalmente eliminar el usuario
                 db.session.delete(user)
                 db.session.commit()
 
+                for post_id in deleted_post_ids:
+                    run_post_hooks(post_id, unindex_post, remove_post_suggestions)
+
                 return jsonify({
                     "message": "Usuario eliminado permanentemente con todas sus dependencias",
                     "deleted_user_id": user_id
@@ -1393,6 +2028,23 @@ def admin_get_posts():
     Obtiene todos los posts (sin parámetro admin inyectado)
     """
     try:
+        # Modo cursor (?after=<cursor>&limit=): keyset sobre id DESC
+        cursor_args = get_cursor_args(request.args)
+        if cursor_args is not None:
+            after = decode_cursor(cursor_args["after"], int) \
+                if cursor_args["after"] else None
+            posts, has_more = keyset_page(
+                Post.query, [Post.id], after, cursor_args["limit"])
+
+            response = {
+                "posts": Post.serialize_many(posts),
+                "next_cursor": encode_cursor(posts[-1].id) if has_more else None,
+                "has_more": has_more
+            }
+            if cursor_args["with_total"]:
+                response["total"] = Post.query.count()
+            return jsonify(response), 200
+
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
 
@@ -1402,7 +2054,7 @@ def admin_get_posts():
             error_out=False
         )
 
-        posts_data = [post.serialize() for post in posts.items]
+        posts_data = Post.serialize_many(posts.items)
 
         return jsonify({
             "posts": posts_data,
@@ -1411,6 +2063,8 @@ def admin_get_posts():
             "current_page": page
         }), 200
 
+    except APIException:
+        raise
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -1436,7 +2090,7 @@ def handle_single_admin_post(post_id):
             'username': post.author.username,
             'email': post.author.email
         }
-        post_data['comments'] = [c.serialize() for c in post.reply]
+        post_data['comments'] = Comments.serialize_many(post.reply)
         return jsonify(post_data), 200
 
     elif request.method == 'DELETE':
@@ -1444,8 +2098,10 @@ def handle_single_admin_post(post_id):
             # Eliminar en cascada
             Comments.query.filter_by(post_id=post_id).delete()
             Favorites.query.filter_by(post_id=post_id).delete()
+            unembed_post(post_id)
             db.session.delete(post)
             db.session.commit()
+            run_post_hooks(post_id, unindex_post, remove_post_suggestions)
             return jsonify({
                 "message": "Post eliminado permanentemente",
                 "deleted_id": post_id
@@ -1464,6 +2120,23 @@ def admin_get_comments():
     Obtiene todos los comentarios (sin parámetro admin inyectado)
     """
     try:
+        # Modo cursor (?after=<cursor>&limit=): keyset sobre id DESC
+        cursor_args = get_cursor_args(request.args)
+        if cursor_args is not None:
+            after = decode_cursor(cursor_args["after"], int) \
+                if cursor_args["after"] else None
+            comments, has_more = keyset_page(
+                Comments.query, [Comments.id], after, cursor_args["limit"])
+
+            response = {
+                "comments": Comments.serialize_many(comments),
+                "next_cursor": encode_cursor(comments[-1].id) if has_more else None,
+                "has_more": has_more
+            }
+            if cursor_args["with_total"]:
+                response["total"] = Comments.query.count()
+            return jsonify(response), 200
+
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
 
@@ -1473,7 +2146,7 @@ def admin_get_comments():
             error_out=False
         )
 
-        comments_data = [comment.serialize() for comment in comments.items]
+        comments_data = Comments.serialize_many(comments.items)
 
         return jsonify({
             "comments": comments_data,
@@ -1482,6 +2155,8 @@ def admin_get_comments():
             "current_page": page
         }), 200
 
+    except APIException:
+        raise
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -1513,6 +2188,8 @@ def handle_single_admin_comment(comment_id):
         try:
             # Eliminar en cascada
             Likes.query.filter_by(comments_id=comment_id).delete()
+            adjust_counter(Post.comment_count, comment.post_id, -1)
+            adjust_counter(Post.comment_like_count, comment.post_id, -comment.like_count)
             db.session.delete(comment)
             db.session.commit()
             return jsonify({
@@ -1538,7 +2215,7 @@ def admin_dashboard():
             "total_users": User.query.count(),
             "active_users": User.query.filter_by(is_active=True).count(),
             "total_posts": Post.query.count(),
-            "recent_posts": [p.serialize() for p in Post.query.order_by(Post.id.desc()).limit(5).all()],
+            "recent_posts": Post.serialize_many(Post.query.order_by(Post.id.desc()).limit(5).all()),
             "total_comments": Comments.query.count(),
             "your_admin_id": current_admin_id  # Solo información de referencia
         }
@@ -1622,17 +2299,18 @@ def create_stripe_session():
 @jwt_required()
 def delete_comment(comment_id):
     try:
-        current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        current_user_id = int(get_jwt_identity())
 
         comment = Comments.query.get(comment_id)
         if not comment:
             return jsonify({"error": "Comment not found"}), 404
 
-        # Permitir borrar si es admin o autor del comentario
-        if not user or (not user.is_admin and comment.user_id != user.id):
+        # Permitir borrar si es admin (según el token) o autor del comentario
+        if not token_is_admin() and comment.user_id != current_user_id:
             return jsonify({"error": "Unauthorized. Only admin or author can delete"}), 403
 
+        adjust_counter(Post.comment_count, comment.post_id, -1)
+        adjust_counter(Post.comment_like_count, comment.post_id, -comment.like_count)
         db.session.delete(comment)
         db.session.commit()
 
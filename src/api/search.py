@@ -0,0 +1,547 @@
+"""
+Índice invertido en memoria para el prefiltro por palabras clave de smart search.
+Cada worker mantiene su propia copia construida desde la tabla posts.
+"""
+from api.models import db, Post
+from sqlalchemy import func
+import os
+import math
+import re
+import heapq
+import threading
+from bisect import bisect_left, insort
+
+# Palabras comunes a ignorar (stop words)
+STOP_WORDS = {
+    "the", "a", "an", "and", "or", "but", "in", "on", "at", "to",
+    "for", "of", "with", "by", "is", "are", "was", "were", "be", "been",
+    "this", "that", "these", "those", "i", "you", "he", "she", "it", "we",
+    "they", "my", "your", "his", "her", "its", "our", "their", "what",
+    "which", "who", "whom", "where", "when", "why", "how", "can", "could",
+    "would", "should", "may", "might", "must", "will", "shall", "about"
+}
+
+TOKEN_PATTERN = re.compile(r"[a-z]+")
+
+# Facetas filtrables de los posts, en el orden de las claves de la rejilla
+# {(stack, level): número de posts}
+FACETS = ("stack", "level")
+
+
+def tokenize(text):
+    """
+    Divide un texto en términos alfabéticos en minúsculas
+    """
+    return TOKEN_PATTERN.findall((text or "").lower())
+
+
+def trigrams(term):
+    """
+    Trigramas de caracteres de un término, con relleno para que el inicio y el
+    final cuenten ("  p", " py", ..., "on ")
+    """
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b, limit):
+    """
+    Distancia de Damerau-Levenshtein (con transposiciones adyacentes).
+    Corta en cuanto supera limit y devuelve limit + 1
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if previous2 is not None and i > 1 and j > 1 and \
+                    a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class SearchIndex:
+    """
+    Índice invertido término -> {post_id: [tf_title, tf_description]}.
+    La selección de candidatos solo recorre las posting lists de los términos
+    de la consulta, no todo el corpus.
+    Un índice de trigramas sobre el vocabulario (trigrama -> términos) permite
+    corregir erratas sin recorrer todo el vocabulario.
+    version es monotónica: sube con cada construcción o cambio incremental y
+    forma parte de las claves de caché.
+    facet_grid cuenta los posts por (stack, level) para las facetas sin
+    recorrer el corpus
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.postings = {}
+        self.docs = {}
+        self.vocabulary = []
+        self.trigram_index = {}
+        self.facet_grid = {}
+        # estadísticas del corpus para BM25: suma de longitudes por campo
+        self.field_totals = [0, 0]
+        self.signature = None
+        self.version = 0
+
+    def build(self, posts, signature=None):
+        """
+        Reconstruye el índice completo a partir de una lista de Post
+        """
+        postings = {}
+        docs = {}
+        field_totals = [0, 0]
+        facet_grid = {}
+        for post in posts:
+            doc = self._make_doc(post)
+            docs[post.id] = doc
+            self._add_postings(postings, post.id, doc)
+            facet_grid[doc["facets"]] = facet_grid.get(doc["facets"], 0) + 1
+            field_totals[0] += doc["lengths"][0]
+            field_totals[1] += doc["lengths"][1]
+
+        trigram_index = {}
+        for term in postings:
+            for gram in trigrams(term):
+                trigram_index.setdefault(gram, set()).add(term)
+
+        with self.lock:
+            self.postings = postings
+            self.docs = docs
+            self.vocabulary = sorted(postings)
+            self.trigram_index = trigram_index
+            self.facet_grid = facet_grid
+            self.field_totals = field_totals
+            self.signature = signature
+            self.version += 1
+
+    def _make_doc(self, post):
+        title = post.title or "[Untitled]"
+        description = post.description or ""
+        terms = (tokenize(post.title), tokenize(description))
+        return {
+            "id": post.id,
+            "title": title,
+            "description": description,
+            "terms": terms,
+            "lengths": (len(terms[0]), len(terms[1])),
+            "facets": (post.stack, post.level)
+        }
+
+    @staticmethod
+    def _add_postings(postings, post_id, doc):
+        for field, terms in enumerate(doc["terms"]):
+            for term in terms:
+                entry = postings.setdefault(term, {}).get(post_id)
+                if entry is None:
+                    entry = postings[term][post_id] = [0, 0]
+                entry[field] += 1
+
+    def index_post(self, post):
+        """
+        Añade o actualiza un post. Devuelve False si el contenido indexado no
+        cambió (la versión no sube)
+        """
+        doc = self._make_doc(post)
+        with self.lock:
+            old = self.docs.get(post.id)
+            if old is not None:
+                if (old["title"], old["description"], old["facets"]) == \
+                        (doc["title"], doc["description"], doc["facets"]):
+                    return False
+                self._remove_doc(post.id, old)
+
+            for term in set(doc["terms"][0]) | set(doc["terms"][1]):
+                if term not in self.postings:
+                    insort(self.vocabulary, term)
+                    for gram in trigrams(term):
+                        self.trigram_index.setdefault(gram, set()).add(term)
+            self._add_postings(self.postings, post.id, doc)
+            self.docs[post.id] = doc
+            self.facet_grid[doc["facets"]] = self.facet_grid.get(doc["facets"], 0) + 1
+            self.field_totals[0] += doc["lengths"][0]
+            self.field_totals[1] += doc["lengths"][1]
+            self.version += 1
+        return True
+
+    def remove_post(self, post_id):
+        """
+        Elimina un post del índice. Devuelve False si no estaba indexado
+        """
+        with self.lock:
+            doc = self.docs.pop(post_id, None)
+            if doc is None:
+                return False
+            self._remove_doc(post_id, doc)
+            self.version += 1
+        return True
+
+    def _remove_doc(self, post_id, doc):
+        for term in set(doc["terms"][0]) | set(doc["terms"][1]):
+            postings = self.postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(post_id, None)
+            if not postings:
+                del self.postings[term]
+                i = bisect_left(self.vocabulary, term)
+                if i < len(self.vocabulary) and self.vocabulary[i] == term:
+                    del self.vocabulary[i]
+                for gram in trigrams(term):
+                    terms = self.trigram_index.get(gram)
+                    if terms is not None:
+                        terms.discard(term)
+                        if not terms:
+                            del self.trigram_index[gram]
+        self.field_totals[0] -= doc["lengths"][0]
+        self.field_totals[1] -= doc["lengths"][1]
+        self.facet_grid[doc["facets"]] -= 1
+        if not self.facet_grid[doc["facets"]]:
+            del self.facet_grid[doc["facets"]]
+
+    def expand(self, keyword):
+        """
+        Términos del vocabulario que empiezan por keyword (coincidencia parcial),
+        sin incluir el propio keyword. Búsqueda binaria sobre el vocabulario ordenado.
+        Solo prefijos, no subcadenas: "script" casa con "scripts" pero no con
+        "javascript" (el antiguo filtrado lineal usaba `in`)
+        """
+        terms = []
+        i = bisect_left(self.vocabulary, keyword)
+        while i < len(self.vocabulary) and self.vocabulary[i].startswith(keyword):
+            if self.vocabulary[i] != keyword:
+                terms.append(self.vocabulary[i])
+            i += 1
+        return terms
+
+    def fuzzy(self, keyword, limit=3, max_candidates=50):
+        """
+        Términos del vocabulario a distancia de edición <= 1 (palabras de hasta
+        4 letras) o <= 2 de keyword, del más parecido al menos. Solo se
+        verifican los max_candidates términos que más trigramas comparten
+        """
+        max_distance = 1 if len(keyword) <= 4 else 2
+        grams = trigrams(keyword)
+        shared = {}
+        with self.lock:
+            for gram in grams:
+                for term in self.trigram_index.get(gram, ()):
+                    shared[term] = shared.get(term, 0) + 1
+            # cada edición rompe como mucho 3 trigramas (4 una transposición)
+            min_shared = max(1, len(grams) - 4 * max_distance)
+            candidates = heapq.nlargest(
+                max_candidates, (item for item in shared.items() if item[1] >= min_shared),
+                key=lambda item: (item[1], -abs(len(item[0]) - len(keyword))))
+
+            matches = []
+            for term, count in candidates:
+                distance = edit_distance(keyword, term, max_distance)
+                if distance <= max_distance:
+                    matches.append((distance, -len(self.postings.get(term, ())), term))
+        matches.sort()
+        return [term for _, _, term in matches[:limit]]
+
+    def corrections(self, keywords):
+        """
+        {palabra: corrección} para las palabras clave que no aparecen en el
+        vocabulario ni como prefijo de ningún término
+        """
+        corrections = {}
+        for keyword in keywords:
+            if keyword in self.postings or self.expand(keyword):
+                continue
+            matches = self.fuzzy(keyword, limit=1)
+            if matches:
+                corrections[keyword] = matches[0]
+        return corrections
+
+    def candidates(self, keywords):
+        """
+        Puntúa solo los posts presentes en las posting lists de las palabras
+        clave con los puntos del antiguo filtrado lineal: título exacto 3,
+        título parcial 2, descripción exacta 2, descripción parcial 1. A
+        diferencia de aquel, "parcial" es coincidencia de prefijo (ver expand),
+        no de subcadena. Devuelve {post_id: score}
+        """
+        scores = {}
+        with self.lock:
+            for keyword in keywords:
+                best = {}
+                for term, points in ((keyword, (3, 2)), *((t, (2, 1)) for t in self.expand(keyword))):
+                    for post_id, (tf_title, tf_description) in self.postings.get(term, {}).items():
+                        score = points[0] if tf_title else points[1]
+                        if score > best.get(post_id, 0):
+                            best[post_id] = score
+                for post_id, score in best.items():
+                    scores[post_id] = scores.get(post_id, 0) + score
+        return scores
+
+    def matching(self, keywords):
+        """
+        Ids de todos los posts que contienen alguna palabra clave (exacta o
+        como prefijo), sin puntuar
+        """
+        post_ids = set()
+        with self.lock:
+            for keyword in keywords:
+                for term in (keyword, *self.expand(keyword)):
+                    post_ids.update(self.postings.get(term, ()))
+        return post_ids
+
+    def allows(self, post_id, filters):
+        """
+        True si el post cumple los filtros de facetas ({"stack": Stack, ...})
+        """
+        doc = self.docs.get(post_id)
+        return doc is not None and matches_filters(doc["facets"], filters)
+
+    def facets(self, keywords, filters=None):
+        """
+        Conteos por faceta de los posts que casan con las palabras clave (de
+        todo el índice si no hay palabras clave)
+        """
+        with self.lock:
+            if not keywords:
+                grid = dict(self.facet_grid)
+            else:
+                grid = {}
+                for post_id in self.matching(keywords):
+                    values = self.docs[post_id]["facets"]
+                    grid[values] = grid.get(values, 0) + 1
+        return facet_counts(grid, filters)
+
+    def average_lengths(self):
+        """
+        Longitud media de título y descripción en el corpus
+        """
+        count = len(self.docs) or 1
+        return (self.field_totals[0] / count or 1.0, self.field_totals[1] / count or 1.0)
+
+    def get(self, post_id):
+        doc = self.docs.get(post_id)
+        if doc is None:
+            return None
+        return {"id": doc["id"], "title": doc["title"], "description": doc["description"]}
+
+    def first(self, limit, filters=None):
+        """
+        Los primeros posts por id (cuando la consulta no tiene palabras clave)
+        """
+        with self.lock:
+            post_ids = self.docs if not filters else \
+                (post_id for post_id in self.docs if self.allows(post_id, filters))
+            return [self.get(post_id) for post_id in heapq.nsmallest(limit, post_ids)]
+
+    def __len__(self):
+        return len(self.docs)
+
+
+# -------------------------Rankers del prefiltro------------------------
+
+
+class KeywordRanker:
+    """
+    Puntuación original por coincidencias 3/2/2/1 con umbral mínimo de 2
+    """
+    name = "keyword"
+    min_score = 2
+
+    def rank(self, index, keywords, limit, filters=None):
+        scores = index.candidates(keywords)
+        ranked = [(score, post_id) for post_id, score in scores.items()
+                  if score >= self.min_score and (not filters or index.allows(post_id, filters))]
+        ranked.sort(key=lambda x: (-x[0], x[1]))
+        return ranked[:limit]
+
+
+class BM25Ranker:
+    """
+    BM25F sobre los campos título y descripción. Las estadísticas del corpus
+    (df = tamaño de la posting list, longitudes medias por campo) ya están en
+    el índice; solo se recorren las posting lists de las palabras clave,
+    acumulando término a término sobre los candidatos.
+    Las coincidencias parciales (prefijo) cuentan con peso partial_weight.
+    Los filtros de facetas se aplican antes del top-k, no después
+    """
+    name = "bm25"
+
+    def __init__(self, k1=1.2, field_weights=(2.0, 1.0), field_b=(0.5, 0.75), partial_weight=0.5):
+        self.k1 = k1
+        self.field_weights = field_weights
+        self.field_b = field_b
+        self.partial_weight = partial_weight
+
+    def rank(self, index, keywords, limit, filters=None):
+        scores = {}
+        with index.lock:
+            total_docs = len(index.docs)
+            avg_title, avg_description = index.average_lengths()
+            w_title, w_description = self.field_weights
+            b_title, b_description = self.field_b
+            docs = index.docs
+
+            for keyword in keywords:
+                expansions = [(keyword, 1.0)] + [(t, self.partial_weight) for t in index.expand(keyword)]
+                for term, weight in expansions:
+                    postings = index.postings.get(term)
+                    if not postings:
+                        continue
+                    df = len(postings)
+                    idf = math.log(1 + (total_docs - df + 0.5) / (df + 0.5)) * weight
+                    for post_id, (tf_title, tf_description) in postings.items():
+                        len_title, len_description = docs[post_id]["lengths"]
+                        tf = 0.0
+                        if tf_title:
+                            tf += w_title * tf_title / (1 - b_title + b_title * len_title / avg_title)
+                        if tf_description:
+                            tf += w_description * tf_description / \
+                                (1 - b_description + b_description * len_description / avg_description)
+                        scores[post_id] = scores.get(post_id, 0.0) + idf * tf / (self.k1 + tf)
+
+            if filters:
+                scores = {post_id: score for post_id, score in scores.items()
+                          if matches_filters(docs[post_id]["facets"], filters)}
+
+        return heapq.nsmallest(limit, ((score, post_id) for post_id, score in scores.items()),
+                               key=lambda x: (-x[0], x[1]))
+
+
+RANKERS = {
+    KeywordRanker.name: KeywordRanker(),
+    BM25Ranker.name: BM25Ranker()
+}
+
+
+def get_ranker(name=None):
+    """
+    Ranker configurado (SEARCH_RANKER=bm25|keyword|vector, por defecto bm25;
+    vector se registra en api.vectors)
+    """
+    name = (name or os.getenv("SEARCH_RANKER", BM25Ranker.name)).lower()
+    return RANKERS.get(name, RANKERS[BM25Ranker.name])
+
+
+def matches_filters(values, filters):
+    """
+    True si los valores (stack, level) de un post cumplen los filtros
+    """
+    return all(filters.get(facet) in (None, value) for facet, value in zip(FACETS, values)) \
+        if filters else True
+
+
+def facet_counts(grid, filters=None):
+    """
+    {"stack": {valor: n}, "level": {valor: n}} a partir de la rejilla
+    {(stack, level): n}. Cada faceta se cuenta aplicando solo los filtros de
+    las demás, para que el cliente vea cuántos resultados tendría al cambiar
+    de valor. Los posts sin valor en una faceta no cuentan en ella
+    """
+    filters = filters or {}
+    counts = {facet: {} for facet in FACETS}
+    for values, count in grid.items():
+        for i, facet in enumerate(FACETS):
+            if values[i] is None:
+                continue
+            others = {other: filters.get(other) for other in FACETS if other != facet}
+            if not matches_filters(values, others):
+                continue
+            label = values[i].value
+            counts[facet][label] = counts[facet].get(label, 0) + count
+    return counts
+
+
+def facet_grid():
+    """
+    Rejilla {(stack, level): n} de toda la tabla posts en un solo GROUP BY
+    (índice ix_posts_stack_level_id)
+    """
+    rows = db.session.query(Post.stack, Post.level, func.count(Post.id)).group_by(Post.stack, Post.level)
+    return {(stack, level): count for stack, level, count in rows}
+
+
+def count_filtered(grid, filters=None):
+    """
+    Número de posts de la rejilla que cumplen los filtros
+    """
+    return sum(count for values, count in grid.items() if matches_filters(values, filters))
+
+
+search_index = SearchIndex()
+
+# Backend del prefiltro: "memory" (índice invertido en cada worker) o
+# "database" (texto completo en Postgres/SQLite, ver api.fulltext)
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "memory").lower()
+FULLTEXT_DIALECTS = ("postgresql", "sqlite")
+
+
+def uses_memory_index():
+    return SEARCH_BACKEND != "database" or db.engine.dialect.name not in FULLTEXT_DIALECTS
+
+
+def ensure_search_index():
+    """
+    Construye el índice la primera vez y después lo sincroniza de forma
+    incremental con los cambios hechos por otros workers. La comprobación es
+    una sola consulta agregada (count, max id, max updated_at).
+    Con el backend de base de datos solo se calcula la firma (para las claves
+    de caché) y el índice en memoria no se carga
+    """
+    signature = tuple(db.session.query(
+        func.count(Post.id), func.max(Post.id), func.max(Post.updated_at)).one())
+
+    if not uses_memory_index():
+        search_index.signature = signature
+    elif search_index.signature is None:
+        search_index.build(Post.query.all(), signature=signature)
+    elif search_index.signature != signature:
+        _sync_search_index(signature)
+    return search_index
+
+
+def _sync_search_index(signature):
+    """
+    Aplica solo los posts creados o editados desde la última sincronización y,
+    si el número de posts no cuadra, las altas y bajas por id
+    """
+    _, previous_max_id, previous_update = search_index.signature
+    changed = Post.query.filter(db.or_(
+        Post.id > (previous_max_id or 0),
+        Post.updated_at >= previous_update if previous_update else Post.updated_at.isnot(None)
+    )).all()
+    for post in changed:
+        search_index.index_post(post)
+
+    if len(search_index) != signature[0]:
+        post_ids = {post_id for (post_id,) in db.session.query(Post.id)}
+        for post_id in set(search_index.docs) - post_ids:
+            search_index.remove_post(post_id)
+        missing = post_ids - set(search_index.docs)
+        if missing:
+            for post in Post.query.filter(Post.id.in_(missing)).all():
+                search_index.index_post(post)
+
+    search_index.signature = signature
+
+
+def index_post(post):
+    """
+    Hook de escritura: refleja un post creado o editado en el índice del worker
+    """
+    if search_index.signature is not None and uses_memory_index():
+        search_index.index_post(post)
+
+
+def unindex_post(post_id):
+    """
+    Hook de escritura: quita un post borrado del índice del worker
+    """
+    if search_index.signature is not None and uses_memory_index():
+        search_index.remove_post(post_id)
@@ -0,0 +1,200 @@
+"""
+Autocompletado de búsqueda (GET /api/search/suggest): índice de prefijos en
+memoria sobre títulos de posts, nombres de stack y consultas frecuentes.
+Un array ordenado de claves con búsqueda binaria; cada título se indexa por
+cada palabra en la que empieza ("python kanban board", "kanban board",
+"board") para que también case a mitad de título
+"""
+import os
+import time
+import heapq
+import threading
+from bisect import bisect_left, insort
+
+from sqlalchemy import func
+
+from api.models import db, Post, Stack
+
+# Cada cuántos segundos se comprueba si otros workers cambiaron los posts
+SUGGEST_SYNC_INTERVAL = float(os.getenv("SUGGEST_SYNC_INTERVAL", 2))
+STACK_WEIGHT = 1000
+
+
+def normalize_prefix(text):
+    return " ".join((text or "").lower().split())
+
+
+class SuggestIndex:
+    """
+    entries: lista ordenada de (clave, tipo, texto); weights: peso de cada
+    sugerencia (tipo, texto). Los títulos repetidos en varios posts suman
+    sus pesos (1 + likes + favoritos de cada post)
+    """
+
+    def __init__(self, max_scan=500, min_query_count=3, max_queries=5000):
+        self.max_scan = max_scan
+        self.min_query_count = min_query_count
+        self.max_queries = max_queries
+        self.lock = threading.RLock()
+        self.entries = []
+        self.weights = {}
+        self.post_titles = {}    # post_id -> (título o None, peso)
+        self.query_counts = {}   # consulta normalizada -> [veces, texto mostrado]
+        self.signature = None
+        self.checked_at = 0.0
+
+    @staticmethod
+    def _keys(text):
+        words = normalize_prefix(text).split()
+        return {" ".join(words[i:]) for i in range(len(words))}
+
+    def _add(self, kind, text, weight):
+        ident = (kind, text)
+        if ident not in self.weights:
+            self.weights[ident] = 0
+            for key in self._keys(text):
+                insort(self.entries, (key, kind, text))
+        self.weights[ident] += weight
+
+    def _remove(self, kind, text, weight):
+        ident = (kind, text)
+        if ident not in self.weights:
+            return
+        self.weights[ident] -= weight
+        if self.weights[ident] > 0:
+            return
+        del self.weights[ident]
+        for key in self._keys(text):
+            i = bisect_left(self.entries, (key, kind, text))
+            if i < len(self.entries) and self.entries[i] == (key, kind, text):
+                del self.entries[i]
+
+    def build(self, rows, signature=None):
+        """
+        Reconstruye el índice a partir de filas (id, title, peso). Las
+        consultas frecuentes acumuladas se conservan
+        """
+        weights = {("stack", stack.value): STACK_WEIGHT for stack in Stack}
+        post_titles = {}
+        for post_id, title, weight in rows:
+            post_titles[post_id] = (title, weight)
+            if title:
+                weights[("title", title)] = weights.get(("title", title), 0) + weight
+        for count, text in self.query_counts.values():
+            if count >= self.min_query_count:
+                weights[("query", text)] = count
+
+        entries = sorted({(key, kind, text) for kind, text in weights for key in self._keys(text)})
+        with self.lock:
+            self.entries = entries
+            self.weights = weights
+            self.post_titles = post_titles
+            self.signature = signature
+
+    def set_post(self, post_id, title, weight=1):
+        with self.lock:
+            self.remove_post(post_id)
+            self.post_titles[post_id] = (title, weight)
+            if title:
+                self._add("title", title, weight)
+
+    def remove_post(self, post_id):
+        with self.lock:
+            title, weight = self.post_titles.pop(post_id, (None, 0))
+            if title:
+                self._remove("title", title, weight)
+
+    def record_query(self, normalized, text):
+        """
+        Cuenta una consulta (por su forma normalizada). A partir de
+        min_query_count apariciones se sugiere, con el texto de la primera vez
+        que fue frecuente
+        """
+        text = normalize_prefix(text)
+        if not normalized or not text:
+            return
+        with self.lock:
+            entry = self.query_counts.setdefault(normalized, [0, text])
+            entry[0] += 1
+            if entry[0] >= self.min_query_count:
+                self._add("query", entry[1], entry[0] if entry[0] == self.min_query_count else 1)
+            if len(self.query_counts) > self.max_queries:
+                # se olvidan las consultas que nunca llegaron a ser frecuentes
+                self.query_counts = {key: value for key, value in self.query_counts.items()
+                                     if value[0] >= self.min_query_count}
+
+    def suggest(self, prefix, limit=8):
+        """
+        Hasta `limit` sugerencias que empiezan por prefix (o tienen una palabra
+        que empieza por prefix), de mayor a menor peso. Se revisan como mucho
+        max_scan claves del rango
+        """
+        prefix = normalize_prefix(prefix)
+        if not prefix:
+            return []
+        matches = {}
+        with self.lock:
+            i = bisect_left(self.entries, (prefix,))
+            end = min(i + self.max_scan, len(self.entries))
+            while i < end and self.entries[i][0].startswith(prefix):
+                _, kind, text = self.entries[i]
+                matches[(kind, text)] = self.weights.get((kind, text), 0)
+                i += 1
+        top = heapq.nlargest(limit, matches.items(), key=lambda item: (item[1], -len(item[0][1])))
+        return [{"text": text, "type": kind} for (kind, text), _ in top]
+
+
+suggest_index = SuggestIndex()
+
+
+def post_weight(post):
+    return 1 + (post.like_count or 0) + (post.favorite_count or 0)
+
+
+def ensure_suggest_index():
+    """
+    Construye el índice la primera vez. Después, como mucho cada
+    SUGGEST_SYNC_INTERVAL segundos, una consulta agregada detecta cambios de
+    otros workers y solo se aplican los posts nuevos o editados
+    """
+    now = time.monotonic()
+    if suggest_index.signature is not None and now - suggest_index.checked_at < SUGGEST_SYNC_INTERVAL:
+        return suggest_index
+
+    signature = tuple(db.session.query(
+        func.count(Post.id), func.max(Post.id), func.max(Post.updated_at)).one())
+    columns = (Post.id, Post.title, 1 + Post.like_count + Post.favorite_count)
+
+    if suggest_index.signature is None:
+        suggest_index.build(db.session.query(*columns).all(), signature=signature)
+    elif suggest_index.signature != signature:
+        _, previous_max_id, previous_update = suggest_index.signature
+        changed = db.session.query(*columns).filter(db.or_(
+            Post.id > (previous_max_id or 0),
+            Post.updated_at >= previous_update if previous_update else Post.updated_at.isnot(None)
+        ))
+        for post_id, title, weight in changed:
+            suggest_index.set_post(post_id, title, weight)
+        if len(suggest_index.post_titles) != signature[0]:
+            post_ids = {post_id for (post_id,) in db.session.query(Post.id)}
+            for post_id in set(suggest_index.post_titles) - post_ids:
+                suggest_index.remove_post(post_id)
+        suggest_index.signature = signature
+
+    suggest_index.checked_at = now
+    return suggest_index
+
+
+def add_post_suggestions(post):
+    """
+    Hook de escritura: refleja un post creado o editado en el autocompletado
+    """
+    if suggest_index.signature is not None:
+        suggest_index.set_post(post.id, post.title, post_weight(post))
+
+
+def remove_post_suggestions(post_id):
+    """
+    Hook de escritura: quita el título de un post borrado del autocompletado
+    """
+    suggest_index.remove_post(post_id)
@@ -1,9 +1,16 @@
 from flask import jsonify, url_for
+from sqlalchemy import or_, and_
+from datetime import datetime
 import smtplib
 import ssl
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import os
+import base64
+import binascii
+import json
+
+from api.models import Stack, Level
 
 # from front.assets import "logocompleto.png"
 
@@ -24,6 +31,98 @@ class APIException(Exception):
         return rv
 
 
+# -------------------------Keyset (cursor) pagination------------------------
+
+
+def encode_cursor(*values):
+    """
+    Genera un cursor opaco (base64 url-safe) con los valores de orden de la
+    última fila devuelta
+    """
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v
+                     for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, *types):
+    """
+    Decodifica un cursor generado por encode_cursor convirtiendo cada valor con
+    su tipo (int, datetime.fromisoformat...). Lanza APIException (400) si está
+    mal formado
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError("Wrong cursor size")
+        return [cast(value) for cast, value in zip(types, values)]
+    except (ValueError, TypeError, binascii.Error):
+        raise APIException("Invalid cursor", status_code=400)
+
+
+def get_cursor_args(args, default_limit=10, max_limit=100):
+    """
+    Lee ?after=&limit=&with_total= de la query string. Devuelve None si el
+    cliente no pidió el modo cursor (se mantiene la paginación por páginas)
+    """
+    if "after" not in args and "limit" not in args:
+        return None
+    limit = args.get("limit", default_limit, type=int)
+    if limit < 1:
+        limit = default_limit
+    return {
+        "after": args.get("after") or None,
+        "limit": min(limit, max_limit),
+        "with_total": args.get("with_total", "0").lower() in ("1", "true")
+    }
+
+
+def keyset_page(query, order_columns, cursor_values, limit, descending=True):
+    """
+    Aplica la condición de keyset (c1, c2, ...) < cursor (o > si ascendente),
+    ORDER BY y LIMIT limit + 1 sobre el índice, sin OFFSET ni COUNT.
+    Devuelve (filas, has_more)
+    """
+    if cursor_values is not None:
+        conditions = []
+        for i, column in enumerate(order_columns):
+            value = cursor_values[i]
+            step = column < value if descending else column > value
+            equal = [order_columns[j] == cursor_values[j] for j in range(i)]
+            conditions.append(and_(*equal, step))
+        query = query.filter(or_(*conditions))
+
+    query = query.order_by(*[c.desc() if descending else c.asc()
+                             for c in order_columns])
+    rows = query.limit(limit + 1).all()
+    return rows[:limit], len(rows) > limit
+
+
+# -------------------------Filtros de facetas------------------------
+
+
+def get_facet_filters(source):
+    """
+    Lee los filtros stack= y level= (de la query string o del cuerpo JSON).
+    Acepta el nombre o el valor del enum sin distinguir mayúsculas
+    ("python", "JUNIOR_DEV"). Lanza APIException (400) si no es válido
+    """
+    filters = {}
+    for facet, enum_cls in (("stack", Stack), ("level", Level)):
+        raw = source.get(facet)
+        if not raw:
+            filters[facet] = None
+            continue
+        raw = str(raw).strip().lower()
+        match = next((member for member in enum_cls
+                      if raw in (member.name.lower(), member.value.lower())), None)
+        if match is None:
+            valid = [member.name.lower() for member in enum_cls]
+            raise APIException(f"Invalid {facet}. Valid options: {valid}", status_code=400)
+        filters[facet] = match
+    return filters
+
+
 def has_no_empty_params(rule):
     defaults = rule.defaults if rule.defaults is not None else ()
     arguments = rule.arguments if rule.arguments is not None else ()
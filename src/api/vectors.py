@@ -0,0 +1,263 @@
+"""
+Búsqueda semántica local (sin red) con vectores TF-IDF por hashing trick.
+Esquema SMART lnc.ltc: los posts guardan log-tf normalizado (no depende del
+corpus, así que un vector no caduca al entrar otros posts) y el idf se aplica
+solo a la consulta con los df actuales. Los vectores se calculan con
+`flask compute-embeddings`, se guardan en post_embeddings y se actualizan en
+cada escritura de posts, dentro de la misma transacción que el post
+"""
+import os
+import sys
+import math
+import zlib
+import threading
+from array import array
+from datetime import datetime, UTC
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from api.models import db, Post, PostEmbedding
+from api.search import STOP_WORDS, RANKERS, BM25Ranker, tokenize
+
+VECTOR_DIM = int(os.getenv("SEARCH_VECTOR_DIM", 2 ** 18))
+TITLE_WEIGHT = 2
+PREFIX_LENGTH = 5
+
+
+def features(text, title=None):
+    """
+    Rasgos de un texto: los términos (sin stop words) y, para los largos, su
+    prefijo de PREFIX_LENGTH letras como aproximación barata a la raíz
+    ("deploy" / "deployment"). El título cuenta TITLE_WEIGHT veces
+    """
+    counts = {}
+    fields = ((text, 1),) if title is None else ((title, TITLE_WEIGHT), (text, 1))
+    for field, weight in fields:
+        for term in tokenize(field):
+            if term in STOP_WORDS or len(term) < 2:
+                continue
+            counts[term] = counts.get(term, 0) + weight
+            if len(term) > PREFIX_LENGTH:
+                prefix = "~" + term[:PREFIX_LENGTH]
+                counts[prefix] = counts.get(prefix, 0) + weight
+    return counts
+
+
+def hash_vector(counts, dim=VECTOR_DIM):
+    """
+    Hashing trick con signo: rasgo -> (cubo, ±1). crc32 es estable entre
+    procesos (hash() de Python no). Devuelve {cubo: log-tf con signo}
+    """
+    vector = {}
+    for feature, tf in counts.items():
+        h = zlib.crc32(feature.encode())
+        bucket = h % dim
+        sign = -1.0 if h & 0x80000000 else 1.0
+        vector[bucket] = vector.get(bucket, 0.0) + sign * (1 + math.log(tf))
+    return {bucket: weight for bucket, weight in vector.items() if weight}
+
+
+def normalize(vector):
+    norm = math.sqrt(sum(w * w for w in vector.values()))
+    return {bucket: w / norm for bucket, w in vector.items()} if norm else {}
+
+
+def embed_text(description, title=None, dim=VECTOR_DIM):
+    return normalize(hash_vector(features(description, title), dim))
+
+
+def pack(vector):
+    indices = array("i", vector.keys())
+    weights = array("f", vector.values())
+    if sys.byteorder == "big":
+        indices.byteswap()
+        weights.byteswap()
+    return indices.tobytes() + weights.tobytes()
+
+
+def unpack(data):
+    half = len(data) // 2
+    indices = array("i")
+    weights = array("f")
+    indices.frombytes(data[:half])
+    weights.frombytes(data[half:])
+    if sys.byteorder == "big":
+        indices.byteswap()
+        weights.byteswap()
+    return dict(zip(indices, weights))
+
+
+class VectorIndex:
+    """
+    Matriz dispersa posts x cubos guardada por columnas
+    (cubo -> {post_id: peso}): el producto matriz-vector con la consulta solo
+    recorre las columnas de los cubos de la consulta
+    """
+
+    def __init__(self, dim=VECTOR_DIM):
+        self.dim = dim
+        self.lock = threading.RLock()
+        self.rows = {}     # post_id -> {cubo: peso}
+        self.columns = {}  # cubo -> {post_id: peso}
+        self.signature = None
+
+    def set(self, post_id, vector):
+        with self.lock:
+            self.remove(post_id)
+            self.rows[post_id] = vector
+            for bucket, weight in vector.items():
+                self.columns.setdefault(bucket, {})[post_id] = weight
+
+    def remove(self, post_id):
+        with self.lock:
+            vector = self.rows.pop(post_id, None)
+            for bucket in vector or ():
+                column = self.columns[bucket]
+                column.pop(post_id, None)
+                if not column:
+                    del self.columns[bucket]
+            return vector is not None
+
+    def query_vector(self, text):
+        """
+        Vector ltc de la consulta: log-tf * idf(df actual del cubo), normalizado
+        """
+        total = len(self.rows)
+        vector = hash_vector(features(text), self.dim)
+        return normalize({
+            bucket: weight * (math.log((total + 1) / (len(self.columns.get(bucket, ())) + 1)) + 1)
+            for bucket, weight in vector.items()
+        })
+
+    def search(self, text, limit, min_score=0.05):
+        """
+        [(coseno, post_id)] de los posts más parecidos a text, de mayor a menor
+        (todos los que superan min_score si limit es None)
+        """
+        scores = {}
+        with self.lock:
+            for bucket, q_weight in self.query_vector(text).items():
+                for post_id, weight in self.columns.get(bucket, {}).items():
+                    scores[post_id] = scores.get(post_id, 0.0) + q_weight * weight
+        ranked = sorted(((score, post_id) for post_id, score in scores.items() if score >= min_score),
+                        key=lambda x: (-x[0], x[1]))
+        return ranked[:limit]
+
+    def __len__(self):
+        return len(self.rows)
+
+
+vector_index = VectorIndex()
+
+
+def ensure_vector_index():
+    """
+    Carga los vectores de post_embeddings la primera vez y después solo los
+    que cambiaron (misma estrategia de firma que ensure_search_index)
+    """
+    same_dim = PostEmbedding.dim == vector_index.dim
+    signature = tuple(db.session.query(
+        func.count(PostEmbedding.post_id), func.max(PostEmbedding.updated_at)).filter(same_dim).one())
+    if vector_index.signature == signature:
+        return vector_index
+
+    query = PostEmbedding.query.filter(same_dim)
+    if vector_index.signature is not None and vector_index.signature[1] is not None:
+        query = query.filter(PostEmbedding.updated_at >= vector_index.signature[1])
+    for row in query:
+        vector_index.set(row.post_id, unpack(row.vector))
+
+    if len(vector_index) != signature[0]:
+        post_ids = {post_id for (post_id,) in db.session.query(PostEmbedding.post_id).filter(same_dim)}
+        for post_id in set(vector_index.rows) - post_ids:
+            vector_index.remove(post_id)
+
+    vector_index.signature = signature
+    return vector_index
+
+
+def store_embedding(post):
+    """
+    Calcula el vector de un post y lo deja en la sesión (sin commit)
+    """
+    vector = embed_text(post.description, post.title or "")
+    db.session.merge(PostEmbedding(
+        post_id=post.id, dim=VECTOR_DIM, vector=pack(vector), updated_at=datetime.now(UTC)))
+    return vector
+
+
+def compute_embeddings(batch_size=500):
+    """
+    Recalcula los vectores de todos los posts por lotes y borra los de posts
+    que ya no existen. Devuelve (calculados, borrados)
+    """
+    computed = 0
+    last_id = 0
+    while True:
+        posts = Post.query.filter(Post.id > last_id).order_by(Post.id).limit(batch_size).all()
+        if not posts:
+            break
+        for post in posts:
+            store_embedding(post)
+        db.session.commit()
+        computed += len(posts)
+        last_id = posts[-1].id
+    deleted = PostEmbedding.query.filter(
+        ~PostEmbedding.post_id.in_(db.session.query(Post.id))).delete(synchronize_session=False)
+    db.session.commit()
+    return computed, deleted
+
+
+def embed_post(post):
+    """
+    Hook de escritura: recalcula el vector de un post creado o editado y lo
+    deja en la sesión (el post necesita id: llamar tras un flush). Se
+    guarda con el commit del post y el índice del worker se actualiza
+    después de ese commit
+    """
+    vector = store_embedding(post)
+    db.session.info.setdefault("vector_updates", {})[post.id] = vector
+
+
+def unembed_post(post_id):
+    """
+    Hook de escritura: borra el vector de un post eliminado en la misma
+    transacción que el post
+    """
+    PostEmbedding.query.filter_by(post_id=post_id).delete()
+    db.session.info.setdefault("vector_updates", {})[post_id] = None
+
+
+@event.listens_for(Session, "after_commit")
+def apply_vector_updates(session):
+    for post_id, vector in session.info.pop("vector_updates", {}).items():
+        if vector is None:
+            vector_index.remove(post_id)
+        elif vector_index.signature is not None:
+            vector_index.set(post_id, vector)
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_vector_updates(session):
+    session.info.pop("vector_updates", None)
+
+
+class VectorRanker:
+    """
+    Ranker del prefiltro por similitud coseno con los vectores locales
+    (sincronizados antes con ensure_vector_index, que necesita la sesión de
+    la petición). Mientras no haya vectores calculados se comporta como BM25
+    """
+    name = "vector"
+
+    def rank(self, index, keywords, limit, filters=None):
+        if not len(vector_index):
+            return RANKERS[BM25Ranker.name].rank(index, keywords, limit, filters)
+        # solo posts que siguen en el índice de búsqueda (y cumplen los
+        # filtros: con filtros se revisa la lista completa antes del top-k)
+        ranked = vector_index.search(" ".join(sorted(keywords)), limit * 2 if not filters else None)
+        return [(score, post_id) for score, post_id in ranked if index.allows(post_id, filters)][:limit]
+
+
+RANKERS[VectorRanker.name] = VectorRanker()
@@ -8,6 +8,7 @@ from flask_jwt_extended import JWTManager
 from api.utils import APIException, generate_sitemap
 from api.models import db
 from api.routes import api
+from api.auth import register_token_checks
 from api.admin import setup_admin
 from api.commands import setup_commands
 from dotenv import load_dotenv
@@ -38,6 +39,7 @@ app = Flask(__name__)
 app.config["JWT_SECRET_KEY"] = "secret-key"
 app.config["JWT_ACCESS_TOKEN_EXPIRES"] = 3600  # 1 hora  
 jwt = JWTManager(app)
+register_token_checks(jwt)
 bcrypt = Bcrypt(app)
 
 # 🌐 CORS para todos los orígenes
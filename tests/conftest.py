@@ -0,0 +1,83 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+DB_PATH = os.path.join(tempfile.gettempdir(), "gitwise_tests.sqlite3")
+
+os.environ.setdefault("VITE_STRIPE_SECRET_KEY", "sk_test")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+# solo la LRU local: cada test empieza con la caché vacía
+os.environ["SEARCH_CACHE_DB"] = ""
+os.environ["DEEPSEEK_BASE_URL"] = "http://127.0.0.1:9"
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from app import app as flask_app  # noqa: E402
+from api.models import db, User, Post, Stack, Level  # noqa: E402
+from api.routes import bcrypt  # noqa: E402
+from api.auth import auth_versions  # noqa: E402
+from api.cache import search_cache  # noqa: E402
+from api.fulltext import BACKENDS  # noqa: E402
+from api.querylog import search_log  # noqa: E402
+from api.search import search_index  # noqa: E402
+from api.suggest import suggest_index  # noqa: E402
+from api.vectors import vector_index  # noqa: E402
+
+
+def reset_worker_state():
+    """
+    Los índices y cachés son globales del worker: se vacían entre tests
+    """
+    search_index.signature = None
+    with vector_index.lock:
+        vector_index.rows.clear()
+        vector_index.columns.clear()
+        vector_index.signature = None
+    suggest_index.signature = None
+    search_cache.local.clear()
+    auth_versions.entries.clear()
+    with search_log.lock:
+        search_log.buffer.clear()
+    BACKENDS["sqlite"].schema_ready = False
+
+
+@pytest.fixture
+def app():
+    flask_app.config["TESTING"] = True
+    with flask_app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+        if os.path.exists(DB_PATH):
+            os.remove(DB_PATH)
+        db.create_all()
+        reset_worker_state()
+        yield flask_app
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def make_user(index, is_admin=False):
+    user = User(name=f"name{index}", last_name="last", email=f"user{index}@example.com",
+                username=f"user{index}", password=bcrypt.generate_password_hash("pw").decode(),
+                is_admin=is_admin)
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def make_post(user, title, description, stack=Stack.PYTHON, level=Level.STUDENT):
+    post = Post(user_id=user.id, title=title, description=description, repo_URL="http://example.com",
+                stack=stack, level=level)
+    db.session.add(post)
+    db.session.commit()
+    return post
+
+
+def login(client, user):
+    response = client.post("/api/login", json={"email": user.email, "password": "pw"})
+    return {"Authorization": f"Bearer {response.json['token']}"}
@@ -0,0 +1,38 @@
+from api.models import db
+from conftest import make_user, login
+
+
+def test_deactivated_user_token_is_rejected_on_regular_routes(app, client):
+    user = make_user(1)
+    headers = login(client, user)
+    assert client.get("/api/favorites", headers=headers).status_code == 200
+
+    user.is_active = False
+    db.session.commit()
+
+    response = client.get("/api/favorites", headers=headers)
+    assert response.status_code == 401
+    assert response.json["error"] == "Token revocado, inicia sesión de nuevo"
+
+
+def test_demoted_admin_token_is_rejected_on_admin_routes(app, client):
+    admin = make_user(1, is_admin=True)
+    headers = login(client, admin)
+    assert client.get("/api/admin/comments", headers=headers).status_code == 200
+
+    admin.is_admin = False
+    db.session.commit()
+
+    response = client.get("/api/admin/comments", headers=headers)
+    assert response.status_code == 401
+    assert response.json["error"] == "Token revocado, inicia sesión de nuevo"
+
+
+def test_deleted_user_token_is_rejected(app, client):
+    user = make_user(1)
+    headers = login(client, user)
+
+    db.session.delete(user)
+    db.session.commit()
+
+    assert client.get("/api/favorites", headers=headers).status_code == 401
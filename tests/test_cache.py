@@ -0,0 +1,131 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from api import cache
+from api.cache import LRUCache, SQLiteCacheStore, SingleFlight, TieredCache, search_flights
+from api.deepseek import DeepSeekClient, deepseek_client
+
+
+def size(value):
+    return len(json.dumps(value))
+
+
+def test_lru_evicts_least_recently_used_entry():
+    cache = LRUCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" pasa a ser la menos usada
+    cache.set("c", 3)
+
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_lru_evicts_by_bytes():
+    value = {"results": ["x" * 40]}
+    cache = LRUCache(max_bytes=2 * size(value) + 1)
+    for key in "abc":
+        cache.set(key, value)
+
+    assert len(cache) == 2 and cache.get("a") is None
+    assert cache.stats()["bytes"] == 2 * size(value)
+
+
+def test_lru_rejects_values_larger_than_the_cache():
+    cache = LRUCache(max_bytes=10)
+    assert not cache.set("a", "x" * 20)
+    assert len(cache) == 0
+
+
+def test_lru_entries_expire_after_ttl():
+    cache = LRUCache(ttl=60)
+    cache.set("fresh", 1)
+    cache.set("stale", 2, ttl=0)
+
+    assert cache.get("fresh") == 1
+    assert cache.get("stale") is None
+    stats = cache.stats()
+    assert (stats["expirations"], stats["hits"], stats["misses"]) == (1, 1, 1)
+    assert stats["bytes"] == size(1)
+
+
+def test_worst_case_latency_is_bounded_by_the_deadline():
+    client = DeepSeekClient(connect_timeout=3, read_timeout=20, max_retries=2, deadline=30)
+    assert client.worst_case_latency() == 33
+
+
+def test_single_flight_coalesces_concurrent_threads():
+    flight = SingleFlight(TieredCache(LRUCache()))
+    calls = []
+    release = threading.Event()
+
+    def search():
+        calls.append(1)
+        release.wait(5)
+        return {"results": [1]}
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        futures = [executor.submit(flight.do, "key", search) for _ in range(5)]
+        while not flight.calls.get("key") or flight.leaders < 1:
+            time.sleep(0.01)
+        time.sleep(0.1)  # los demás hilos ya esperan al líder
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert results == [{"results": [1]}] * 5
+    assert len(calls) == 1
+    assert flight.stats() == {"in_flight": 0, "leaders": 1, "coalesced": 4}
+
+
+class FakeClock:
+    """
+    Sustituye al módulo time en api.cache: sleep avanza el reloj al momento
+    y a los `finish_at` segundos ejecuta on_finish (el líder de otro worker
+    publica su resultado)
+    """
+
+    def __init__(self, finish_at, on_finish):
+        self.now = 1000.0
+        self.started = self.now
+        self.finish_at = finish_at
+        self.on_finish = on_finish
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+        if self.on_finish and self.now - self.started >= self.finish_at:
+            self.on_finish()
+            self.on_finish = None
+
+
+def test_follower_in_another_worker_outwaits_a_slow_leader(tmp_path, monkeypatch):
+    # el líder agota el plazo de DeepSeek y el prefiltro le suma unos
+    # segundos: más que la espera fija de antes (40 s)
+    held_for = deepseek_client.worst_case_latency() + 9
+    assert held_for > 40
+
+    store = SQLiteCacheStore(str(tmp_path / "shared.sqlite3"))
+    leader_cache = TieredCache(LRUCache(), store)
+    follower = SingleFlight(TieredCache(LRUCache(), store), search_flights.lock_ttl,
+                            search_flights.wait_timeout)
+
+    def leader_finishes():
+        leader_cache.set("key", {"results": [1]})
+        store.release("flight:key")
+
+    monkeypatch.setattr(cache, "time", FakeClock(held_for, leader_finishes))
+    assert store.acquire("flight:key", search_flights.lock_ttl)  # el líder, en otro worker
+
+    calls = []
+    result = follower.do("key", lambda: calls.append(1) or {"results": []})
+
+    assert result == {"results": [1]}
+    assert not calls
+    assert follower.stats()["coalesced"] == 1
@@ -0,0 +1,85 @@
+from api.models import db, Post, Comments, Likes
+from conftest import make_user, make_post, login
+
+
+def counters(post):
+    db.session.refresh(post)
+    return post.like_count, post.favorite_count, post.comment_count
+
+
+def test_engagement_routes_maintain_counters(app, client):
+    author, reader = make_user(1), make_user(2)
+    post = make_post(author, "CLI tools", "Command line tools")
+    headers = login(client, reader)
+
+    client.post(f"/api/post/{post.id}/likes", headers=headers)
+    favorite = client.post("/api/favorites", json={"post_id": post.id}, headers=headers).json["favorite"]
+    comment = client.post(f"/api/post/{post.id}/comments", json={"text": "Nice"}, headers=headers).json["comment"]
+    client.post(f"/api/comments/{comment['id']}/like", headers=login(client, author))
+    assert counters(post) == (1, 1, 1)
+    assert db.session.get(Comments, comment["id"]).like_count == 1
+    assert post.comment_like_count == 1
+
+    client.delete(f"/api/post/{post.id}/likes", headers=headers)
+    client.delete(f"/api/favorites/{favorite['id']}", headers=headers)
+    client.delete(f"/api/comments/{comment['id']}", headers=headers)
+    assert counters(post) == (0, 0, 0)
+    assert post.comment_like_count == 0
+
+
+def test_duplicate_like_does_not_count_twice(app, client):
+    user = make_user(1)
+    post = make_post(user, "CLI tools", "Command line tools")
+    headers = login(client, user)
+
+    assert client.post(f"/api/post/{post.id}/likes", headers=headers).status_code == 200
+    assert client.post(f"/api/post/{post.id}/likes", headers=headers).status_code == 400
+    assert counters(post)[0] == 1
+
+
+def test_rebuild_counters_command_fixes_drift(app):
+    user = make_user(1)
+    post = make_post(user, "CLI tools", "Command line tools")
+    comment = Comments(user_id=user.id, post_id=post.id, text="Nice")
+    db.session.add(comment)
+    db.session.flush()
+    db.session.add_all([Likes(user_id=user.id, post_id=post.id), Likes(user_id=user.id, comments_id=comment.id)])
+    db.session.query(Post).update({Post.like_count: 7, Post.favorite_count: 3, Post.comment_count: 0,
+                                   Post.comment_like_count: 5})
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=["rebuild-counters"])
+
+    assert result.exit_code == 0, result.output
+    assert counters(post) == (1, 0, 1)
+    assert post.comment_like_count == 1
+    db.session.refresh(comment)
+    assert comment.like_count == 1
+
+
+def test_feed_reads_comment_likes_from_the_counter(app, client):
+    author, reader = make_user(1), make_user(2)
+    post = make_post(author, "CLI tools", "Command line tools")
+    make_post(author, "Kanban", "Tasks")
+    comment = client.post(f"/api/post/{post.id}/comments", json={"text": "Nice"},
+                          headers=login(client, author)).json["comment"]
+    client.post(f"/api/comments/{comment['id']}/like", headers=login(client, reader))
+
+    # sin GROUP BY sobre comments: el coste no depende del tamaño de la tabla
+    assert "comments" not in str(Post.query_with_stats().statement)
+    stats = {p["id"]: p["stats"] for p in client.get("/api/posts?limit=10").json["posts"]}
+    assert stats == {post.id: {"comments": 1, "likes": 1}, 2: {"comments": 0, "likes": 0}}
+
+
+def test_deleting_a_user_recounts_comment_likes(app, client):
+    author, reader = make_user(1), make_user(2, is_admin=True)
+    post = make_post(author, "CLI tools", "Command line tools")
+    comment = client.post(f"/api/post/{post.id}/comments", json={"text": "Nice"},
+                          headers=login(client, author)).json["comment"]
+    headers = login(client, reader)
+    client.post(f"/api/comments/{comment['id']}/like", headers=headers)
+    assert counters(post) and post.comment_like_count == 1
+
+    assert client.delete(f"/api/admin/users/{reader.id}", headers=headers).status_code == 200
+    counters(post)
+    assert post.comment_like_count == 0
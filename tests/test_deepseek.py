@@ -0,0 +1,139 @@
+import io
+import json
+import time
+
+import pytest
+import requests
+
+from api.deepseek import DeepSeekClient, CircuitBreaker
+
+
+class FakeStreamResponse:
+    """
+    Respuesta en streaming de chat/completions con los fragmentos dados y
+    un último evento con usage
+    """
+
+    def __init__(self, chunks, usage=None):
+        self.encoding = "utf-8"
+        self.lines = [f"data: {json.dumps({'choices': [{'delta': {'content': chunk}}]})}" for chunk in chunks]
+        if usage:
+            self.lines.append(f"data: {json.dumps({'choices': [], 'usage': usage})}")
+        self.lines.append("data: [DONE]")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def iter_lines(self, decode_unicode=False):
+        return iter(self.lines)
+
+
+def make_client(monkeypatch, response):
+    client = DeepSeekClient(api_key="test", breaker=CircuitBreaker(min_calls=1, cooldown=0))
+    monkeypatch.setattr(client, "_post", lambda payload, **kwargs: response)
+    return client
+
+
+def test_closed_stream_during_half_open_probe_closes_circuit(monkeypatch):
+    client = make_client(monkeypatch, FakeStreamResponse(["1,90,High\n", "2,80,High\n"]))
+    client.breaker._open()
+
+    stream = client.stream_chat({"messages": []})
+    assert next(stream) == "1,90,High\n"
+    assert client.breaker.probing
+    # el cliente SSE se desconecta: Flask cierra el generador
+    stream.close()
+
+    assert client.breaker.stats()["state"] == CircuitBreaker.CLOSED
+    assert not client.breaker.probing
+    assert client.breaker.allow()
+
+
+def test_failed_stream_during_half_open_probe_reopens_circuit(monkeypatch):
+    client = make_client(monkeypatch, FakeStreamResponse([]))
+    monkeypatch.setattr(FakeStreamResponse, "iter_lines", lambda self, decode_unicode=False: iter(["data: {"]))
+    client.breaker._open()
+
+    stream = client.stream_chat({"messages": []})
+    try:
+        next(stream)
+    except ValueError:
+        pass
+
+    assert client.breaker.stats()["state"] == CircuitBreaker.OPEN
+    assert not client.breaker.probing
+
+
+def test_stream_exposes_usage_from_last_event(monkeypatch):
+    usage = {"prompt_tokens": 500, "completion_tokens": 40, "total_tokens": 540}
+    client = make_client(monkeypatch, FakeStreamResponse(["1,90,High\n"], usage=usage))
+
+    usage_out = {}
+    assert list(client.stream_chat({"messages": []}, usage_out)) == ["1,90,High\n"]
+    assert usage_out == usage
+
+
+class FakeSession:
+    """
+    Sesión que devuelve (o lanza) las respuestas dadas en orden y guarda el
+    timeout de cada intento
+    """
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.timeouts = []
+
+    def post(self, url, json=None, timeout=None, **kwargs):
+        self.timeouts.append(timeout)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def status_response(status_code, retry_after=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.raw = io.BytesIO(b"")
+    if retry_after is not None:
+        response.headers["Retry-After"] = str(retry_after)
+    return response
+
+
+def retrying_client(session, **kwargs):
+    client = DeepSeekClient(api_key="test", backoff=0, **kwargs)
+    client.session = session
+    return client
+
+
+def test_read_timeout_is_not_retried():
+    session = FakeSession(requests.ReadTimeout("slow"), status_response(200))
+    with pytest.raises(requests.ReadTimeout):
+        retrying_client(session)._post({})
+    assert len(session.timeouts) == 1
+
+
+def test_connect_errors_and_5xx_are_retried():
+    session = FakeSession(requests.ConnectTimeout("no route"), status_response(503), status_response(200))
+    assert retrying_client(session)._post({}).status_code == 200
+    assert len(session.timeouts) == 3
+
+
+def test_retries_stop_at_the_deadline():
+    # esperar el Retry-After pasaría del plazo: se devuelve el error ya
+    session = FakeSession(status_response(429, retry_after=5), status_response(200))
+    started = time.monotonic()
+    with pytest.raises(requests.HTTPError):
+        retrying_client(session, deadline=2)._post({})
+    assert time.monotonic() - started < 1
+    assert len(session.timeouts) == 1
+
+
+def test_attempt_timeouts_are_capped_by_the_deadline():
+    session = FakeSession(status_response(200))
+    retrying_client(session, connect_timeout=3, read_timeout=20, deadline=5)._post({})
+    (connect, read), = session.timeouts
+    assert connect == 3 and 4 < read <= 5
@@ -0,0 +1,60 @@
+import pytest
+
+from api.models import Stack, Level
+from api.search import facet_counts, count_filtered
+from api.utils import APIException, get_facet_filters
+from conftest import make_user, make_post, login
+
+GRID = {
+    (Stack.PYTHON, Level.STUDENT): 3,
+    (Stack.PYTHON, Level.JUNIOR_DEV): 2,
+    (Stack.SQL, Level.STUDENT): 1,
+    (None, Level.STUDENT): 4,
+}
+
+
+def test_each_facet_is_counted_with_the_other_filters_only():
+    counts = facet_counts(GRID, {"stack": Stack.PYTHON, "level": Level.STUDENT})
+    # stack: solo con level=student; level: solo con stack=python
+    assert counts == {"stack": {"Python": 3, "SQL": 1}, "level": {"student": 3, "junior_dev": 2}}
+    assert count_filtered(GRID, {"stack": Stack.PYTHON, "level": Level.STUDENT}) == 3
+
+
+def test_unfiltered_counts_skip_posts_without_a_value():
+    counts = facet_counts(GRID)
+    assert counts["stack"] == {"Python": 5, "SQL": 1}
+    assert counts["level"] == {"student": 8, "junior_dev": 2}
+    assert count_filtered(GRID) == 10
+
+
+def test_facet_filters_accept_names_and_values():
+    assert get_facet_filters({"stack": "python", "level": "JUNIOR_DEV"}) == \
+        {"stack": Stack.PYTHON, "level": Level.JUNIOR_DEV}
+    assert get_facet_filters({"stack": "JavasScript"})["stack"] == Stack.JAVASCRIPT
+    with pytest.raises(APIException):
+        get_facet_filters({"level": "guru"})
+
+
+def test_feed_filters_and_counts(app, client):
+    user = make_user(1)
+    make_post(user, "Kanban", "Tasks", stack=Stack.PYTHON, level=Level.STUDENT)
+    make_post(user, "Reports", "Queries", stack=Stack.SQL, level=Level.STUDENT)
+    make_post(user, "Scraper", "Crawler", stack=Stack.PYTHON, level=Level.MID_DEV)
+
+    response = client.get("/api/posts?limit=10&stack=python&with_total=1").json
+    assert [post["id"] for post in response["posts"]] == [3, 1]
+    assert response["pagination"]["total_posts"] == 2
+    assert response["facets"] == {"stack": {"Python": 2, "SQL": 1}, "level": {"student": 1, "mid_dev": 1}}
+    assert client.get("/api/posts?stack=cobol").status_code == 400
+
+
+def test_smart_search_facets_follow_the_query(app, client):
+    user = make_user(1)
+    make_post(user, "Python tools", "Command line tools", stack=Stack.PYTHON, level=Level.STUDENT)
+    make_post(user, "SQL tools", "Database tools", stack=Stack.SQL, level=Level.STUDENT)
+    make_post(user, "Kanban board", "Tasks", stack=Stack.PYTHON, level=Level.MID_DEV)
+
+    response = client.post("/api/smart-search", json={"user_request": "tools", "mode": "local",
+                                                      "stack": "sql"}, headers=login(client, user)).json
+    assert [result["post_id"] for result in response["results"]] == [2]
+    assert response["facets"] == {"stack": {"Python": 1, "SQL": 1}, "level": {"student": 1}}
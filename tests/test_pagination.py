@@ -0,0 +1,70 @@
+import base64
+import json
+from datetime import datetime
+
+import pytest
+
+from api.utils import APIException, encode_cursor, decode_cursor
+from conftest import make_user, make_post, login
+
+
+def raw_cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip("=")
+
+
+def test_cursor_round_trip():
+    since = datetime(2024, 5, 1, 12, 30)
+    assert decode_cursor(encode_cursor(since, 42), datetime.fromisoformat, int) == [since, 42]
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    base64.urlsafe_b64encode(b"{not json").decode(),
+    raw_cursor({"id": 3}),
+    raw_cursor([3, 4]),
+    raw_cursor(["abc"]),
+    raw_cursor([None]),
+    raw_cursor([[1]]),
+])
+def test_malformed_or_tampered_cursor_is_rejected(cursor):
+    with pytest.raises(APIException) as error:
+        decode_cursor(cursor, int)
+    assert error.value.status_code == 400
+
+
+def test_feed_cursor_walks_every_post_once(app, client):
+    user = make_user(1)
+    for i in range(5):
+        make_post(user, f"Post {i}", "Description")
+
+    seen = []
+    after = None
+    while True:
+        query = "/api/posts?limit=2" + (f"&after={after}" if after else "")
+        response = client.get(query).json
+        seen += [post["id"] for post in response["posts"]]
+        after = response["pagination"]["next_cursor"]
+        if not after:
+            break
+
+    assert seen == [5, 4, 3, 2, 1]
+    assert client.get(f"/api/posts?after={raw_cursor(['x'])}").status_code == 400
+
+
+def test_admin_users_cursor_by_member_since(app, client):
+    admin = make_user(1, is_admin=True)
+    for i in range(2, 5):
+        make_user(i)
+    headers = login(client, admin)
+
+    first = client.get("/api/admin/users?limit=3&sort=member_since", headers=headers).json
+    assert first["pagination"]["has_more"]
+    after = first["pagination"]["next_cursor"]
+    rest = client.get(f"/api/admin/users?limit=3&sort=member_since&after={after}", headers=headers).json
+
+    ids = [user["id"] for user in first["users"] + rest["users"]]
+    assert sorted(ids) == [1, 2, 3, 4]
+    assert not rest["pagination"]["has_more"]
+    response = client.get(f"/api/admin/users?limit=3&sort=member_since&after={raw_cursor([1])}",
+                          headers=headers)
+    assert response.status_code == 400
@@ -0,0 +1,57 @@
+from api import routes
+from api.models import db, Post, PostEmbedding
+from api.vectors import ensure_vector_index, vector_index
+from conftest import make_user, make_post, login
+
+NEW_POST = {"title": "CLI tools", "description": "Command line tools", "repo_URL": "http://example.com"}
+
+
+def fail(*args):
+    raise RuntimeError("boom")
+
+
+def test_new_post_and_embedding_share_a_transaction(app, client):
+    user = make_user(1)
+    ensure_vector_index()
+
+    response = client.post("/api/user/post/1", json=NEW_POST, headers=login(client, user))
+
+    assert response.status_code == 201
+    post_id = response.json["post"]["id"]
+    assert db.session.get(PostEmbedding, post_id) is not None
+    assert post_id in vector_index.rows
+
+
+def test_failed_embedding_does_not_create_the_post(app, client, monkeypatch):
+    user = make_user(1)
+    monkeypatch.setattr(routes, "embed_post", fail)
+
+    response = client.post("/api/user/post/1", json=NEW_POST, headers=login(client, user))
+
+    assert response.status_code == 500
+    assert Post.query.count() == 0
+
+
+def test_failed_memory_hook_still_reports_the_write(app, client, monkeypatch):
+    user = make_user(1)
+    headers = login(client, user)
+    monkeypatch.setattr(routes, "index_post", fail)
+
+    assert client.post("/api/user/post/1", json=NEW_POST, headers=headers).status_code == 201
+    post_id = Post.query.one().id
+    response = client.put(f"/api/post/{post_id}", json={"title": "CLI helpers"}, headers=headers)
+    assert response.status_code == 200
+    assert db.session.get(Post, post_id).title == "CLI helpers"
+
+
+def test_deleting_a_post_removes_its_vector(app, client):
+    user = make_user(1)
+    post = make_post(user, "CLI tools", "Command line tools")
+    headers = login(client, user)
+    client.put(f"/api/post/{post.id}", json={"description": "Command line helpers"}, headers=headers)
+    ensure_vector_index()
+    assert post.id in vector_index.rows
+
+    assert client.delete(f"/api/post/{post.id}", headers=headers).status_code == 200
+    assert db.session.get(PostEmbedding, post.id) is None
+    assert post.id not in vector_index.rows
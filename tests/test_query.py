@@ -0,0 +1,24 @@
+from api.query import QueryNormalizer
+
+
+def key(text):
+    return QueryNormalizer().normalize(text).key
+
+
+def test_word_order_case_and_plurals_share_a_key():
+    assert key("Python CLI tools") == key("cli tools python ") == key("python cli tool")
+
+
+def test_short_and_alphanumeric_terms_are_part_of_the_key():
+    assert key("go api") != key("api")
+    assert key("c++ kanban") != key("kanban")
+    assert key("c# kanban") != key("c++ kanban")
+    assert key("3d games") != key("games")
+
+
+def test_stop_words_are_ignored():
+    assert key("tools for the cli") == key("cli tools")
+
+
+def test_symbols_are_not_stemmed():
+    assert QueryNormalizer().terms("node.js apps") == ("app", "node.js")
@@ -0,0 +1,69 @@
+from api import querylog
+from api.models import db, SearchQuery
+from api.querylog import SearchLog, log_search, percentiles
+from conftest import make_user, login
+
+
+def log(search_log, monkeypatch, count, **result):
+    monkeypatch.setattr(querylog, "search_log", search_log)
+    for i in range(count):
+        log_search(("kanban", "python")[i % 2], result=dict({"results": [{"post_id": 1}]}, **result), total_ms=i + 1)
+
+
+def test_rows_are_buffered_and_flushed_in_batches(app, monkeypatch):
+    search_log = SearchLog(batch_size=3, flush_interval=3600)
+    log(search_log, monkeypatch, 2)
+    assert not search_log.due()
+    assert SearchQuery.query.count() == 0
+
+    # la tercera fila llena el lote y log_search lo vacía (hay contexto de app)
+    log(search_log, monkeypatch, 1)
+    assert SearchQuery.query.count() == 3
+    assert search_log.stats() == {"buffered": 0, "flushed": 3, "dropped": 0, "flush_errors": 0}
+
+
+def test_failed_flush_keeps_the_rows(app):
+    search_log = SearchLog(batch_size=100)
+    for i in range(2):
+        search_log.append({"normalized": "q", "user_request": "q", "mode": "ai",
+                           "created_at": querylog.datetime.now(querylog.UTC)})
+    SearchQuery.__table__.drop(db.engine)
+
+    assert search_log.flush() == 0
+    assert search_log.stats()["buffered"] == 2 and search_log.stats()["flush_errors"] == 1
+
+    SearchQuery.__table__.create(db.engine)
+    assert search_log.flush() == 2
+    assert SearchQuery.query.count() == 2
+
+
+def test_buffer_drops_the_oldest_rows(app):
+    search_log = SearchLog(max_buffer=3)
+    for i in range(5):
+        search_log.append({"user_request": str(i)})
+    assert [row["user_request"] for row in search_log.buffer] == ["2", "3", "4"]
+    assert search_log.stats()["dropped"] == 2
+
+
+def test_percentiles(app, monkeypatch):
+    log(SearchLog(batch_size=1000), monkeypatch, 100)
+    querylog.search_log.flush()
+    assert percentiles(SearchQuery.total_ms, days=1) == {"p50": 51, "p95": 96}
+
+
+def test_search_log_report(app, client, monkeypatch):
+    admin = make_user(1, is_admin=True)
+    log(querylog.search_log, monkeypatch, 4, dev_debug={"total_tokens": 10, "initial_filtered_count": 3})
+    log_search("Kanban", result={"results": []}, cache_hit=True, total_ms=1)
+
+    report = client.get("/api/admin/search-log?days=1&top=1", headers=login(client, admin)).json
+
+    assert report["searches"] == 5
+    assert report["cache_hit_rate"] == 0.2
+    assert report["no_results_rate"] == 0.2
+    assert report["tokens"] == 40
+    assert report["latency_ms"]["total"] == {"p50": 2, "p95": 4}
+    assert report["top_queries"] == [{"query": "kanban", "searches": 3, "avg_total_ms": 1.7,
+                                      "avg_candidates": 3.0, "avg_results": 0.7}]
+    assert report["no_result_queries"] == [{"query": "kanban", "searches": 1}]
+    assert report["buffer"]["buffered"] == 0
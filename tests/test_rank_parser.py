@@ -0,0 +1,34 @@
+from api.routes import CompactRankParser
+
+
+def parse(chunks, candidate_ids=None):
+    parser = CompactRankParser(candidate_ids)
+    results = [result for chunk in chunks for result in parser.feed(chunk)]
+    return results + parser.finish()
+
+
+def test_lines_split_across_chunks():
+    results = parse(["12,9", "2,alta,Kanban en Python\n7,", "55,media\n"])
+
+    assert [(r["rank_position"], r["post_id"], r["fit_score"], r["relevance"]) for r in results] == \
+        [(1, 12, 92, "alta"), (2, 7, 55, "media")]
+    assert results[0]["justification"] == "Kanban en Python"
+
+
+def test_truncated_last_line_is_dropped():
+    # max_tokens cortó la puntuación: "3,8" podría ser 80 o 85
+    assert [r["post_id"] for r in parse(["1,90,alta\n3,8"])] == [1]
+
+
+def test_complete_last_line_without_newline_is_kept():
+    assert [r["post_id"] for r in parse(["1,90,alta\n3,80,media"])] == [1, 3]
+
+
+def test_ignores_noise_duplicates_and_unknown_ids():
+    results = parse(["Aquí tienes:\n- 1,90,alta\n2) 4;70;media\n1,60,baja\n9,50,baja\n"],
+                    candidate_ids=[1, 4])
+    assert [(r["rank_position"], r["post_id"]) for r in results] == [(1, 1), (2, 4)]
+
+
+def test_scores_are_capped_at_100():
+    assert parse(["5,250,alta\n"])[0]["fit_score"] == 100
@@ -0,0 +1,20 @@
+from api import search
+from conftest import make_user, make_post, login
+
+
+def test_async_smart_search_with_database_backend(app, client, monkeypatch):
+    # el trabajo corre en un hilo del pool: necesita su propio contexto de
+    # aplicación para usar db.engine y db.session
+    monkeypatch.setattr(search, "SEARCH_BACKEND", "database")
+    user = make_user(1)
+    make_post(user, "CLI tools", "Handy command line tools")
+    make_post(user, "Kanban board", "A board for tasks")
+    headers = login(client, user)
+
+    response = client.post("/api/smart-search?async=1",
+                           json={"user_request": "command line tools", "mode": "local"}, headers=headers)
+    assert response.status_code == 202
+
+    job = client.get(f"/api/smart-search/jobs/{response.json['job_id']}?wait=10", headers=headers).json
+    assert job["status"] == "done", job.get("error")
+    assert [result["post_id"] for result in job["result"]["results"]] == [1]
@@ -0,0 +1,62 @@
+from types import SimpleNamespace
+
+from api.models import Stack, Level
+from api.routes import filter_posts_by_keywords
+from api.search import SearchIndex, RANKERS
+from api.vectors import compute_embeddings
+from conftest import make_user, make_post, login
+
+
+def build_index(*posts):
+    index = SearchIndex()
+    index.build([SimpleNamespace(id=i, title=title, description=description,
+                                 stack=Stack.PYTHON, level=Level.STUDENT)
+                 for i, (title, description) in enumerate(posts, start=1)])
+    return index
+
+
+def ranked_ids(user_request, index, ranker):
+    return [post["id"] for post in filter_posts_by_keywords(user_request, index, RANKERS[ranker])]
+
+
+def test_short_stems_do_not_match_unrelated_words(app):
+    index = build_index(("Structure editor", "Edit data structures"), ("String utils", "Helpers for text"))
+    assert ranked_ids("string", index, "bm25") == [2]
+    assert ranked_ids("spring boot", build_index(("Sprite packer", "Game art"),
+                                                 ("Spring starter", "Boot template")), "bm25") == [2]
+
+
+def test_plural_query_keeps_exact_description_match(app):
+    index = build_index(("Handy helpers", "Command line tools"), ("Kanban board", "Tasks"))
+    assert ranked_ids("tools", index, "keyword") == [1]
+    assert ranked_ids("tools", index, "bm25") == [1]
+
+
+def test_ing_query_ranks_exact_word_first(app):
+    index = build_index(("Test runner", "Runs a test"), ("Testing helpers", "Fixtures for testing"))
+    assert ranked_ids("testing", index, "bm25")[0] == 2
+    assert ranked_ids("testing", index, "keyword")[0] == 2
+
+
+def test_prefix_expansion_still_matches_longer_words(app):
+    index = build_index(("Deploy bot", "Deployment scripts"), ("Kanban board", "Tasks"))
+    assert ranked_ids("deploy", index, "bm25") == [1]
+
+
+def test_local_mode_matches_plural_query(app, client):
+    user = make_user(1)
+    make_post(user, "CLI tools", "Command line tools for developers")
+    make_post(user, "Kanban board", "A board for tasks")
+    compute_embeddings()
+
+    response = client.post("/api/smart-search", json={"user_request": "tools", "mode": "local"},
+                           headers=login(client, user))
+    assert [result["post_id"] for result in response.json["results"]] == [1]
+
+
+def test_partial_match_is_prefix_only(app):
+    # "script" casa con "scripts" pero ya no con "javascript" (subcadena)
+    index = build_index(("Javascript games", "Browser games"), ("Backup scripts", "Cron jobs"))
+    assert index.expand("script") == ["scripts"]
+    assert index.candidates({"script"}) == {2: 2}
+    assert ranked_ids("script", index, "keyword") == [2]
@@ -0,0 +1,76 @@
+from api import routes, search
+from api.cache import search_cache
+from api.deepseek import deepseek_client
+from api.search import search_index
+from conftest import make_user, make_post, login
+
+
+def no_deepseek(*args, **kwargs):
+    raise AssertionError("DeepSeek should not be called")
+
+
+def test_prompt_without_room_for_candidates_skips_deepseek(app, client, monkeypatch):
+    user = make_user(1)
+    make_post(user, "CLI tools", "Command line tools")
+    fit_candidates = routes.fit_candidates
+    monkeypatch.setattr(routes, "fit_candidates",
+                        lambda *args, **kwargs: fit_candidates(*args, **dict(kwargs, budget=10)))
+    monkeypatch.setattr(deepseek_client, "chat", no_deepseek)
+
+    response = client.post("/api/smart-search", json={"user_request": "cli tools"},
+                           headers=login(client, user))
+
+    assert response.status_code == 200
+    assert [result["post_id"] for result in response.json["results"]] == [1]
+    assert response.json["dev_debug"]["status"] == routes.PROMPT_FULL_STATUS
+    assert response.json["dev_debug"]["candidates_in_prompt"] == 0
+
+
+def test_user_request_length_is_capped(app, client, monkeypatch):
+    user = make_user(1)
+    monkeypatch.setattr(deepseek_client, "chat", no_deepseek)
+    headers = login(client, user)
+    user_request = "tools " * (routes.SEARCH_MAX_REQUEST_LENGTH // 6 + 1)
+
+    for path in ("/api/smart-search", "/api/smart-search/stream"):
+        assert client.post(path, json={"user_request": user_request}, headers=headers).status_code == 400
+
+
+def test_typo_corrections_run_once_per_search(app, client, monkeypatch):
+    user = make_user(1)
+    make_post(user, "Python tools", "Command line tools")
+    headers = login(client, user)
+    calls = []
+    corrections = search_index.corrections
+    monkeypatch.setattr(search_index, "corrections", lambda keywords: calls.append(keywords) or corrections(keywords))
+
+    response = client.post("/api/smart-search", json={"user_request": "pyhton tools", "mode": "local"},
+                           headers=headers).json
+    assert len(calls) == 1
+    assert response["did_you_mean"] == "python tools"
+    assert [result["post_id"] for result in response["results"]] == [1]
+    assert response["facets"]["stack"] == {"Python": 1}
+
+    calls.clear()
+    monkeypatch.setattr(deepseek_client, "stream_chat", lambda payload, usage_out=None: iter(["1,90,alta\n"]))
+    with client.post("/api/smart-search/stream", json={"user_request": "pyhton cli"}, headers=headers) as stream:
+        stream.get_data()
+    assert len(calls) == 1
+
+
+def test_database_backend_reports_no_typo_correction(app, client, monkeypatch):
+    user = make_user(1)
+    make_post(user, "Python tools", "Command line tools")
+    headers = login(client, user)
+    body = {"user_request": "pyhton tools", "mode": "local"}
+
+    dev_debug = client.post("/api/smart-search", json=body, headers=headers).json["dev_debug"]
+    assert (dev_debug["prefilter_backend"], dev_debug["typo_correction"]) == ("memory", True)
+
+    monkeypatch.setattr(search, "SEARCH_BACKEND", "database")
+    search_cache.local.clear()
+    response = client.post("/api/smart-search", json=body, headers=headers).json
+    assert response["did_you_mean"] is None
+    assert (response["dev_debug"]["prefilter_backend"], response["dev_debug"]["typo_correction"]) == \
+        ("database", False)
+    assert [result["post_id"] for result in response["results"]] == [1]
@@ -0,0 +1,93 @@
+import json
+import threading
+import time
+
+from api.cache import search_flights
+from api.deepseek import deepseek_client
+from conftest import make_user, make_post, login
+from test_deepseek import FakeStreamResponse
+
+
+def sse_events(body):
+    events = []
+    for block in body.decode().strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_stream_dev_debug_reports_real_usage(app, client, monkeypatch):
+    user = make_user(1)
+    make_post(user, "CLI tools", "Command line tools")
+    usage = {"prompt_tokens": 321, "completion_tokens": 12, "total_tokens": 333}
+    monkeypatch.setattr(deepseek_client, "_post",
+                        lambda payload, **kwargs: FakeStreamResponse(["1,90,High\n"], usage=usage))
+
+    response = client.post("/api/smart-search/stream", json={"user_request": "cli tools"},
+                           headers=login(client, user))
+    events = sse_events(response.data)
+
+    assert [event for event, _ in events] == ["candidates", "result", "done"]
+    dev_debug = events[-1][1]["dev_debug"]
+    assert dev_debug["token_source"] == "usage"
+    assert (dev_debug["input_tokens"], dev_debug["output_tokens"]) == (321, 12)
+
+
+def test_cached_stream_emits_the_same_events(app, client, monkeypatch):
+    user = make_user(1)
+    make_post(user, "CLI tools", "Command line tools")
+    monkeypatch.setattr(deepseek_client, "stream_chat", lambda payload, usage_out=None: iter(["1,90,alta\n"]))
+    headers = login(client, user)
+
+    first = sse_events(client.post("/api/smart-search/stream", json={"user_request": "cli tools"},
+                                   headers=headers).data)
+    monkeypatch.setattr(deepseek_client, "stream_chat", None)  # el segundo sale de la caché
+    second = sse_events(client.post("/api/smart-search/stream", json={"user_request": "cli tools"},
+                                    headers=headers).data)
+
+    assert [event for event, _ in first] == [event for event, _ in second] == ["candidates", "result", "done"]
+    assert first[0] == second[0]
+    assert first[1] == second[1]
+    assert second[-1][1]["cached"] is True
+
+
+def test_concurrent_identical_streams_share_one_deepseek_call(app, client, monkeypatch):
+    user = make_user(1)
+    make_post(user, "CLI tools", "Command line tools")
+    headers = login(client, user)
+    entered = []
+    begin = search_flights.begin
+
+    def counting_begin(key):
+        entered.append(key)
+        return begin(key)
+
+    calls = []
+
+    def slow_stream(payload, usage_out=None):
+        calls.append(payload)
+        # el líder no responde hasta que el otro stream espera su resultado
+        deadline = time.monotonic() + 5
+        while len(entered) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.05)
+        yield "1,90,alta\n"
+
+    monkeypatch.setattr(search_flights, "begin", counting_begin)
+    monkeypatch.setattr(deepseek_client, "stream_chat", slow_stream)
+    bodies = []
+
+    def stream():
+        response = app.test_client().post("/api/smart-search/stream", json={"user_request": "cli tools"},
+                                          headers=headers)
+        bodies.append(sse_events(response.data))
+
+    threads = [threading.Thread(target=stream) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert [[event for event, _ in body] for body in bodies] == [["candidates", "result", "done"]] * 2
+    assert bodies[0][1] == bodies[1][1]
@@ -0,0 +1,57 @@
+from api.suggest import SuggestIndex
+from conftest import make_user, make_post, login
+
+
+def texts(index, prefix, limit=8):
+    return [suggestion["text"] for suggestion in index.suggest(prefix, limit)]
+
+
+def build(*rows):
+    index = SuggestIndex(min_query_count=2)
+    index.build(rows)
+    return index
+
+
+def test_suggestions_rank_by_weight():
+    index = build((1, "Kanban board", 1), (2, "Kanban CLI", 5), (3, "Karaoke app", 2))
+    assert texts(index, "ka") == ["Kanban CLI", "Karaoke app", "Kanban board"]
+    assert texts(index, "KANBAN  b") == ["Kanban board"]
+
+
+def test_prefix_matches_mid_title_words_and_stacks():
+    index = build((1, "Python kanban board", 1))
+    assert texts(index, "board") == ["Python kanban board"]
+    # el stack pesa más que cualquier título
+    assert index.suggest("pyth") == [{"text": "Python", "type": "stack"},
+                                     {"text": "Python kanban board", "type": "title"}]
+
+
+def test_repeated_titles_add_up_and_edits_replace_them():
+    index = build((1, "Todo app", 1), (2, "Todo app", 1), (3, "Todo list", 3))
+    assert texts(index, "todo") == ["Todo list", "Todo app"]
+
+    index.set_post(3, "Shopping list", 3)
+    assert texts(index, "todo") == ["Todo app"]
+    index.remove_post(1)
+    index.remove_post(2)
+    assert texts(index, "todo") == []
+
+
+def test_frequent_queries_are_suggested():
+    index = build()
+    index.record_query("react hook", "React hooks")
+    assert texts(index, "react") == []
+    index.record_query("react hook", "react hooks ")
+    assert index.suggest("react") == [{"text": "react hooks", "type": "query"}]
+
+
+def test_suggest_endpoint(app, client):
+    user = make_user(1)
+    make_post(user, "Kanban board", "Tasks")
+    make_post(user, "Karaoke app", "Songs")
+    headers = login(client, user)
+
+    response = client.get("/api/search/suggest?q=kan&limit=5", headers=headers)
+    assert response.status_code == 200
+    assert response.json == {"query": "kan", "suggestions": [{"text": "Kanban board", "type": "title"}]}
+    assert client.get("/api/search/suggest?q=", headers=headers).json["suggestions"] == []